@@ -1,7 +1,11 @@
 """
 __main__.py: Runs calendar\grid within blt or curses.
+
+    --benchmark => times rendering a year view after each key press
 """
 
+import time
+
 import click
 from grid import CalendarGrid, MonthGrid, DateNode, Options, YearMonthDay
 
@@ -9,8 +13,11 @@ from grid import CalendarGrid, MonthGrid, DateNode, Options, YearMonthDay
 @click.option("--debug", "debug", default=False)
 @click.option("--options", "options", default=0x3)
 @click.option("--screen", "screen", default=None)
-def main(debug, options, screen):
-    if not screen:
+@click.option("--benchmark", "benchmark", is_flag=True, default=False)
+def main(debug, options, screen, benchmark):
+    if benchmark:
+        render_benchmark(options)
+    elif not screen:
         termprint(options, debug)
     elif screen == "curses" or screen == "c":
         main_curses(options, debug)
@@ -29,6 +36,29 @@ def termprint(options, debug=False):
     print(mstring)
 
 
+def render_benchmark(options, keys=1000):
+    """Times the 12 month blt view with and without the render cache"""
+    options |= Options.SingleMonth
+    year = CalendarGrid(2018)
+    for month in year.months[2018]:
+        month.add_events(month.last_day - 2, month.last_day, "Month end")
+    moves = ("select_next_day", "select_next_week",
+             "select_prev_day", "select_prev_week")
+
+    def run(cached):
+        start = time.perf_counter()
+        for key in range(keys):
+            getattr(year.month, moves[key % 4])()
+            if not cached:
+                for month in year.months[2018]:
+                    month.render_cache = None
+            year.term(options=options, blt=True)
+        return (time.perf_counter() - start) / keys * 1e6
+
+    print(f"uncached: {run(False):8.1f}us per key")
+    print(f"cached:   {run(True):8.1f}us per key")
+
+
 def main_curses(options, debug):
     def wrapped(t):
         # q and ESC
@@ -107,7 +137,7 @@ def main_blt(options, debug):
         if char in escape_codes:
             break
         if char == terminal.TK_A:
-            year.month.add_event(m.selected, 'New Event')
+            year.month.add_event(year.month.selected, 'New Event')
         if char == terminal.TK_DOWN:
             year.month.select_next_week() 
         if char == terminal.TK_UP:
@@ -0,0 +1,154 @@
+# agenda.py
+
+"""
+Agenda of upcoming items merged from any number of date ordered sources:
+
+    event_source   => events of an EventIndex from a date on
+    rule_source    => occurrences of recurrence rules, expanded as needed
+    dated_source   => objects with a date such as tasks, heap ordered
+    receipt_source => receipts of the database read a page at a time
+
+Each source is a generator of AgendaItems in date order and heapq.merge
+pulls one item at a time from whichever source is next, so asking for the
+next page of the agenda only reads as far into each source as that page
+needs. Nothing is collected per day.
+
+    --days => days from today to list
+"""
+
+import bisect
+import datetime
+import heapq
+import itertools
+from collections import namedtuple
+
+import click
+
+from events import EventIndex, to_date
+
+AgendaItem = namedtuple("AgendaItem", "date kind name data")
+
+
+def event_source(index, start):
+    """Yields the events of an index that are on or after start. Events
+    already under way on start are listed on start.
+    """
+    start = to_date(start)
+    index.build()
+    for event in index.indexed(start, start):
+        if event.begin < start:
+            yield AgendaItem(start, "event", event.name, event)
+    for i in range(bisect.bisect_left(index.begins, start), len(index.events)):
+        event = index.events[i]
+        yield AgendaItem(event.begin, "event", event.name, event)
+
+
+def rule_source(rules, start):
+    """Yields the occurrences of every rule from start on"""
+    start = to_date(start)
+    occurrences = (rule.occurrences(start, datetime.date.max)
+                      for rule in rules)
+    for event in heapq.merge(*occurrences, key=lambda e: e.begin):
+        yield AgendaItem(max(event.begin, start), "recurring", event.name,
+                         event)
+
+
+def dated_source(items, start, kind, date, name):
+    """Yields items on or after start ordered by date(item). The items are
+    heapified once and popped as the agenda reaches them.
+    """
+    start = to_date(start)
+    heap = [(to_date(date(item)), n, item) for n, item in enumerate(items)]
+    heap = [entry for entry in heap if entry[0] >= start]
+    heapq.heapify(heap)
+    while heap:
+        day, _, item = heapq.heappop(heap)
+        yield AgendaItem(day, kind, name(item), item)
+
+
+def task_source(tasks, start):
+    """Tasks are listed on their due date, or when they were created"""
+    return dated_source(tasks, start, "task",
+                        lambda t: getattr(t, "due", None) or t.created,
+                        lambda t: t.title)
+
+
+def receipt_source(database, start, page_size=64):
+    """Yields receipts from start on using keyset pages of the receipts
+    date index
+    """
+    after = (to_date(start).isoformat(), "")
+    while True:
+        rows = database.select_receipt_page("date", limit=page_size,
+                                            after=after)
+        for row in rows:
+            filename, store, _, date = row[:4]
+            yield AgendaItem(datetime.date.fromisoformat(date), "receipt",
+                             store, row)
+        if len(rows) < page_size:
+            return
+        after = (rows[-1][3], rows[-1][0])
+
+
+class Agenda:
+    """Pages forward through the merged sources"""
+    def __init__(self, *sources):
+        self.items = heapq.merge(*sources, key=lambda item: item.date)
+        # item read past the end of the last page by until
+        self.peeked = None
+        self.pages = []
+
+    def next_page(self, size=20) -> list:
+        page = []
+        if self.peeked is not None and size > 0:
+            page.append(self.peeked)
+            self.peeked = None
+        page.extend(itertools.islice(self.items, size - len(page)))
+        if page:
+            self.pages.append(page)
+        return page
+
+    def until(self, date) -> list:
+        """Returns the next items up to and including date"""
+        date = to_date(date)
+        page = []
+        items = self.items
+        if self.peeked is not None:
+            items = itertools.chain((self.peeked,), self.items)
+            self.peeked = None
+        for item in items:
+            if item.date > date:
+                self.peeked = item
+                break
+            page.append(item)
+        if page:
+            self.pages.append(page)
+        return page
+
+
+def calendar_agenda(index, start, tasks=(), database=None) -> Agenda:
+    """Returns the agenda of an EventIndex with its rules, tasks and the
+    receipts of a database
+    """
+    sources = [event_source(index, start),
+               rule_source(index.recurring, start)]
+    if tasks:
+        sources.append(task_source(tasks, start))
+    if database is not None:
+        sources.append(receipt_source(database, start))
+    return Agenda(*sources)
+
+
+@click.command()
+@click.option("--days", "days", default=30)
+@click.option("--events", "events", default="data/events.yaml")
+def main(days, events):
+    index = EventIndex()
+    index.load_yaml(events)
+    today = datetime.date.today()
+    agenda = calendar_agenda(index, today)
+    for item in agenda.until(today + datetime.timedelta(days=days)):
+        print(f"{item.date} {item.kind:9} {item.name}")
+
+if __name__ == "__main__":
+    main()
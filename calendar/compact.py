@@ -0,0 +1,280 @@
+# compact.py
+
+"""
+Stores a continuous calendar as flat arrays instead of a graph of node
+objects. Every day between the first sunday on or before the begin date and
+the last saturday on or after the end date is one slot:
+
+    ordinal    => int32 proleptic gregorian ordinal of the day
+    day        => int8 day of the month
+    month      => int8 month
+    year       => int16 year
+    weekday    => int8 column of the day, sunday being 0
+    selectable => bool day is between the begin and end date
+    paths      => uint8 navigable directions, n=1 s=2 e=4 w=8 like DateNode
+    events     => int32 offsets into a flat event list, one more than days
+
+Added events wait in a pending list and are merged into the flat list the
+next time events are read, so many small adds cost a single rebuild.
+
+The slot of a date is its ordinal minus the first ordinal and the week is
+the slot // 7, so nothing is searched. The neighbours of a slot are slot -7,
++7, +1 and -1 when their path bit is set. DayView and week views wrap a slot
+index for rendering so node objects only exist for what is on screen.
+
+    --years => years the benchmark calendars span
+"""
+
+import calendar
+import datetime
+import time
+import tracemalloc
+
+import click
+import numpy as np
+
+NORTH, SOUTH, EAST, WEST = 1, 2, 4, 8
+PATHS = {"n": (NORTH, -7), "s": (SOUTH, 7), "e": (EAST, 1), "w": (WEST, -1)}
+
+# numpy datetimes count days from 1970-01-01
+EPOCH = datetime.date(1970, 1, 1).toordinal()
+
+
+def ordinal(date) -> int:
+    """Returns the ordinal of a date or a (year, month, day) tuple"""
+    if hasattr(date, 'toordinal'):
+        return date.toordinal()
+    if hasattr(date, 'year'):
+        return datetime.date(date.year, date.month, date.day).toordinal()
+    return datetime.date(*tuple(date)[:3]).toordinal()
+
+
+class DayView:
+    """A single day of a CompactCalendar. Reads through to the arrays"""
+    __slots__ = ("calendar", "index")
+
+    def __init__(self, calendar, index):
+        self.calendar = calendar
+        self.index = index
+
+    year = property(lambda self: int(self.calendar.year[self.index]))
+    month = property(lambda self: int(self.calendar.month[self.index]))
+    day = property(lambda self: int(self.calendar.day[self.index]))
+    weekday = property(lambda self: int(self.calendar.weekday[self.index]))
+    paths = property(lambda self: int(self.calendar.paths[self.index]))
+    selectable = property(
+        lambda self: bool(self.calendar.selectable[self.index]))
+
+    @property
+    def date(self):
+        return datetime.date.fromordinal(
+            int(self.calendar.ordinal[self.index]))
+
+    @property
+    def events(self):
+        return self.calendar.events_at(self.index)
+
+    def neighbour(self, path):
+        """Returns the view of the day in the n, s, e or w direction"""
+        index = self.calendar.step(self.index, path)
+        return None if index is None else DayView(self.calendar, index)
+
+    def __eq__(self, other):
+        if isinstance(other, DayView):
+            return (self.calendar, self.index) == (other.calendar, other.index)
+        return (self.year, self.month, self.day) == tuple(other)[:3]
+
+    def __str__(self):
+        return f"{self.day:2}"
+
+    def __repr__(self):
+        return f"DayView({self.year}, {self.month}, {self.day})"
+
+    def blt(self, selected, month):
+        if self.selectable:
+            if selected:
+                return f"[bkcolor=white][color=black] {self} [/color][/bkcolor]"
+            if self.month == month:
+                return f"[color=white] {self} [/color]"
+        return f"[color=grey] {self} [/color]"
+
+
+class CompactCalendar:
+    """Array backed continuous calendar from begdate to enddate"""
+    def __init__(self, begdate, enddate, start=None):
+        self.begdate = begdate
+        self.enddate = enddate
+
+        first, last = ordinal(begdate), ordinal(enddate)
+        if last < first:
+            raise ValueError("End date is before the begin date")
+        # weeks start on sunday like calendar.Calendar(firstweekday=6).
+        # date.weekday() of an ordinal is (ordinal + 6) % 7 with monday 0
+        self.first = first - (first % 7)
+        self.last = last + (6 - last % 7)
+
+        self.ordinal = np.arange(self.first, self.last + 1, dtype=np.int32)
+        self.weekday = (self.ordinal % 7).astype(np.int8)
+        self.build_dates()
+        self.selectable = (self.ordinal >= first) & (self.ordinal <= last)
+        self.build_paths()
+
+        self.event_offsets = np.zeros(len(self) + 1, dtype=np.int32)
+        self.event_list = []
+        # (slot, event) pairs added since the event list was last built
+        self.pending = []
+        self.selected = self.slot(start if start else begdate)
+
+    def __len__(self) -> int:
+        return len(self.ordinal)
+
+    def __getitem__(self, index) -> DayView:
+        if not -len(self) <= index < len(self):
+            raise IndexError(index)
+        return DayView(self, index % len(self))
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the arrays, not counting event payloads"""
+        return sum(a.nbytes for a in (self.ordinal, self.day, self.month,
+                                      self.year, self.weekday,
+                                      self.selectable, self.paths,
+                                      self.event_offsets))
+
+    @property
+    def weeks(self) -> int:
+        return len(self) // 7
+
+    def build_dates(self) -> None:
+        """Splits the ordinals into year, month and day arrays"""
+        days = (self.ordinal - EPOCH).astype('datetime64[D]')
+        months = days.astype('datetime64[M]')
+        years = days.astype('datetime64[Y]')
+        self.day = ((days - months).astype(np.int32) + 1).astype(np.int8)
+        self.month = ((months - years).astype(np.int32) + 1).astype(np.int8)
+        self.year = (years.astype(np.int32) + 1970).astype(np.int16)
+
+    def build_paths(self) -> None:
+        """Sets a direction bit wherever the neighbour is selectable. Only
+        selectable days get paths.
+        """
+        selectable = self.selectable
+        paths = np.zeros(len(self), dtype=np.uint8)
+        paths[7:][selectable[:-7]] |= NORTH
+        paths[:-7][selectable[7:]] |= SOUTH
+        paths[:-1][selectable[1:] & (self.weekday[:-1] < 6)] |= EAST
+        paths[1:][selectable[:-1] & (self.weekday[1:] > 0)] |= WEST
+        paths[~selectable] = 0
+        self.paths = paths
+
+    def slot(self, date) -> int:
+        """Returns the array index of a date"""
+        index = ordinal(date) - self.first
+        if not 0 <= index < len(self):
+            raise ValueError(f"{date} is outside of the calendar")
+        return index
+
+    def step(self, index, path):
+        """Returns the index reached going in a direction or None"""
+        bit, offset = PATHS[path]
+        if self.paths[index] & bit:
+            return index + offset
+        return None
+
+    def week(self, j) -> list:
+        return [DayView(self, i) for i in range(j * 7, j * 7 + 7)]
+
+    def month_weeks(self, year, month) -> range:
+        """Returns the week numbers holding any day of the month"""
+        begin = self.slot((year, month, 1)) // 7
+        end = self.slot((year, month,
+                         calendar.monthrange(year, month)[1])) // 7
+        return range(begin, end + 1)
+
+    def add_events(self, events) -> int:
+        """Queues (date, event) pairs to be attached on the next read.
+        Returns the number attached.
+        """
+        count = len(self.pending)
+        for date, event in events:
+            index = ordinal(date) - self.first
+            if 0 <= index < len(self) and self.selectable[index]:
+                self.pending.append((index, event))
+        return len(self.pending) - count
+
+    def merge_events(self) -> None:
+        """Rebuilds the flat event list with the pending events using a
+        stable sort so every day keeps its events in the order they were
+        added
+        """
+        if not self.pending:
+            return
+        slots, added = zip(*self.pending)
+        self.pending = []
+
+        counts = np.diff(self.event_offsets)
+        current = np.repeat(np.arange(len(self), dtype=np.int32), counts)
+        slots = np.concatenate((current, np.array(slots, dtype=np.int32)))
+        payload = self.event_list + list(added)
+        order = np.argsort(slots, kind='stable')
+        self.event_list = [payload[i] for i in order]
+        self.event_offsets[1:] = np.cumsum(
+            np.bincount(slots, minlength=len(self)))
+
+    def events_at(self, index) -> list:
+        self.merge_events()
+        begin, end = self.event_offsets[index], self.event_offsets[index + 1]
+        return self.event_list[begin:end]
+
+    def select(self, path) -> None:
+        index = self.step(self.selected, path)
+        if index is not None:
+            self.selected = index
+
+    def format_print(self, options=0x0, blt=False) -> str:
+        """Returns the weeks of the selected month as text"""
+        current = self[self.selected]
+        weeks = (self.week(j) for j in
+                    self.month_weeks(current.year, current.month))
+        if not blt:
+            return "\n".join(" ".join(str(day) for day in week)
+                                for week in weeks)
+        return "\n".join("".join(day.blt(day.index == current.index,
+                                         current.month) for day in week)
+                            for week in weeks)
+
+
+def measure(build):
+    """Returns the seconds and peak bytes allocated building an object"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    built = build()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return built, elapsed, peak
+
+
+@click.command()
+@click.option("--years", "years", default=50,
+              help="years the benchmark calendars span")
+def main(years):
+    from grid import ScrollableCalendar
+
+    begdate = datetime.date(2000, 1, 1)
+    enddate = datetime.date(2000 + years - 1, 12, 31)
+    # the scrollable calendar builds weeks lazily so every week is built
+    def build_graph():
+        graph = ScrollableCalendar(begdate, enddate).graph
+        return [graph.build_week(j) for j in range(len(graph))]
+
+    _, graph_time, graph_peak = measure(build_graph)
+    compact, compact_time, compact_peak = measure(
+        lambda: CompactCalendar(begdate, enddate))
+    print(f"{years} years, {len(compact)} days")
+    print(f"  graph:   {graph_time:8.3f}s {graph_peak / 2**20:8.2f}MB")
+    print(f"  compact: {compact_time:8.3f}s {compact_peak / 2**20:8.2f}MB "
+          f"peak, {compact.nbytes / 2**20:.2f}MB kept")
+
+if __name__ == "__main__":
+    main()
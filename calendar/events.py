@@ -0,0 +1,342 @@
+# events.py
+
+"""
+Stores calendar events once as date intervals instead of copying them into
+every day they cover.
+
+EventIndex keeps the events sorted by their first day with a max tree over
+their last days. An overlap query bisects the events starting on or before
+the end of the span and walks down only the subtrees holding an event that
+ends on or after its beginning, so a query costs O(log n + matches) however
+long the events are. Events added since the last query are merged in with
+one sort on the next query.
+
+Event files are read one entry at a time. A file holds either a mapping of
+names to events or a list of events with a name:
+
+    christmas:
+        month: 12
+        day: 25
+        dayoff: True
+
+An event is given by year, month and day or an iso date, with an optional
+end date or number of days. Entries with a repeat key are recurrence rules,
+see recurrence.py. Entries without a year happen every year. They are placed
+in the year they are loaded for, or become yearly rules when no year is
+given. Every other key is kept as the event's data.
+"""
+
+import bisect
+import datetime
+import heapq
+import json
+from collections import namedtuple
+
+import yaml
+
+Event = namedtuple("Event", "name begin end data")
+
+DATE_KEYS = ("date", "begin", "end", "year", "month", "day", "days")
+NUMBER_CHARACTERS = "0123456789.eE+-"
+
+
+def to_date(date) -> datetime.date:
+    """Returns a date from a date, a (year, month, day) tuple or iso string"""
+    if isinstance(date, datetime.datetime):
+        return date.date()
+    if isinstance(date, datetime.date):
+        return date
+    if isinstance(date, str):
+        return datetime.date.fromisoformat(date)
+    if hasattr(date, 'year'):
+        return datetime.date(date.year, date.month, date.day)
+    return datetime.date(*tuple(date)[:3])
+
+
+def make_event(name, fields, year=None) -> Event:
+    """Returns the event described by a record from an event file"""
+    fields = dict(fields or {})
+    if "date" in fields or "begin" in fields:
+        begin = to_date(fields.get("date") or fields.get("begin"))
+    else:
+        begin = datetime.date(fields.get("year") or year,
+                              fields.get("month", 1), fields.get("day", 1))
+    if "end" in fields:
+        end = to_date(fields["end"])
+    else:
+        end = begin + datetime.timedelta(days=fields.get("days", 1) - 1)
+    if end < begin:
+        raise ValueError(f"{name} ends before it begins")
+    data = {k: v for k, v in fields.items() if k not in DATE_KEYS}
+    return Event(fields.get("name", name), begin, end, data or None)
+
+
+def event_record(event) -> dict:
+    """Returns the file record of an event"""
+    record = {"name": event.name, "date": event.begin.isoformat()}
+    if event.end != event.begin:
+        record["end"] = event.end.isoformat()
+    record.update(event.data or {})
+    return record
+
+
+def iter_json_records(f, chunksize=1 << 16):
+    """Yields (name, record) pairs from a json object or list without
+    loading the whole file. List records are yielded with a None name.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, eof = "", 0, False
+
+    def fill():
+        nonlocal buffer, position, eof
+        chunk = f.read(chunksize)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+        return not eof
+
+    def skip():
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position < len(buffer) or not fill():
+                return buffer[position:position + 1]
+
+    def decode():
+        nonlocal position
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if not fill():
+                    raise
+                continue
+            # a number may continue in the next chunk
+            if not eof and (end == len(buffer) or
+                            buffer[end] in NUMBER_CHARACTERS) and fill():
+                continue
+            position = end
+            return value
+
+    opening = skip()
+    if opening not in ("{", "["):
+        raise ValueError("Event files hold a json object or list")
+    closing = "}" if opening == "{" else "]"
+    position += 1
+    while True:
+        token = skip()
+        if token == closing:
+            return
+        if not token:
+            raise ValueError("Unexpected end of the event file")
+        if opening == "[":
+            yield None, decode()
+            continue
+        name = decode()
+        if skip() != ":":
+            raise ValueError(f"Expected ':' after {name!r}")
+        position += 1
+        skip()
+        yield name, decode()
+
+
+def iter_yaml_records(f):
+    """Yields (name, record) pairs from a block yaml mapping or list. Each
+    top level entry is parsed on its own when the next one begins.
+    """
+    def parse(lines):
+        document = yaml.safe_load("".join(lines))
+        if isinstance(document, dict):
+            return document.items()
+        if isinstance(document, list):
+            return ((None, record) for record in document)
+        return ()
+
+    lines = []
+    for line in f:
+        top = line[:1] not in ("", " ", "\t", "\n", "\r", "#")
+        if line.startswith("---"):
+            yield from parse(lines)
+            lines = []
+            continue
+        if top and lines and any(l[:1] not in (" ", "\t", "\n", "#")
+                                 for l in lines):
+            yield from parse(lines)
+            lines = []
+        lines.append(line)
+    yield from parse(lines)
+
+
+class EventIndex:
+    """Sorted interval index over events"""
+    def __init__(self, events=()):
+        self.events = []
+        self.pending = []
+        self.begins = []
+        self.tree = []
+        self.version = 0
+        # recurrence imports the events of this module
+        from recurrence import RecurringEvents
+        self.recurring = RecurringEvents()
+        self.extend(events)
+
+    def __len__(self) -> int:
+        """Counts events and recurrence rules"""
+        return len(self.events) + len(self.pending) + len(self.recurring)
+
+    def __iter__(self):
+        self.build()
+        return iter(self.events)
+
+    def add(self, name, begin, end=None, data=None) -> Event:
+        begin = to_date(begin)
+        end = to_date(end) if end is not None else begin
+        if end < begin:
+            raise ValueError(f"{name} ends before it begins")
+        event = Event(name, begin, end, data)
+        self.pending.append(event)
+        self.version += 1
+        return event
+
+    def extend(self, events) -> int:
+        count = len(self.pending)
+        self.pending.extend(events)
+        if len(self.pending) > count:
+            self.version += 1
+        return len(self.pending) - count
+
+    def add_rule(self, rule):
+        self.recurring.add(rule)
+        self.version += 1
+        return rule
+
+    def remove_rule(self, rule) -> None:
+        self.recurring.remove(rule)
+        self.version += 1
+
+    def remove(self, event) -> None:
+        self.build()
+        self.events.remove(event)
+        self.pending, self.events, self.begins = self.events, [], []
+        self.version += 1
+
+    def build(self) -> None:
+        """Merges pending events and rebuilds the max tree of last days"""
+        if not self.pending:
+            return
+        self.events.extend(self.pending)
+        self.pending = []
+        self.events.sort(key=lambda e: (e.begin, e.end))
+        self.begins = [e.begin for e in self.events]
+
+        size = 1
+        while size < len(self.events):
+            size *= 2
+        self.size = size
+        tree = [datetime.date.min] * (2 * size)
+        tree[size:size + len(self.events)] = [e.end for e in self.events]
+        for node in range(size - 1, 0, -1):
+            tree[node] = max(tree[2 * node], tree[2 * node + 1])
+        self.tree = tree
+
+    def overlapping(self, begin, end=None) -> list:
+        """Returns the events and rule occurrences covering any day from
+        begin to end inclusive ordered by their first day
+        """
+        begin = to_date(begin)
+        end = to_date(end) if end is not None else begin
+        events = self.indexed(begin, end)
+        if not self.recurring.rules:
+            return events
+        return list(heapq.merge(events, 
+                                self.recurring.overlapping(begin, end),
+                                key=lambda e: e.begin))
+
+    def indexed(self, begin, end) -> list:
+        self.build()
+        count = bisect.bisect_right(self.begins, end)
+        if not count:
+            return []
+
+        found = []
+        stack = [(1, 0, self.size)]
+        while stack:
+            node, lo, hi = stack.pop()
+            if lo >= count or self.tree[node] < begin:
+                continue
+            if hi - lo == 1:
+                found.append(lo)
+                continue
+            middle = (lo + hi) // 2
+            stack.append((2 * node + 1, middle, hi))
+            stack.append((2 * node, lo, middle))
+        return [self.events[i] for i in found]
+
+    def day(self, date) -> list:
+        return self.overlapping(date)
+
+    def week(self, date) -> list:
+        """Returns the events in the sunday to saturday week of a date"""
+        date = to_date(date)
+        sunday = date - datetime.timedelta(days=(date.weekday() + 1) % 7)
+        return self.overlapping(sunday, sunday + datetime.timedelta(days=6))
+
+    def days(self, begin, end) -> dict:
+        """Returns date => events for the days from begin to end that have
+        any events
+        """
+        begin, end = to_date(begin), to_date(end)
+        days = {}
+        for event in self.overlapping(begin, end):
+            first, last = max(event.begin, begin), min(event.end, end)
+            for offset in range((last - first).days + 1):
+                day = first + datetime.timedelta(days=offset)
+                days.setdefault(day, []).append(event)
+        return days
+
+    def load(self, records, year=None) -> int:
+        """Adds events and rules from (name, record) pairs. Returns the
+        number added
+        """
+        from recurrence import make_rule
+        count = 0
+        for name, record in records:
+            dated = any(k in record for k in ("date", "begin", "year"))
+            if "repeat" in record:
+                self.recurring.add(make_rule(name, record, year))
+            elif not dated and year is None:
+                self.recurring.add(make_rule(
+                    name, dict(record, repeat="yearly")))
+            else:
+                self.pending.append(make_event(name, record, year))
+            count += 1
+        if count:
+            self.version += 1
+        return count
+
+    def load_json(self, filename, year=None) -> int:
+        with open(filename, 'r') as f:
+            return self.load(iter_json_records(f), year)
+
+    def load_yaml(self, filename, year=None) -> int:
+        with open(filename, 'r') as f:
+            return self.load(iter_yaml_records(f), year)
+
+    def records(self, begin=None, end=None):
+        """Returns the records of every event and rule, or of the events
+        and occurrences from begin to end
+        """
+        if begin is not None:
+            return [event_record(e) for e in self.overlapping(begin, end)]
+        return [event_record(e) for e in self] + \
+               [rule.record() for rule in self.recurring]
+
+    def export_json(self, filename, begin=None, end=None) -> None:
+        with open(filename, 'w') as f:
+            json.dump(self.records(begin, end), f, indent=4)
+
+    def export_yaml(self, filename, begin=None, end=None) -> None:
+        with open(filename, 'w') as f:
+            yaml.safe_dump(self.records(begin, end), f,
+                           default_flow_style=False, sort_keys=False)
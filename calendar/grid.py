@@ -48,6 +48,9 @@ value that each day mapped to.
 
 import calendar
 import collections
+import datetime
+
+from events import EventIndex
 
 
 unicode_arrows = {
@@ -57,6 +60,12 @@ unicode_arrows = {
     "w": u'\u2190',
 }
 
+def nextmonth(year, month):
+    """calendar.nextmonth became private in python 3.11"""
+    if month == 12:
+        return year + 1, 1
+    return year, month + 1
+
 # just found out this is already implemented by str.center(width)
 class String(object):
     @staticmethod
@@ -173,13 +182,13 @@ class DateNode(EmptyDateNode):
         return f"Date({self.daydate:2}, {paths})"
         # return f"Date({self.daydate:2})"
 
-    def term(self, selected=False, blt=False) -> str:
+    def term(self, selected=False, blt=False, busy=False) -> str:
         """No colors for WIN10 terminal. Womp Womp"""
         formatted_self = self.format_before_print()
         if self.selectable:
             if blt and selected:
                 return f"[bkcolor=white][color=black]{formatted_self}[/color][/bkcolor]"
-            elif blt and self.events:
+            elif blt and (self.events or busy):
                 return f"[bkcolor=gray]{formatted_self}[/bkcolor]"
             return formatted_self
         if blt:
@@ -198,6 +207,21 @@ class DateNode(EmptyDateNode):
     #         return super(DateNode, cls).__new__(cls, 0, 0)
     #     return super(DateNode, cls).__new__(cls, daydate, weekday)
 
+class RenderCache:
+    """Rendered cells and rows of a month for one set of render options"""
+    def __init__(self, key, header, cells, busy, selected):
+        self.key = key
+        self.header = header
+        self.cells = cells
+        self.rows = ["".join(week) for week in cells]
+        self.busy = busy
+        self.selected = selected
+        self.text = self.join()
+
+    def join(self) -> str:
+        body = "\n".join(self.rows)
+        return f"{self.header}\n{body}" if self.header else body
+
 class MonthGrid:
     """
     TODO: implement the class
@@ -216,6 +240,16 @@ class MonthGrid:
         self.last_day = None
         self.border = border
 
+        # daydate => (week, weekday) of the selectable days in the month
+        self.index = {}
+
+        # events spanning days are stored once and can be shared by months
+        self.event_index = events if events is not None else EventIndex()
+
+        # rendered rows are kept until the options or events change
+        self.version = 0
+        self.render_cache = None
+
         self.build()
 
     def __str__(self):
@@ -237,7 +271,7 @@ class MonthGrid:
         month_prev = self.month - 1
         if month_prev == 0:
             month_prev = 12
-            self.year_prev = self.year - 1
+            year_prev = self.year - 1
 
         self.grid_prev = self.__calendar.monthdays2calendar(year_prev, 
                                                             month_prev)
@@ -252,11 +286,14 @@ class MonthGrid:
                                                             month_next)
 
         self.grid = self.__calendar.monthdays2calendar(self.year, self.month)
+        self.render_cache = None
+        self.index = {}
         # convert nodes to datanode objects
         for j, week in enumerate(self.grid):
             for i, (date, weekday) in enumerate(week):
-                if date is not 0:
+                if date != 0:
                     self.last_day = date
+                    self.index[date] = (j, i)
                     self.grid[j][i] = DateNode(date, weekday)
                 elif j == 0:
                     self.grid[j][i] = DateNode(*self.grid_prev[-1][i],
@@ -308,12 +345,12 @@ class MonthGrid:
             setattr(self.grid[j][i], path, val)
 
     def date(self, day):
-        if 0 < day <= self.last_day:
-            for week in self.grid:
-                for date in week:
-                    if date.daydate == day:
-                        return date
-        return None
+        """Returns the DateNode of a day in the month using the day index"""
+        position = self.index.get(day)
+        if position is None:
+            return None
+        j, i = position
+        return self.grid[j][i]
 
     def term(self, options:int=0x0, blt=False):
         # TODO: draw border for body cells on border?
@@ -326,12 +363,49 @@ class MonthGrid:
         # +----------------------------------+
         # | ## | ## | ## | ## | ## | ## | ## |
         # +----------------------------------+
-        month = self.term_header(options=options)
-        month += "\n" if month else ""
-        month += "\n".join("".join(d.term(self.selected==d.daydate, blt=blt)
-                                            for d in w) 
-                                                for w in self.grid)
-        return month
+        key = (options, blt, self.version, self.event_index.version)
+        cache = self.render_cache
+        if cache is None or cache.key != key:
+            cache = self.render_cache = self.render(key)
+        elif cache.selected != self.selected:
+            # only the cells losing and gaining the selection change
+            rows = set()
+            for day in (cache.selected, self.selected):
+                position = self.index.get(day)
+                if position:
+                    j, i = position
+                    cache.cells[j][i] = self.render_cell(self.grid[j][i], 
+                                                         blt, cache.busy)
+                    rows.add(j)
+            for j in rows:
+                cache.rows[j] = "".join(cache.cells[j])
+            cache.selected = self.selected
+            cache.text = cache.join()
+        return cache.text
+
+    def render_cell(self, date, blt, busy) -> str:
+        return date.term(self.selected==date.daydate, blt=blt,
+                         busy=date.selectable and date.daydate in busy)
+
+    def render(self, key):
+        """Renders every cell of the month into a new render cache"""
+        options, blt = key[:2]
+        busy = self.busy_days() if blt else ()
+        cells = [[self.render_cell(d, blt, busy) for d in w] 
+                    for w in self.grid]
+        return RenderCache(key, self.term_header(options=options), cells,
+                           busy, self.selected)
+
+    def first_date(self) -> datetime.date:
+        return datetime.date(self.year, self.month, 1)
+
+    def last_date(self) -> datetime.date:
+        return datetime.date(self.year, self.month, self.last_day)
+
+    def busy_days(self) -> set:
+        """Returns the days of the month covered by indexed events"""
+        return {date.day for date in 
+                    self.event_index.days(self.first_date(), self.last_date())}
 
     def month_header(self):
         return f"{self.month_name} {self.year}"
@@ -359,9 +433,13 @@ class MonthGrid:
 
     def events(self):
         date = self.date(self.selected)
-        # check for object existence, then object property existence
-        if date and date.events:
-            return date.events
+        if not date:
+            return None
+        # day events first then the indexed events covering the day
+        events = list(date.events or ())
+        events.extend(e.name for e in self.event_index.day(
+            datetime.date(self.year, self.month, self.selected)))
+        return events or None
 
     def draw(self, term, pivot):
         """Used for drawing the calendar month onto a curses terminal"""
@@ -383,32 +461,52 @@ class MonthGrid:
     def add_event(self, day, event):
         date = self.date(day)
         if date:
+            self.version += 1
             # event already exists. just add on
             if date.events:
                 date.events.append(event)
             else:
-                if not isinstance(event, list):
-                    if isinstance(event, str):
-                        event = [event]
-                    else:
-                        event = list(event)
+                # copied so days given the same list do not share it
+                if isinstance(event, str):
+                    event = [event]
+                else:
+                    event = list(event)
                 date.events = event
 
     def add_events(self, day_begin, day_end, event):
-        for day in range(day_begin, day_end+1):
-            self.add_event(day, event)
+        """Adds one event spanning the days instead of a copy per day"""
+        day_begin, day_end = max(day_begin, 1), min(day_end, self.last_day)
+        if day_begin <= day_end:
+            return self.event_index.add(
+                event, 
+                datetime.date(self.year, self.month, day_begin),
+                datetime.date(self.year, self.month, day_end))
+
+    def add_rule(self, rule):
+        """Adds a recurring event. Occurrences are expanded per month shown"""
+        return self.event_index.add_rule(rule)
 
     def add_events_json(self, filename:str):
-        pass
+        """Events without a year repeat every year"""
+        return self.event_index.load_json(filename)
     
     def add_events_yaml(self, filename:str):
-        pass
+        return self.event_index.load_yaml(filename)
+
+    def month_events(self) -> EventIndex:
+        """Returns the indexed and day events of this month"""
+        events = EventIndex(self.event_index.overlapping(self.first_date(), 
+                                                         self.last_date()))
+        for day, (j, i) in self.index.items():
+            for event in self.grid[j][i].events or ():
+                events.add(event, datetime.date(self.year, self.month, day))
+        return events
 
     def export_events_json(self, filename:str):
-        pass
+        self.month_events().export_json(filename)
 
     def export_events_yaml(self, filename:str):
-        pass
+        self.month_events().export_yaml(filename)
 
     def select_prev_week(self):
         prevweekdate = self.selected - 7
@@ -441,18 +539,17 @@ class MonthGrid:
             self.selected = nextdaydate
 
     def select_day_from_date(self, day, select) -> int:
-        for week in self.grid:
-            for date in week:
-                if date.daydate == day:
-                    return getattr(date, select)
-        return 0
+        """Returns the day linked to in the select direction or 0"""
+        date = self.date(day)
+        if date is None:
+            return 0
+        return getattr(date, select) or 0
 
     def select_day_from_date_reverse(self, day, select) -> int:
-        for week in self.grid[::-1]:
-            for date in week[::-1]:
-                if date.daydate == day:
-                    return getattr(date, select)
-        return 0
+        """Kept for callers of the old scan from the end of the month. The
+        index only holds days of this month so both lookups are the same.
+        """
+        return self.select_day_from_date(day, select)
 
 class YearMonthDay(object):
     def __init__(self, year, month, day=1):
@@ -481,7 +578,8 @@ class CalendarGrid:
     """
     TODO: implement the class
     """
-    def __init__(self, year:(int, int), startdate=None):
+    def __init__(self, year:(int, int), startdate=None, events=None):
+        self.events = events if events is not None else EventIndex()
         if isinstance(year, int):
             self.year_beg = self.year_end = year
         elif isinstance(year, tuple):
@@ -510,7 +608,24 @@ class CalendarGrid:
         self.months = {year:[] for year in range(self.year_beg, self.year_end + 1)}
         for year, months in self.months.items():
             for month in range(12):
-                months.append(MonthGrid(month + 1, year))
+                months.append(MonthGrid(month + 1, year, events=self.events))
+
+    def add_events(self, events) -> int:
+        """Attaches (date, event) pairs where date is a date or a (year,
+        month, day) tuple. Each event is a dictionary lookup of its month
+        and its day. Returns the number of events attached.
+        """
+        added = 0
+        for date, event in events:
+            year, month, day = tuple(date)[:3] if not hasattr(date, 'year') \
+                else (date.year, date.month, date.day)
+            months = self.months.get(year)
+            if months:
+                grid = months[month - 1]
+                if day in grid.index:
+                    grid.add_event(day, event)
+                    added += 1
+        return added
 
     def format_months(self) -> str:
         data = ""
@@ -538,6 +653,8 @@ class Node:
         self.events = None
         self.max_event_size = 10
         self.selectable = selectable
+    def date(self):
+        return datetime.date(self.year, self.month, self.day)
     def __str__(self):
         return f"{self.day:2}"
     def __eq__(self, val):
@@ -556,99 +673,147 @@ class Node:
                 return f"[color=white] {self} [/color]"
         return f"[color=grey] {self} [/color]"
 
+class WeekWindow:
+    """
+    Weeks of a ScrollableCalendar built on demand from date arithmetic.
+    Week j starts on the sunday 7 * j days after the first sunday, so any
+    week is built without building the weeks before it. Only the most
+    recently used weeks are kept, older ones are evicted.
+    """
+    def __init__(self, first, last, selectable, size=64):
+        self.first = first
+        self.last = last
+        self.selectable = selectable
+        self.size = size
+        self.weeks = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return (self.last - self.first) // 7 + 1
+
+    def __getitem__(self, j) -> list:
+        if j < 0:
+            j += len(self)
+        if not 0 <= j < len(self):
+            raise IndexError(j)
+        week = self.weeks.get(j)
+        if week is None:
+            week = self.weeks[j] = self.build_week(j)
+            if len(self.weeks) > self.size:
+                self.weeks.popitem(last=False)
+        else:
+            self.weeks.move_to_end(j)
+        return week
+
+    def __iter__(self):
+        for j in range(len(self)):
+            yield self[j]
+
+    def build_week(self, j) -> list:
+        begin, end = self.selectable
+        week = []
+        for ordinal in range(self.first + j * 7, self.first + j * 7 + 7):
+            date = datetime.date.fromordinal(ordinal)
+            week.append(Node(date.year, date.month, date.day, date.weekday(),
+                             begin <= ordinal <= end))
+        return week
+
 class ScrollableCalendar:
     """
     Goal is to make a continuous calendar grid from startdate to enddate
+
+    Every day in the months from begdate to enddate is selectable. Weeks
+    are numbered from the sunday on or before the first day so the week and
+    weekday of any date are found with arithmetic and jumps never search.
     """
-    def __init__(self, begdate, enddate, start=None):
+    def __init__(self, begdate, enddate, start=None, window=64, events=None):
         self.begdate = begdate
         self.enddate = enddate
-        self.months = set()
         self.calendar = calendar.Calendar(firstweekday=6)
+        self.window = window
+        self.events = events if events is not None else EventIndex()
+        # (week, blt, month) => rendered row without a selected day
+        self.rows = collections.OrderedDict()
         self.init_build_months()
         self.assign_indices(start if start else begdate)
 
-    @property
-    def month(self):
-        return self.months[self.year][self.__month-1]
-
-    @month.setter
-    def month(self, value):
-        self.__month = value
-
-    def iteryearmonths(self):
-        """
-        Uses calendar.nextmonth to get all (year, month) pairs between
-        the start date and end date inclusive.
-        """
-        months = []
-        current = (self.begdate.year, self.begdate.month)
-        enddate = calendar.nextmonth(self.enddate.year, self.enddate.month)
-        while current != enddate:
-            months.append(current)
-            current = calendar.nextmonth(*current)
-        return months
-
-    def dates_from_yearmonths(self, yearmonths):
-        """
-        Takes in a list of (year, month) tuples and returns them as 
-        (year, month, day, dayofweek) tuples using calendar.itermonthdays4
-        """
-        dates = set()
-        for year, month in yearmonths:
-            vals = set(self.calendar.itermonthdays4(year, month))
-            dates = dates.union(vals)
-        dates = sorted(list(dates), key=lambda x: (x[0], x[1], x[2]))
-        return dates
-
-    def build_week_matrix(self, dates):
-        """
-        Returns a n x 7 matrix of date tuples from a list of unique date tuples
-        """
-        grid = []
-        for w in range(0, len(dates), 7):
-            grid.append(dates[w:w+7])
-        return grid
-
-    def days_to_nodes(self, grid):
-        """
-        Returns a n x 7 matrix of Node objects from a list of unique date tuples
-        """
-        graph = []
-        for week in grid:
-            nodeweek = []
-            for date in week:
-                y, m, d, w = date
-                selectable = (y, m) in self.months
-                n = Node(y, m, d, w, selectable)
-                nodeweek.append(n)
-            graph.append(nodeweek)
-        return graph
-
     def init_build_months(self) -> None:
         """
-        Using the (year, month, day, dayofweek) tuples, builds a continuous
-        calendar of datenodes with no breaks between months or years.
+        Sets up the lazily built weeks spanning the months from the begin
+        date to the end date. Nothing is built until it is shown.
         """
-        yearmonths = self.iteryearmonths()
-        self.months = yearmonths
-        dates = self.dates_from_yearmonths(yearmonths)
-        grid = self.build_week_matrix(dates)
-        self.graph = self.days_to_nodes(grid)
+        first = datetime.date(self.begdate.year, self.begdate.month, 1)
+        last = datetime.date(self.enddate.year, self.enddate.month,
+                             calendar.monthrange(self.enddate.year,
+                                                 self.enddate.month)[1])
+        self.first, self.last = first.toordinal(), last.toordinal()
+        # ordinal % 7 is 0 on sundays
+        self.graph = WeekWindow(self.first - self.first % 7,
+                                self.last + 6 - self.last % 7,
+                                (self.first, self.last),
+                                self.window)
+
+    def indices(self, date) -> (int, int):
+        """Returns the (i, j) weekday and week of a date"""
+        offset = datetime.date(date.year, date.month, date.day).toordinal() \
+            - self.graph.first
+        return offset % 7, offset // 7
 
     def assign_indices(self, date):
         """
         Sets the i, j pointers to the current day of the month and year
         """
-        self.i = self.j = -1
-        y, m, d = date.year, date.month, date.day
-        for j, week in enumerate(self.graph):
-            for i, day in enumerate(week):
-                if (y, m, d) == day:
-                    self.j = j
-                    self.i = i
-        if self.i + self.j == -2:
+        ordinal = datetime.date(date.year, date.month, date.day).toordinal()
+        if not self.first <= ordinal <= self.last:
             raise ValueError("No indices with start date")
+        self.i, self.j = self.indices(date)
+
+    @property
+    def current(self):
+        return self.graph[self.j][self.i]
+
+    def go_to_date(self, date):
+        """Moves to a date, clamped to the calendar"""
+        ordinal = datetime.date(date.year, date.month, date.day).toordinal()
+        ordinal = min(max(ordinal, self.first), self.last)
+        self.assign_indices(datetime.date.fromordinal(ordinal))
+
+    def go_to_month(self, year, month):
+        """Moves to the same day in another month, or its last day"""
+        if year < datetime.MINYEAR or year > datetime.MAXYEAR:
+            return
+        day = min(self.current.day, calendar.monthrange(year, month)[1])
+        self.go_to_date(datetime.date(year, month, day))
+
+    def select_next_month(self):
+        self.go_to_month(*nextmonth(self.current.year, self.current.month))
+
+    def select_prev_month(self):
+        year, month = self.current.year, self.current.month - 1
+        if month == 0:
+            year, month = year - 1, 12
+        self.go_to_month(year, month)
+
+    def select_next_year(self):
+        self.go_to_month(self.current.year + 1, self.current.month)
+
+    def select_prev_year(self):
+        self.go_to_month(self.current.year - 1, self.current.month)
+
+    def week_events(self, weeks:range) -> list:
+        """Returns the events overlapping a range of week numbers"""
+        first = datetime.date.fromordinal(self.graph.first + weeks[0] * 7)
+        last = datetime.date.fromordinal(self.graph.first + weeks[-1] * 7 + 6)
+        return self.events.overlapping(first, last)
+
+    def current_events(self) -> list:
+        return self.events.day(self.current.date())
+
+    def month_weeks(self, year, month) -> range:
+        """Returns the week numbers holding any day of the month"""
+        begin = self.indices(datetime.date(year, month, 1))[1]
+        end = self.indices(datetime.date(
+            year, month, calendar.monthrange(year, month)[1]))[1]
+        return range(begin, end + 1)
 
     def select_prev_week(self):
         temp = self.i, self.j
@@ -701,24 +866,37 @@ class ScrollableCalendar:
     def format_print(self, options=0x0, blt=False) -> str:
         """Returns the weeks based on the options input"""
         if Options.check(options, Options.SingleMonth):
-            curnode = self.graph[self.j][self.i]
-            year, month, select = curnode.year, curnode.month, curnode.day
+            curnode = self.current
+            year, month = curnode.year, curnode.month
             monthstring = []
-            for week in self.graph:
-                include = any((day.year, day.month) == (year, month) 
-                                for day in week)
-                if include and not blt:
-                    monthstring.append(" ".join(str(day) for day in week))
-                elif include and blt:
-                    monthstring.append("".join(day.blt(day==curnode, month) 
-                                        for day in week))
+            for j in self.month_weeks(year, month):
+                monthstring.append(self.format_row(j, blt, month))
             return "\n".join(monthstring)
 
-        if not blt:
-            return "\n".join(" ".join(str(day) for day in week) 
-                                for week in self.graph)
-        return "\n".join("".join(day.blt) for day in week
-                            for week in self.graph)
+        month = self.current.month
+        return "\n".join(self.format_row(j, blt, month) 
+                            for j in range(len(self.graph)))
+
+    def format_day(self, day, selected, blt, month) -> str:
+        return day.blt(selected, month) if blt else str(day)
+
+    def format_row(self, j, blt, month) -> str:
+        """Rows are cached except for the row of the selected day"""
+        separator = "" if blt else " "
+        if blt and j == self.j:
+            curnode = self.current
+            return separator.join(self.format_day(day, day==curnode, blt, 
+                                                  month)
+                                    for day in self.graph[j])
+        key = (j, blt, month)
+        row = self.rows.get(key)
+        if row is None:
+            row = separator.join(self.format_day(day, False, blt, month) 
+                                    for day in self.graph[j])
+            self.rows[key] = row
+            if len(self.rows) > self.window * 2:
+                self.rows.popitem(last=False)
+        return row
 
 if __name__ == "__main__":
     cg = CalendarGrid((2018,))
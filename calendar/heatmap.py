@@ -0,0 +1,191 @@
+# heatmap.py
+
+"""
+Colours calendar days by how much was spent on them.
+
+Daily totals come from the receipts_daily summary table of the receipts
+database. SpendingTotals loads every uncached month of a visible window
+with one range query and keeps the most recently used months, so scrolling
+through years costs one query per window and never one per day. Selecting
+a day drills down to its receipts.
+
+    HeatMonth    => MonthGrid coloured by spending
+    HeatCalendar => ScrollableCalendar coloured by spending
+
+Days are shaded by the first of HEAT_LEVELS their total in cents reaches.
+
+    --year, --month => month to show
+    --day           => iso date whose receipts are listed
+"""
+
+import bisect
+import calendar
+import collections
+import datetime
+import os
+import sys
+
+import click
+
+from grid import MonthGrid, Options, ScrollableCalendar
+
+# cents a day has to reach for each colour
+HEAT_LEVELS = (1, 2500, 5000, 10000, 25000)
+HEAT_COLORS = (None, "darker green", "green", "yellow", "orange", "red")
+HEAT_SHADES = " .:*#@"
+
+
+def heat_level(cents) -> int:
+    return bisect.bisect_right(HEAT_LEVELS, cents or 0)
+
+
+def month_span(year, month) -> (str, str):
+    """Returns the iso dates of the first and last day of a month"""
+    last = calendar.monthrange(year, month)[1]
+    return (datetime.date(year, month, 1).isoformat(),
+            datetime.date(year, month, last).isoformat())
+
+
+class SpendingTotals:
+    """Daily receipt counts and cents per month read from a database with
+    select_daily_totals and select_receipts_on
+    """
+    def __init__(self, database, cached=36):
+        self.database = database
+        self.cached = cached
+        self.months = collections.OrderedDict()
+        self.queries = 0
+
+    def clear(self) -> None:
+        self.months.clear()
+
+    def load(self, begin, end) -> None:
+        """Loads every uncached month from begin to end with one query"""
+        yearmonths, current = [], (begin.year, begin.month)
+        while current <= (end.year, end.month):
+            yearmonths.append(current)
+            year, month = current
+            current = (year + 1, 1) if month == 12 else (year, month + 1)
+        missing = [ym for ym in yearmonths if ym not in self.months]
+        if missing:
+            self.queries += 1
+            loaded = {ym: {} for ym in missing}
+            rows = self.database.select_daily_totals(
+                month_span(*missing[0])[0], month_span(*missing[-1])[1])
+            for day, receipts, cents in rows:
+                month = loaded.get((int(day[:4]), int(day[5:7])))
+                if month is not None:
+                    month[int(day[8:10])] = (receipts, cents)
+            self.months.update(loaded)
+        for ym in yearmonths:
+            self.months.move_to_end(ym)
+        # never evict the window being shown
+        while len(self.months) > max(self.cached, len(yearmonths)):
+            self.months.popitem(last=False)
+
+    def month(self, year, month) -> dict:
+        """Returns day => (receipts, cents) for a month"""
+        totals = self.months.get((year, month))
+        if totals is None:
+            first = datetime.date(year, month, 1)
+            self.load(first, first)
+            totals = self.months[(year, month)]
+        return totals
+
+    def day(self, date) -> (int, int):
+        return self.month(date.year, date.month).get(date.day, (0, 0))
+
+    def receipts(self, date) -> list:
+        """Returns the receipt rows of a day"""
+        return self.database.select_receipts_on(date.isoformat())
+
+
+class HeatMonth(MonthGrid):
+    """MonthGrid with days coloured by spending"""
+    def __init__(self, month, year, totals, **kwargs):
+        self.totals = totals
+        super().__init__(month, year, **kwargs)
+
+    def refresh(self) -> None:
+        """Reloads the totals after receipts changed"""
+        self.totals.clear()
+        self.version += 1
+
+    def render_cell(self, date, blt, busy) -> str:
+        if not date.selectable:
+            return super().render_cell(date, blt, busy)
+        _, cents = self.totals.month(self.year, self.month).get(
+            date.daydate, (0, 0))
+        level = heat_level(cents)
+        if not blt:
+            return f" {date}{HEAT_SHADES[level]}"
+        if self.selected == date.daydate or not level:
+            return super().render_cell(date, blt, busy)
+        return f"[bkcolor={HEAT_COLORS[level]}]{date.format_before_print()}[/bkcolor]"
+
+    def selected_receipts(self) -> list:
+        return self.totals.receipts(
+            datetime.date(self.year, self.month, self.selected))
+
+
+class HeatCalendar(ScrollableCalendar):
+    """ScrollableCalendar with days coloured by spending"""
+    def __init__(self, begdate, enddate, totals, **kwargs):
+        self.totals = totals
+        super().__init__(begdate, enddate, **kwargs)
+
+    def refresh(self) -> None:
+        self.totals.clear()
+        self.rows.clear()
+
+    def format_print(self, options=0x0, blt=False) -> str:
+        """Loads the totals of the weeks shown before rendering them"""
+        if Options.check(options, Options.SingleMonth):
+            weeks = self.month_weeks(self.current.year, self.current.month)
+        else:
+            weeks = range(len(self.graph))
+        self.totals.load(
+            datetime.date.fromordinal(self.graph.first + weeks[0] * 7),
+            datetime.date.fromordinal(self.graph.first + weeks[-1] * 7 + 6))
+        return super().format_print(options, blt)
+
+    def format_day(self, day, selected, blt, month) -> str:
+        if not day.selectable:
+            return super().format_day(day, selected, blt, month)
+        _, cents = self.totals.day(day)
+        level = heat_level(cents)
+        if not blt:
+            return f"{day}{HEAT_SHADES[level]}"
+        if selected or not level:
+            return super().format_day(day, selected, blt, month)
+        return f"[bkcolor={HEAT_COLORS[level]}] {day} [/bkcolor]"
+
+    def selected_receipts(self) -> list:
+        return self.totals.receipts(self.current.date())
+
+
+@click.command()
+@click.option("--year", "year", default=datetime.date.today().year)
+@click.option("--month", "month", default=datetime.date.today().month)
+@click.option("--day", "day", default=None, help="iso date to drill into")
+def main(year, month, day):
+    # the receipts database lives in the source package of the repository
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import source.utils as utils
+    from source.database import ReceiptConnection
+    from source.money import Money
+
+    logargs = utils.logargs(type("heatmap_main", (), dict()), __file__)
+    logger = utils.setup_logger_from_logargs(logargs)
+
+    database = ReceiptConnection(logger=logger)
+    database.build_summaries()
+    totals = SpendingTotals(database)
+    grid = HeatMonth(month, year, totals)
+    print(grid.term(options=Options.MonthHeader | Options.DayHeader))
+    if day:
+        for row in totals.receipts(datetime.date.fromisoformat(day)):
+            print(f"{row[3]} {Money(row[7]):>9.2f} {row[1]}")
+
+if __name__ == "__main__":
+    main()
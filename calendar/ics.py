@@ -0,0 +1,233 @@
+# ics.py
+
+"""
+Imports iCalendar (.ics) files into an EventIndex one event at a time.
+
+Lines are unfolded as they are read, so only the event being parsed is held
+in memory no matter how large the file is. Every VEVENT becomes an event,
+or a recurrence rule when it has an RRULE:
+
+    SUMMARY         => name
+    DTSTART         => first day, times are dropped
+    DTEND, DURATION => last day. DTEND is exclusive as in the rfc
+    RRULE           => FREQ, INTERVAL, BYDAY, UNTIL and COUNT
+    EXDATE          => exceptions
+    DESCRIPTION, LOCATION, UID => kept as the event's data
+
+Components nested in a VEVENT, such as VALARM, are skipped whole.
+
+Events are added to the index in batches. Rules with a frequency finer than
+a day, an ordinal BYDAY such as 2MO, or a BYMONTHDAY, BYMONTH, BYSETPOS,
+BYYEARDAY or BYWEEKNO part are imported as their first occurrence and
+counted in the report. A BYMONTHDAY or BYMONTH naming only the day or month
+of DTSTART repeats what the rule does already and is accepted.
+
+    FILENAME => .ics file to import
+"""
+
+import datetime
+import re
+import time
+from collections import namedtuple
+
+import click
+
+from events import Event, EventIndex
+from recurrence import Rule
+
+ImportReport = namedtuple("ImportReport", "events rules approximated seconds")
+
+DATA_PROPERTIES = {"DESCRIPTION": "description", "LOCATION": "location",
+                   "UID": "uid"}
+FREQUENCIES = {"DAILY": "daily", "WEEKLY": "weekly", "MONTHLY": "monthly",
+               "YEARLY": "yearly"}
+ESCAPE = re.compile(r"\\([\\;,nN])")
+# RRULE parts the recurrence rules cannot express
+UNSUPPORTED = ("BYMONTHDAY", "BYMONTH", "BYSETPOS", "BYYEARDAY", "BYWEEKNO")
+
+
+def unfold(f):
+    """Yields the logical lines of an ics file. Lines starting with a space
+    or tab continue the line before them.
+    """
+    current = None
+    for line in f:
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current:
+            yield current
+        current = line
+    if current:
+        yield current
+
+
+def split_property(line) -> (str, dict, str):
+    """Returns the name, parameters and value of a content line"""
+    head, _, value = line.partition(":")
+    if ";" not in head:
+        return head.upper(), {}, value
+    name, *parameters = head.split(";")
+    return (name.upper(),
+            dict(p.partition("=")[::2] for p in parameters),
+            value)
+
+
+def unescape(text) -> str:
+    return ESCAPE.sub(lambda m: "\n" if m.group(1) in "nN" else m.group(1),
+                      text)
+
+
+def parse_date(value) -> datetime.date:
+    """Returns the day of a DATE or DATE-TIME value"""
+    return datetime.date(int(value[:4]), int(value[4:6]), int(value[6:8]))
+
+
+def parse_days(duration) -> int:
+    """Returns the whole days of a DURATION such as P3D, P1W or PT4H"""
+    days, number = 0, ""
+    for character in duration.split("T")[0]:
+        if character.isdigit():
+            number += character
+        elif character == "W":
+            days, number = days + int(number) * 7, ""
+        elif character == "D":
+            days, number = days + int(number), ""
+    return days
+
+
+def iter_vevents(f):
+    """Yields the properties of each VEVENT as a list of (name, parameters,
+    value) tuples. Properties of components nested in the event, such as a
+    VALARM, are dropped.
+    """
+    properties, depth = None, 0
+    for line in unfold(f):
+        upper = line.upper()
+        if properties is None:
+            if upper == "BEGIN:VEVENT":
+                properties, depth = [], 0
+        elif upper.startswith("BEGIN:"):
+            depth += 1
+        elif depth:
+            depth -= upper.startswith("END:")
+        elif upper == "END:VEVENT":
+            yield properties
+            properties = None
+        else:
+            properties.append(split_property(line))
+
+
+def unsupported(rrule, part, begin, freq) -> bool:
+    """Returns true if an RRULE part changes the dates of the rule. A
+    BYMONTHDAY of the first day or a yearly BYMONTH of the first month
+    changes nothing.
+    """
+    value = rrule.get(part)
+    if value is None:
+        return False
+    if "BYDAY" in rrule:
+        return True
+    if part == "BYMONTHDAY" and freq in ("monthly", "yearly"):
+        return value != str(begin.day)
+    if part == "BYMONTH" and freq == "yearly":
+        return value != str(begin.month)
+    return True
+
+
+def make_component(properties):
+    """Returns an Event or Rule of a VEVENT and whether it was
+    approximated
+    """
+    name, begin, end, days, rrule = "", None, None, None, None
+    exceptions, data = [], {}
+    for key, parameters, value in properties:
+        if key == "SUMMARY":
+            name = unescape(value)
+        elif key == "DTSTART":
+            begin = parse_date(value)
+        elif key == "DTEND":
+            end = parse_date(value)
+            # whole days end the day before, times end on their day
+            if parameters.get("VALUE") == "DATE" or len(value) == 8 or \
+                    value[9:15] == "000000":
+                end -= datetime.timedelta(days=1)
+        elif key == "DURATION":
+            days = parse_days(value)
+        elif key == "RRULE":
+            rrule = dict(p.partition("=")[::2] for p in value.split(";"))
+        elif key == "EXDATE":
+            exceptions.extend(parse_date(v) for v in value.split(","))
+        elif key in DATA_PROPERTIES:
+            data[DATA_PROPERTIES[key]] = unescape(value)
+    if begin is None:
+        return None, False
+
+    if days is not None:
+        end = begin + datetime.timedelta(days=max(days - 1, 0))
+    if end is None or end < begin:
+        end = begin
+    event = Event(name, begin, end, data or None)
+    if rrule is None:
+        return event, False
+
+    freq = FREQUENCIES.get(rrule.get("FREQ", "").upper())
+    weekdays = [day.lstrip("+-0123456789")
+                    for day in rrule.get("BYDAY", "").split(",") if day]
+    ordinal = any(day[:1] in "+-0123456789" for day in
+                    rrule.get("BYDAY", "").split(",") if day)
+    if freq is None or ordinal or (weekdays and freq == "yearly"):
+        return event, True
+    if any(unsupported(rrule, part, begin, freq) for part in UNSUPPORTED):
+        return event, True
+    return Rule(name, begin, freq,
+                interval=int(rrule.get("INTERVAL", 1)),
+                weekdays=weekdays or None,
+                until=parse_date(rrule["UNTIL"]) if "UNTIL" in rrule else None,
+                count=int(rrule["COUNT"]) if "COUNT" in rrule else None,
+                exceptions=exceptions,
+                days=(end - begin).days + 1,
+                data=data or None), False
+
+
+def import_ics(f, index=None, batch=4096) -> (EventIndex, ImportReport):
+    """Imports the events of an open ics file into an EventIndex"""
+    index = index if index is not None else EventIndex()
+    start = time.perf_counter()
+    events, rules, approximated, pending = 0, 0, 0, []
+    for properties in iter_vevents(f):
+        component, approximate = make_component(properties)
+        approximated += approximate
+        if isinstance(component, Rule):
+            index.add_rule(component)
+            rules += 1
+        elif component is not None:
+            pending.append(component)
+            events += 1
+            if len(pending) >= batch:
+                index.extend(pending)
+                pending = []
+    index.extend(pending)
+    return index, ImportReport(events, rules, approximated,
+                               time.perf_counter() - start)
+
+
+def load_ics(filename, index=None) -> (EventIndex, ImportReport):
+    with open(filename, "r", encoding="utf-8") as f:
+        return import_ics(f, index)
+
+
+@click.command()
+@click.argument("filename")
+def main(filename):
+    index, report = load_ics(filename)
+    total = report.events + report.rules
+    rate = total / report.seconds if report.seconds else 0
+    print(f"{report.events} events and {report.rules} rules in "
+          f"{report.seconds:.3f}s ({rate:,.0f} per second)")
+    if report.approximated:
+        print(f"{report.approximated} rules imported as single events")
+
+if __name__ == "__main__":
+    main()
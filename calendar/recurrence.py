@@ -0,0 +1,258 @@
+# recurrence.py
+
+"""
+Recurring events are stored as one rule instead of one event per day:
+
+    freq       => daily, weekly, monthly or yearly
+    interval   => every n days, weeks, months or years
+    weekdays   => days of the week the event happens on for daily, weekly
+                  and monthly rules. Weekly rules default to the weekday of
+                  the first occurrence and monthly rules to its day number
+    until      => last date an occurrence may begin on
+    count      => number of occurrences, exceptions included
+    exceptions => dates skipped
+
+Occurrences are only expanded for the span being shown. The period holding
+the first day of a span is found with arithmetic from the first occurrence,
+so expanding a month costs what is in the month and not what came before
+it. RecurringEvents memoizes the most recently expanded spans.
+
+In event files a rule is an event with a repeat key:
+
+    standup:
+        date: 2019-01-07
+        repeat:
+            freq: weekly
+            weekdays: [mo, tu, we, th, fr]
+            except: [2019-12-25]
+"""
+
+import calendar
+import collections
+import datetime
+import heapq
+
+from events import Event, make_event, to_date
+
+FREQUENCIES = ("daily", "weekly", "monthly", "yearly")
+WEEKDAYS = ("mo", "tu", "we", "th", "fr", "sa", "su")
+ONE_DAY = datetime.timedelta(days=1)
+
+
+def weekday(day) -> int:
+    """Returns the date.weekday() of a weekday name or number"""
+    if isinstance(day, int):
+        return day % 7
+    return WEEKDAYS.index(str(day)[:2].lower())
+
+
+def add_months(year, month, months) -> (int, int):
+    year, month = divmod(year * 12 + month - 1 + months, 12)
+    return year, month + 1
+
+
+class Rule:
+    """A recurring event starting at begin and lasting days"""
+    def __init__(self, name, begin, freq, interval=1, weekdays=None,
+                 until=None, count=None, exceptions=(), days=1, data=None):
+        if freq not in FREQUENCIES:
+            raise ValueError(f"Unknown frequency {freq}")
+        if interval < 1:
+            raise ValueError("Interval must be at least 1")
+        if weekdays and freq == "yearly":
+            raise ValueError("Yearly rules repeat on the date of begin")
+        self.name = name
+        self.begin = to_date(begin)
+        self.freq = freq
+        self.interval = interval
+        self.weekdays = tuple(sorted({weekday(d) for d in weekdays or ()}))
+        self.until = to_date(until) if until else None
+        self.count = count
+        self.exceptions = frozenset(to_date(d) for d in exceptions)
+        self.days = days
+        self.data = data
+        if count is not None:
+            self.until = self.counted_until()
+
+    def __repr__(self):
+        return f"Rule({self.name!r}, {self.begin}, {self.freq})"
+
+    def counted_until(self):
+        """Returns the date the count runs out on. Only rules with a count
+        expand from their first occurrence and only once.
+        """
+        last = None
+        for n, date in enumerate(self.dates(0), 1):
+            if self.until and date > self.until:
+                break
+            last = date
+            if n == self.count:
+                break
+        return last or self.begin - ONE_DAY
+
+    def first_period(self, date) -> int:
+        """Returns the number of the first period that can hold date"""
+        begin = self.begin
+        if self.freq == "daily":
+            periods = -(-(date - begin).days // self.interval)
+        elif self.freq == "weekly":
+            # weeks start on sunday like the calendar grids
+            sunday = begin - datetime.timedelta(days=(begin.weekday() + 1) % 7)
+            periods = (date - sunday).days // 7 // self.interval
+        elif self.freq == "monthly":
+            months = (date.year - begin.year) * 12 + date.month - begin.month
+            periods = months // self.interval
+        else:
+            periods = (date.year - begin.year) // self.interval
+        return max(periods, 0)
+
+    def period(self, n) -> list:
+        """Returns the candidate dates of the nth period in order"""
+        begin, step = self.begin, n * self.interval
+        if self.freq == "daily":
+            date = begin + datetime.timedelta(days=step)
+            if self.weekdays and date.weekday() not in self.weekdays:
+                return []
+            return [date]
+        if self.freq == "weekly":
+            sunday = begin - datetime.timedelta(days=(begin.weekday() + 1) % 7)
+            sunday += datetime.timedelta(weeks=step)
+            days = self.weekdays or (begin.weekday(),)
+            return sorted(sunday + datetime.timedelta(days=(d + 1) % 7)
+                            for d in days)
+        if self.freq == "monthly":
+            year, month = add_months(begin.year, begin.month, step)
+            if year > datetime.MAXYEAR:
+                raise OverflowError("date value out of range")
+            length = calendar.monthrange(year, month)[1]
+            if self.weekdays:
+                first = datetime.date(year, month, 1).weekday()
+                return [datetime.date(year, month, day)
+                            for day in range(1, length + 1)
+                                if (first + day - 1) % 7 in self.weekdays]
+            if begin.day > length:
+                return []
+            return [datetime.date(year, month, begin.day)]
+        year = begin.year + step
+        if year > datetime.MAXYEAR:
+            raise OverflowError("date value out of range")
+        if (begin.month, begin.day) == (2, 29) and not calendar.isleap(year):
+            return []
+        return [begin.replace(year=year)]
+
+    def dates(self, n):
+        """Yields the dates of every period from the nth on, exceptions
+        included. Dates before begin are dropped.
+        """
+        try:
+            while True:
+                for date in self.period(n):
+                    if date >= self.begin:
+                        yield date
+                n += 1
+        except OverflowError:
+            return
+
+    def occurrences(self, begin, end):
+        """Yields the events beginning from begin - days + 1 to end"""
+        begin, end = to_date(begin), to_date(end)
+        length = datetime.timedelta(days=self.days - 1)
+        try:
+            lowest = begin - length
+        except OverflowError:
+            lowest = datetime.date.min
+        if self.until and self.until < end:
+            end = self.until
+        for date in self.dates(self.first_period(max(lowest, self.begin))):
+            if date > end:
+                return
+            if date >= lowest and date not in self.exceptions:
+                yield Event(self.name, date, date + length, self.data)
+
+    def record(self) -> dict:
+        """Returns the event file record of the rule"""
+        repeat = {"freq": self.freq}
+        if self.interval != 1:
+            repeat["interval"] = self.interval
+        if self.weekdays:
+            repeat["weekdays"] = [WEEKDAYS[d] for d in self.weekdays]
+        if self.count is not None:
+            repeat["count"] = self.count
+        elif self.until:
+            repeat["until"] = self.until.isoformat()
+        if self.exceptions:
+            repeat["except"] = sorted(d.isoformat() for d in self.exceptions)
+        record = {"name": self.name, "date": self.begin.isoformat()}
+        if self.days != 1:
+            record["days"] = self.days
+        record["repeat"] = repeat
+        record.update(self.data or {})
+        return record
+
+
+def make_rule(name, fields, year=None) -> Rule:
+    """Returns the rule of an event file record with a repeat key. Yearly
+    events without a year repeat from year 1.
+    """
+    fields = dict(fields)
+    repeat = fields.pop("repeat")
+    if isinstance(repeat, str):
+        repeat = {"freq": repeat}
+    if "date" not in fields and "begin" not in fields and \
+            not fields.get("year") and year is None:
+        fields["year"] = datetime.MINYEAR
+    event = make_event(name, fields, year)
+    return Rule(event.name, event.begin, repeat["freq"],
+                interval=repeat.get("interval", 1),
+                weekdays=repeat.get("weekdays"),
+                until=repeat.get("until"),
+                count=repeat.get("count"),
+                exceptions=repeat.get("except", ()),
+                days=(event.end - event.begin).days + 1,
+                data=event.data)
+
+
+class RecurringEvents:
+    """Rules expanded lazily with a memo of recently expanded spans"""
+    def __init__(self, rules=(), memo=32):
+        self.rules = list(rules)
+        self.memo = collections.OrderedDict()
+        self.memo_size = memo
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def __iter__(self):
+        return iter(self.rules)
+
+    def add(self, rule) -> Rule:
+        self.rules.append(rule)
+        self.changed()
+        return rule
+
+    def remove(self, rule) -> None:
+        self.rules.remove(rule)
+        self.changed()
+
+    def changed(self) -> None:
+        self.memo.clear()
+        self.version += 1
+
+    def overlapping(self, begin, end=None) -> list:
+        """Returns the occurrences covering any day from begin to end
+        ordered by their first day
+        """
+        begin = to_date(begin)
+        end = to_date(end) if end is not None else begin
+        key = (begin, end)
+        events = self.memo.get(key)
+        if events is None:
+            events = self.memo[key] = list(heapq.merge(
+                *(rule.occurrences(begin, end) for rule in self.rules),
+                key=lambda e: e.begin))
+            if len(self.memo) > self.memo_size:
+                self.memo.popitem(last=False)
+        else:
+            self.memo.move_to_end(key)
+        return events
@@ -1,15 +1,11 @@
 """Basic generators"""
 import random
 
-class Money(float):
-    def __init__(self, amount):
-        self = amount
-    def __str__(self):
-        return f"${self:0.2f}"
-    def __repr__(self):
-        return f"Money(amount={self}"
-    def __add__(self, other):
-        pass
+from source.money import Money
+
+def random_money(low=0, high=100):
+    """Returns a random amount of Money between low and high dollars"""
+    return Money(random.randint(low * 100, high * 100))
 
 class Age(int):
     def __init__(self, years):
@@ -20,7 +16,8 @@ class Age(int):
         return cls(random.randint(low, high))
 
 if __name__ == "__main__":
-    m = Money(3)
+    m = Money.from_dollars(3)
+    print(m)
+    m = Money.from_dollars(53)
     print(m)
-    m = Money(53)
-    print(m)
\ No newline at end of file
+    print(random_money())
\ No newline at end of file
@@ -1,28 +1,47 @@
-"""Fake data generator"""
+"""generator.py
+DataGenerator makes synthetic receipts for load testing ingest and reports.
+
+Receipts are sampled with numpy a batch at a time from the products catalog
+of mean prices and deviations:
+
+    store    => a store of a category picked by its share of receipts
+    date     => any day from start to end
+    products => distinct products of the store category, about items of
+                them, priced at price +/- deviation in whole cents
+    tax      => tax rate of the category times the subtotal
+    payment  => the total, or the next whole dollar for cash receipts
+
+Every batch draws from its own random generator seeded with the seed and
+the batch number, so the same seed, count and batch size always give the
+same receipts no matter how many workers write them. Receipts are written
+straight into a receipts database with one executemany per table and batch,
+or as yaml files in the import layout by a pool of worker processes.
+
+    -n             => receipts to generate
+    --seed         => seed of the dataset
+    --start, --end => iso dates the receipts fall between
+    --database     => database to insert into instead of writing files
+    -o             => folder for yaml files
+    --workers      => processes writing yaml files
+    --batch        => receipts sampled at a time
+"""
+
 __author__ = "Samuel Whang"
 
-import yaml
-import click
-import random
 import datetime
-import calendar
+import os
+import random
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+import numpy as np
+
+import source.config as config
 import source.utils as utils
+from source.database import ReceiptConnection
 from source.logger import Loggable
-from source.YamlObjects import receipt
-from source.database import Connection
-from examples.calendar_widget import date, parse_date, iter_months_years
-# This can either go two ways. Building data directly from sql queries with a
-# join on the tables being used. Very similar to a view table. Or load all
-# tables being used into python and have the dataprocessing done within a
-# python program.
-
-# monthsinyear = iter_months_years(date(2017, 3, 1), 
-#                                  date(2018, 9, 1))
-# filenames = [
-#     str(y)[2:] + f"{m:02}" + '01' + 'internet.yaml'
-#         for y, m in monthsinyear
-# ]
-# print(filenames)
 
 # fake data stuff -- probably create a fake table to hold these
 class RandomProductData:
@@ -67,115 +86,307 @@ def random_product_data(catalog):
                 for product, (price, deviation) in products.items()
     ]
 
-# TODO: single file option
-internet_build_query = """SELECT * FROM receipts WHERE short='BEK'"""
-
-class DataGenerator:
-    phone_number_regex = r"[1]?[\-\.\ ]??\d{3}?[\-\.\ ]?\d{3}[\-\.\ ]?\d{4}|(?>\(\d{3}\)|\d{3})[\-\.\ ]?\d{3}[\-\.\ ]\d{4}"
-    phone_number_formats = (
-            "###-###-####",
-            "###.###.####",
-            "(###)###-####",
-            "(###) ###-####",
-            "(###)###.####",
-            "(###) ###.####",
-        )
-
-    def __init__(self, folder):
-        self.folder = folder
-        self.export_folder = utils.check_or_create_folder(folder)
-        self.logger = Loggable(self)
-        self.database = Connection(logger=self.logger.logger)
-
-        print(f"PATH: {self.export_folder}")
-
-    def generate_phonenumber(self):
-        return 
-
-    def generate_filenames(self, start, end, days, category):
-        startDate = parse_date(start)
-        endDate = parse_date(end)
-        return {
-            (y, m, d): f"{str(y)[2:]}{m:02}{d:02}-{cat}.yaml"
-                for y, m in iter_months_years(startDate, endDate)
-                    for cat in category
-                        for d in days
-        }
-
-    def generate_internet_data(self):
-        filenames = self.generate_filenames("2017-3-1", 
-                                            "2018-3-1", 
-                                            (1,), 
-                                            ("utility",))
-
-        for datetup, filename in filenames.items():
-            receipt = receipt('Internet', 
-                              'Net', 
-                              list(datetup),
-                              'utility',
-                              {'internet': 73.59},
-                              73.59,
-                              0.0,
-                              73.59,
-                              73.59)
-            with open(self.export_folder + filename, 'w') as yamlfile:
-                yamlfile.write(yaml.dump(receipt))
-
-    def generate_grocery_data(self, output=False):
-        filenames = self.generate_filenames("2017-3-1",
-                                            "2018-3-1",
-                                            (8, 22),
-                                            ("groceries",))
-        if output:
-            print(f"generator: Grocery data written to:")
-        for datetup, filename in filenames.items():
-            receipt = receipt('Grocery',
-                              'Food',
-                              list(datetup),
-                              'groceries',
-                              {'food': 24.99},
-                              24.99,
-                              0.0,
-                              24.99,
-                              24.99)
-            fullpath = self.export_folder + filename
-            with open(fullpath, 'w') as yamlfile:
-                yamlfile.write(yaml.dump(receipt))
-            if output:
-                print(f"  {filename}")
-
-    def generate_fast_food_data(self):
-        pass
-
-    def generate_general_store_data(self):
-        pass
-
-    # Let's try both ways
-    # Option 1: Sql Join Query to generate data
-    def generate_data(self):
+StoreCategory = namedtuple("StoreCategory", "category share items tax stores")
+
+# products[storecategory] => receipt category, share of receipts, mean
+# products per receipt, tax rate and (store, short) names of its stores.
+# Stores are the ones known to data/classifier.yaml
+store_categories = {
+    'grocery': StoreCategory('grocery', 0.45, 3.0, 0.0, (
+        ('Leevers', 'Leevers'),
+        ('Marketplace', 'Market'),
+        ('Meat Supply', 'Meats'),
+    )),
+    'resturant': StoreCategory('fast food', 0.30, 1.5, 0.07, (
+        ('Burger King', 'BK'),
+        ('Taco Johns', 'TJ'),
+    )),
+    'general': StoreCategory('general store', 0.20, 2.0, 0.07, (
+        ('Shopko', 'Shopko'),
+    )),
+    'utility': StoreCategory('utility', 0.05, 1.0, 0.0, (
+        ('Bek Internet', 'BEK'),
+    )),
+}
+
+# share of receipts paid in cash, rounded up to the next dollar
+CASH_SHARE = 0.25
+EPOCH = datetime.date(1970, 1, 1).toordinal()
+
+ReceiptBatch = namedtuple(
+    "ReceiptBatch",
+    "filenames dates stores subtotal tax total payment receipts products cents"
+)
+
+
+def to_date(date) -> datetime.date:
+    if isinstance(date, str):
+        return datetime.date.fromisoformat(date)
+    return date
+
+
+def dollars(cents) -> str:
+    return f"{cents // 100}.{cents % 100:02d}"
+
+
+class ReceiptSampler:
+    """Samples batches of receipts as numpy arrays. Products, stores and
+    categories are numbered in the order of the catalogs.
+    """
+    def __init__(self, seed=config.GENERATOR_SEED,
+                 start=config.GENERATOR_START, end=None,
+                 batch_size=config.GENERATOR_BATCH_SIZE,
+                 catalog=products, categories=store_categories):
+        end = end or datetime.date.today() - datetime.timedelta(days=1)
+        self.seed = seed
+        self.start = to_date(start).toordinal()
+        self.end = to_date(end).toordinal()
+        if self.end < self.start:
+            raise ValueError("Receipts cannot end before they start")
+        self.batch_size = batch_size
+
+        self.names, prices, deviations = [], [], []
+        self.offsets, self.counts = [], []
+        self.categories, shares, items, taxes = [], [], [], []
+        self.stores, self.shorts, self.slugs = [], [], []
+        self.store_first, self.store_count = [], []
+        for key, category in categories.items():
+            self.offsets.append(len(self.names))
+            self.counts.append(len(catalog[key]))
+            for name, (price, deviation) in catalog[key].items():
+                self.names.append(name)
+                prices.append(price)
+                deviations.append(deviation)
+            self.categories.append(category.category)
+            shares.append(category.share)
+            items.append(category.items)
+            taxes.append(category.tax)
+            self.store_first.append(len(self.stores))
+            self.store_count.append(len(category.stores))
+            for store, short in category.stores:
+                self.stores.append(store)
+                self.shorts.append(short)
+                self.slugs.append(store.replace(" ", "").lower())
+
+        self.prices = np.array(prices)
+        self.deviations = np.array(deviations)
+        self.offsets = np.array(self.offsets)
+        self.counts = np.array(self.counts)
+        self.shares = np.array(shares) / sum(shares)
+        self.items = np.array(items)
+        self.taxes = np.array(taxes)
+        self.store_first = np.array(self.store_first)
+        self.store_count = np.array(self.store_count)
+        self.store_category = np.repeat(np.arange(len(self.categories)),
+                                        self.store_count)
+
+    def batches(self, count):
+        """Yields the (number, size) of every batch of count receipts"""
+        for number, first in enumerate(range(0, count, self.batch_size)):
+            yield number, min(self.batch_size, count - first)
+
+    def batch(self, number, size=None) -> ReceiptBatch:
+        """Returns the nth batch. Products of a receipt are listed together
+        in the receipts order.
+        """
+        size = self.batch_size if size is None else size
+        rng = np.random.default_rng([self.seed, number])
+
+        category = rng.choice(len(self.shares), size, p=self.shares)
+        stores = self.store_first[category] + \
+            (rng.random(size) * self.store_count[category]).astype(np.int64)
+        days = np.sort(rng.integers(self.start, self.end + 1, size))
+        items = np.minimum(rng.poisson(self.items[category] - 1) + 1,
+                           self.counts[category])
+
+        # distinct products: the products whose random rank in their
+        # receipt is below its number of items
+        receipts, chosen = [], []
+        for c, count in enumerate(self.counts):
+            rows = np.flatnonzero(category == c)
+            if not rows.size:
+                continue
+            ranks = rng.random((rows.size, count)).argsort(axis=1).argsort(axis=1)
+            row, product = np.nonzero(ranks < items[rows, None])
+            receipts.append(rows[row])
+            chosen.append(self.offsets[c] + product)
+        receipts = np.concatenate(receipts)
+        chosen = np.concatenate(chosen)
+        order = np.argsort(receipts, kind="stable")
+        receipts, chosen = receipts[order], chosen[order]
+
+        cents = np.rint((self.prices[chosen] + rng.uniform(-1, 1, chosen.size)
+                         * self.deviations[chosen]) * 100).astype(np.int64)
+        cents = np.maximum(cents, 1)
+        subtotal = np.bincount(receipts, weights=cents,
+                               minlength=size).astype(np.int64)
+        tax = np.rint(subtotal * self.taxes[category]).astype(np.int64)
+        total = subtotal + tax
+        cash = rng.random(size) < CASH_SHARE
+        payment = np.where(cash, -(-total // 100) * 100, total)
+
+        dates = np.datetime_as_string(
+            (days - EPOCH).astype("datetime64[D]")).tolist()
+        first = number * self.batch_size
+        filenames = [
+            f"{d[2:4]}{d[5:7]}{d[8:10]}-{self.slugs[s]}-{first + i:08d}"
+                for i, (d, s) in enumerate(zip(dates, stores.tolist()))
+        ]
+        return ReceiptBatch(filenames, dates, stores, subtotal, tax, total,
+                            payment, receipts, chosen, cents)
+
+    def receipt_rows(self, batch) -> list:
+        """Returns the receipts table rows of a batch. Fingerprints are left
+        for ReceiptConnection.build_fingerprints.
+        """
+        return [
+            (filename, self.stores[s], self.shorts[s], date,
+             self.categories[self.store_category[s]], subtotal, tax, total,
+             payment, None)
+                for filename, date, s, subtotal, tax, total, payment in zip(
+                    batch.filenames, batch.dates, batch.stores.tolist(),
+                    batch.subtotal.tolist(), batch.tax.tolist(),
+                    batch.total.tolist(), batch.payment.tolist())
+        ]
+
+    def product_rows(self, batch, ids) -> list:
+        """Returns the products table rows of a batch given the catalog id
+        of every product
         """
-        Step 1:
-        query should build two new tables => generated_receipts, generate_products
-        table values should be the same as old receipts, products tables
-        Step 2:
-        select data from the old tables and insert them into the new tables
-        should act more like a stored proc than a query
+        filenames = np.array(batch.filenames, dtype=object)
+        names = np.array(self.names, dtype=object)
+        return list(zip(filenames[batch.receipts].tolist(),
+                        np.asarray(ids)[batch.products].tolist(),
+                        batch.cents.tolist(),
+                        names[batch.products].tolist()))
+
+    def yaml_files(self, batch):
+        """Yields (filename, text) of every receipt in the layout of the
+        import folder
         """
-        cursor = self.database.conn.execute(internet_build_query)
-        for i in cursor:
-            print(i)
-    
-    # Option 2: Generate data using python
-    def import_data(self, query):
-        self.database.conn.execute(query)
+        bounds = np.searchsorted(batch.receipts,
+                                 np.arange(len(batch.filenames) + 1))
+        products, cents = batch.products.tolist(), batch.cents.tolist()
+        for i, (filename, date, s) in enumerate(zip(
+                batch.filenames, batch.dates, batch.stores.tolist())):
+            lines = [
+                "--- !Receipt",
+                f"store: {self.stores[s]}",
+                f"short: {self.shorts[s]}",
+                f"date: [{int(date[:4])}, {int(date[5:7])}, {int(date[8:10])}]",
+                f"category: {self.categories[self.store_category[s]]}",
+                "products:",
+            ]
+            lines.extend(f"  {self.names[products[j]]}: {dollars(cents[j])}"
+                            for j in range(bounds[i], bounds[i + 1]))
+            lines.extend((
+                f"subtotal: {dollars(int(batch.subtotal[i]))}",
+                f"tax: {dollars(int(batch.tax[i]))}",
+                f"total: {dollars(int(batch.total[i]))}",
+                f"payment: {dollars(int(batch.payment[i]))}",
+            ))
+            yield filename, "\n".join(lines) + "\n"
+
+
+def write_yaml_batch(sampler, number, size, folder) -> int:
+    """Samples a batch and writes its yaml files. Run in worker processes"""
+    written = 0
+    for filename, text in sampler.yaml_files(sampler.batch(number, size)):
+        path = os.path.join(folder, filename + config.YAML_FILE_EXTENSION)
+        with open(path, 'w', encoding='utf-8') as yamlfile:
+            yamlfile.write(text)
+        written += 1
+    return written
+
+
+class DataGenerator(Loggable):
+    """Writes sampled receipts into a database or a folder of yaml files"""
+    def __init__(self, sampler=None, logger=None):
+        super().__init__(self, logger=logger)
+        self.sampler = sampler or ReceiptSampler()
+
+    def generate_database(self, database, count) -> int:
+        """Inserts count receipts with one executemany per table and batch
+        while the indexes and summary triggers are dropped. Returns the
+        number of receipts inserted.
+        """
+        start = time.perf_counter()
+        database.build_tables()
+        receipt_table = database.table("receipts")
+        product_table = database.table("products")
+        ids = database.catalog.intern_many(self.sampler.names)
+        before = database.count_receipts()
+        with database.bulk_insert():
+            for number, size in self.sampler.batches(count):
+                batch = self.sampler.batch(number, size)
+                database.conn.executemany(receipt_table.insert_command,
+                                          self.sampler.receipt_rows(batch))
+                database.conn.executemany(
+                    product_table.insert_command,
+                    self.sampler.product_rows(batch, ids))
+                database.conn.commit()
+                self.log(f"inserted batch {number} of {size} receipts")
+        inserted = database.count_receipts() - before
+        self.log(f"inserted {inserted} receipts in "
+                 f"{time.perf_counter() - start:.3f}s")
+        return inserted
+
+    def generate_files(self, folder, count,
+                       workers=config.GENERATOR_WORKERS) -> int:
+        """Writes count yaml files using a pool of worker processes. Returns
+        the number of files written.
+        """
+        start = time.perf_counter()
+        folderpath = utils.check_or_create_folder(folder)
+        written = 0
+        if workers <= 1:
+            for number, size in self.sampler.batches(count):
+                written += write_yaml_batch(self.sampler, number, size,
+                                            folderpath)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [
+                    pool.submit(write_yaml_batch, self.sampler, number, size,
+                                folderpath)
+                        for number, size in self.sampler.batches(count)
+                ]
+                written = sum(future.result() for future in futures)
+        self.log(f"wrote {written} receipts to {folderpath} in "
+                 f"{time.perf_counter() - start:.3f}s")
+        return written
+
 
 @click.command()
-@click.option("-o", "folder", default="generated/", required=False,
+@click.option("-n", "count", default=1000, help="receipts to generate")
+@click.option("--seed", "seed", default=config.GENERATOR_SEED)
+@click.option("--start", "start", default=config.GENERATOR_START)
+@click.option("--end", "end", default=None, help="defaults to yesterday")
+@click.option("--database", "database", default=None,
+              help="database to insert into instead of writing files")
+@click.option("-o", "folder", default=config.GENERATOR_FOLDER,
               help="Folder to hold all generated files from script.")
-def main(folder):
-    dg = DataGenerator(folder)
-    # dg.generate_internet_data()
-    dg.generate_grocery_data(output=True)
+@click.option("--workers", "workers", default=config.GENERATOR_WORKERS)
+@click.option("--batch", "batch_size", default=config.GENERATOR_BATCH_SIZE)
+@click.option("--fingerprints", is_flag=True,
+              help="fingerprint the inserted receipts afterwards")
+def main(count, seed, start, end, database, folder, workers, batch_size,
+         fingerprints):
+    logargs = utils.logargs(type("generator_main", (), dict()), __file__)
+    logger = utils.setup_logger_from_logargs(logargs)
+
+    sampler = ReceiptSampler(seed, start, end, batch_size)
+    generator = DataGenerator(sampler, logger=logger)
+    began = time.perf_counter()
+    if database:
+        connection = ReceiptConnection(database, logger=logger)
+        generated = generator.generate_database(connection, count)
+        if fingerprints:
+            connection.build_fingerprints()
+    else:
+        generated = generator.generate_files(folder, count, workers)
+    seconds = time.perf_counter() - began
+    print(f"Generated {generated} receipts in {seconds:.3f}s "
+          f"({generated / seconds:,.0f} per second)")
 
 if __name__ == "__main__":
     main()
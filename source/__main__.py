@@ -16,7 +16,8 @@ import source.utils as utils
 from source.applications import (Application, Applications,
                                  ContactsApplication, Encyclopedia,
                                  NoteApplication, QuizApplication,
-                                 SystemApplication, TaskApplication)
+                                 ReceiptApplication, SystemApplication,
+                                 TaskApplication)
 
 
 def initialize_curses_settings(logger=None):
@@ -35,7 +36,8 @@ def initialize_environment_settings(logger=None):
     # Reduce the delay when pressing escape key on keyboard.
     os.environ.setdefault('ESCDELAY', '25')
 
-def run_application(screen, folderpath, app, demo, rebuild, reinsert, logger=None):
+def run_application(screen, folderpaths, app, demo, rebuild, reinsert, watch,
+                    export=None, logger=None):
     """Initializes the Application object which builds the rest of the
     necessary frontend/backend objects.
 
@@ -52,7 +54,9 @@ def run_application(screen, folderpath, app, demo, rebuild, reinsert, logger=Non
     initialize_curses_settings()
       
     # initialize application object and build front/back end
-    a = app(folderpath, screen=screen, logger=logger)
+    a = app(folderpaths, screen=screen, logger=logger)
+    if export:
+        a.export = export
 
     # should we create a new function that calls all 4 functions?
     # or manually call individual functions in here?
@@ -60,6 +64,10 @@ def run_application(screen, folderpath, app, demo, rebuild, reinsert, logger=Non
     #app.build_windows(screen)
     # app.build_windows()
     a.build_application(rebuild, reinsert, demo)
+
+    # keep polling the folders for receipts added while the app is running
+    if watch:
+        a.watch_folder(watch)
     # if not rebuild:
     #     getattr(app, demo)()
     # else:
@@ -68,11 +76,11 @@ def run_application(screen, folderpath, app, demo, rebuild, reinsert, logger=Non
     a.run()
 
 # TODO: need a way to run main without needing a folder
-# TODO: need a way to run main with multiple folders
-# TODO: need a way to run main with export folder specified
 @click.command()
-@click.option('-f', "folder", nargs=1,
-              help="Folder containing yaml data files")
+@click.option('-f', "folders", multiple=True,
+              help="Folder containing yaml data files. Can be repeated")
+@click.option('-e', "export", nargs=1, default=None,
+              help="Folder to export receipts into")
 @click.option('--app', "app", nargs=1,
               help="Specified which demo application to run [notes, tree, tasks, receipts, quiz]")
 @click.option('-x', "demo", nargs=1, is_flag=True, default=False,
@@ -81,7 +89,9 @@ def run_application(screen, folderpath, app, demo, rebuild, reinsert, logger=Non
               help="Rebuild tables before inserting files")
 @click.option('-i', "reinsert", nargs=1, is_flag=True, default=False,
               help="Reinsert data for specified application")
-def main(folder, app, demo, rebuild, reinsert):
+@click.option('-w', "watch", nargs=1, type=float, default=None,
+              help="Watch the folders for new receipts every N seconds")
+def main(folders, app, demo, rebuild, reinsert, watch, export):
     """Handles argument parsing using click framework before calling the
     curses wrapper handler function
     """
@@ -91,19 +101,12 @@ def main(folder, app, demo, rebuild, reinsert):
             for name in getattr(a, 'CLI_NAMES'):
                 demos.update({name: a})
 
-    # these apps have not been built yet but we want to keep their names in the 
-    # demo list for future use. For now they will call the default app program
-    demos.update({
-        "receipts": Application,
-        "receipt": Application,
-    })
-
     # pprint.pprint(demos)
 
     # special case. Dot notation usually means current folder within the file
     # system. Prevent this case in order to stop importing all subfiles
     # within the currently selected folder.
-    if folder == '.':
+    if '.' in folders:
         print("Invalid folder specified: cannot use dot")
         return
 
@@ -115,22 +118,25 @@ def main(folder, app, demo, rebuild, reinsert):
             return
         application = demos[app]
 
-    # Format the given path for the correct path delimiter and the check if
-    # that path exists as a directory within the filesystem. Exit early if
-    # false.
-    filepath = None
-    if folder:
+    # Format the given paths for the correct path delimiter and the check if
+    # each path exists as a directory within the filesystem. Exit early if
+    # false. Folders given more than once are only read once.
+    filepaths = []
+    for folder in folders:
         filepath = utils.format_directory_path(folder)
         if not utils.check_directory_path(filepath):
-            print("Folder argument is not a directory")
+            print(f"Folder argument {folder} is not a directory")
             return 
+        if filepath not in filepaths:
+            filepaths.append(filepath)
 
     initialize_environment_settings()
 
     # logger class before we enter main curses loop
     logargs = utils.logargs(application, __file__)
     logger = utils.setup_logger_from_logargs(logargs)
-    curses.wrapper(run_application, folder, application, demo, rebuild, reinsert, logger)
+    curses.wrapper(run_application, filepaths, application, demo, rebuild,
+                   reinsert, watch, export, logger)
 
 if __name__ == "__main__":
     main()
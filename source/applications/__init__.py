@@ -3,6 +3,7 @@ from source.applications.contacts import ContactsApplication
 from source.applications.encyclopedia import Encyclopedia
 from source.applications.notes import NoteApplication
 from source.applications.quiz import QuizApplication
+from source.applications.receipts import ReceiptApplication
 from source.applications.tasks import TaskApplication
 from source.applications.system.system import SystemApplication
 
@@ -10,6 +11,7 @@ Applications = (
     ContactsApplication, 
     NoteApplication, 
     QuizApplication, 
+    ReceiptApplication,
     TaskApplication, 
     Encyclopedia, 
     SystemApplication
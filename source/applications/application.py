@@ -8,24 +8,37 @@ import math
 import os
 import random
 
-import cerberus
 import yaml
 
 import source.config as config
 import source.utils as utils
+from source.classifier import StoreClassifier
 from source.controllers import (ExplorerController, NotesController,
                                 PersonController, ReceiptController)
 from source.database import Connection, NoteConnection, ReceiptConnection
+from source.exporter import ReceiptExporter
+from source.ingest import Ingestor
 from source.keymap import EventMap
 from source.logger import Loggable
 from source.models.models import Receipt, Task, Text, Transaction
 from source.models.product import Product
+from source.prices import PriceHistory
+from source.reports import SpendingReport
 from source.schema import (SQLType, Table, build_products_table,
                            build_receipts_table)
+from source.watcher import FolderWatcher
 from source.window import (DisplayWindow, PromptWindow, ScrollableWindow,
                            Window, WindowProperty, keypress_down, keypress_up)
 from source.yamlchecker import YamlChecker
-from source.YamlObjects import receipt as Yamlreceipt
+from source.YamlObjects import Receipt as Yamlreceipt
+
+
+class ReceiptScrollableWindow(ScrollableWindow):
+    def data_added(self, sender=None, **kwargs):
+        """Updates the receipt list in place, keeping the current selection"""
+        index = self.index
+        self.data = [r.store for r in kwargs['data']]
+        self.index = min(max(index, 0), len(self.data) - 1)
 
 
 class Application(Loggable):
@@ -62,14 +75,22 @@ class Application(Loggable):
         )
         self.focused = self.window
         self.last_focused = None
-        self.folder = folder
-        self.export = "./export/"
+        self.folders = [folder] if isinstance(folder, str) else list(folder or [])
+        self.export = config.EXPORT_FOLDER
 
         self.controller = None
+        self.database = None
+        self.ingestor = None
+        self.watcher = None
+        self.prices = None
         self.data = None
+        # windows opened by key presses, reused when opened again
+        self.product_window = None
+        self.report_window = None
 
         self.on_data_changed = utils.EventHandler()
         self.on_data_added = utils.EventHandler()
+        self.on_receipts_changed = utils.EventHandler()
 
     def __del__(self):
         pass
@@ -85,63 +106,97 @@ class Application(Loggable):
 
     def setup_database(self):
         self.database.rebuild_tables()
-        inserted = self.database.previously_inserted_files()
-
-        files = self.check_files(skip=inserted)
-        yobjs = self.load_files(files)
-        # self.checker.verify_file_states(loaded_files=inserted)
-        # files = self.checker.verified_files
-
-        self.database.insert_files(yobjs)
+        self.database.build_summaries()
+        self.database.build_catalog()
+        self.database.build_fingerprints()
+        self.database.build_indexes()
+        inserted = {f for (f,) in self.database.previously_inserted_files()}
+
+        self.prices = PriceHistory.from_database(self.database)
+        self.ingestor = Ingestor(self.folders, prices=self.prices,
+                                 classifier=StoreClassifier.from_file(),
+                                 logger=self.logger)
+        yobjs = self.ingestor.ingest(skip=inserted)
+
+        self.ingestor.insert(self.database, yobjs)
         self.log(f"Committed:")
-        for commit in files:
+        for commit in yobjs:
             self.log(f"+ {commit}")
+        self.log(f"Ingest report saved to {self.ingestor.report.write()}")
 
-    def check_files(self, skip=None):
-        filestates = []
-        if not self.folder:
-            return filestates
-        for _, _, files in os.walk(self.folder):
-            self.log(f"Validating {len(files)} files")
-            
-            for file_name in files:
-                if skip and file_name in skip:
-                    continue
-                filename, extension = utils.filename_and_extension(file_name)
-                self.check_file_name(filename)
-                self.check_file_data(file_name)
-                filestates.append(file_name)
-        return filestates
-
-    def check_file_name(self, filename):
-        schema = {
-            'filename': {
-                'type': 'string', 
-                'regex': config.YAML_FILE_NAME_REGEX
-            }
-        }
-        v = cerberus.Validator(schema)
-        if not v.validate({'filename': filename}):
-            raise BaseException(f'Yaml Filename {filename} is invalid')
-
-    def check_file_data(self, filename):
-        v = utils.validate_from_path(
-            self.folder + filename,
-            './data/schema.yaml'
+    def watch_folder(self, interval=config.WATCH_INTERVAL):
+        """Starts polling the import folders so receipts dropped into them
+        while the application is running are inserted without a restart.
+        """
+        if not self.folders:
+            self.log("No folder given. Watch mode disabled.")
+            return
+        if not self.database:
+            self.database = ReceiptConnection(logger=self.logger)
+        if not self.prices:
+            self.prices = PriceHistory.from_database(self.database)
+        if not self.ingestor:
+            self.ingestor = Ingestor(self.folders, prices=self.prices,
+                                     classifier=StoreClassifier.from_file(),
+                                     logger=self.logger)
+        self.watcher = FolderWatcher(self.folders, interval, logger=self.logger)
+
+        # getch returns -1 on timeout which gives the loop a chance to poll
+        self.screen.timeout(int(self.watcher.interval * 1000))
+        self.check_for_changes()
+
+    def check_for_changes(self):
+        """Polls the watched folders and feeds only new or changed files
+        through validation and insert. Removed files are reported but their
+        receipts are kept in the database. Returns true if receipts were
+        changed.
+        """
+        if not self.watcher or not self.watcher.due:
+            return False
+
+        changes = self.watcher.poll()
+        inserted = {f for (f,) in self.database.previously_inserted_files()}
+
+        paths = list(changes.changed)
+        for path in changes.added:
+            filename, _ = utils.filename_and_extension(os.path.basename(path))
+            if filename not in inserted:
+                paths.append(path)
+
+        yobjs = self.ingestor.ingest_files(paths)
+        if not yobjs and not changes.removed:
+            return False
+
+        changed = {os.path.basename(p) for p in changes.changed} & set(yobjs)
+        self.database.delete_files(changed)
+        self.ingestor.insert(self.database, yobjs)
+        for commit in yobjs:
+            self.log(f"+ {commit}")
+
+        self.on_receipts_changed(
+            self,
+            added=[f for f in yobjs if f not in changed],
+            changed=sorted(changed),
+            removed=changes.removed
         )
-        if not v:
-            raise BaseException(f"File data for {filename} invalid")
+        return True
 
-    def load_files(self, files):
-        yobjs = {}
-        for f in files:
-            with open(self.folder + f, 'r') as o:
-                yobjs[f] = yaml.load(o.read())
-        return yobjs
+    def receipts_changed(self, sender=None, **kwargs):
+        """Reloads receipt models and passes them on to the open windows"""
+        if not self.controller:
+            return
+        self.data = list(self.controller.request_receipts())
+        self.on_data_added(self, data=self.data)
 
     def run(self):
         while self.continue_app:
             key = self.screen.getch()
+            if key == -1:
+                # timed out waiting for a key in watch mode
+                if self.check_for_changes():
+                    self.screen.erase()
+                    self.draw()
+                continue
             print(f"focused:{self.focused} | keypress map:{self.focused.keypresses}")
             if key in self.focused.keypresses.keys():
                 self.focused.handle_key(key)
@@ -160,62 +215,89 @@ class Application(Loggable):
             self.draw()
             y, x = self.screen.getmaxyx()
             self.screen.addstr(y-1, 1, str(key))
+        if self.database:
+            self.log(f"query cache: {self.database.cache.stats}")
 
     def keyhandler(self, key):
         self.keymap[key]()
 
     def build_receipts_for_export(self):
         """Generates Yaml receipt objects from database"""
+        return self.database.select_receipts_for_export()
 
-        # TODO: adding a serialize function in Yamlreceipt will help
-        #       shorten this function
-        for r in self.database.select_receipts():
-            products = {
-                p.product: p.price
-                    for p in self.database.select_receipt_products(r.filename)
-            }
-
-            # separates date into list of int values again
-            datelist = utils.parse_date_from_database(r.date)
-
-            # reuse yaml object to export
-            receipt = Yamlreceipt(
-                r.store, 
-                r.short, 
-                datelist, 
-                r.category, 
-                products, 
-                r.subtotal, 
-                r.tax, 
-                r.total,
-                r.payment
-            )
-            yield (r.filename, receipt)
-
-    def export_receipts(self):
-        """Should create a folder that matches exactly the input folder"""
-        # TODO: single file to hold all data vs multiple files
+    def export_receipts(self, fmt='files', compress=False, incremental=False):
+        """Exports every receipt in the database into the export folder. The
+        files format matches exactly the input folder. The yaml and jsonl
+        formats write all receipts into a single stream. Incremental exports
+        only rewrite the files of receipts changed since the last export.
+        """
         # TODO: move file/folder existance checks to self.setup(). That way
         #       the export folder can be checked/created only once and not
         #       every time this function is called
-        # verify folder exists. If not then create it
-        exportpath = utils.format_directory_path(self.export)
-        folderpath = utils.check_or_create_folder(self.export)
-        formatpath = utils.format_directory_path(folderpath)
-        self.log(f"Begin exporting to {formatpath}")
-        for filename, receipt in self.build_receipts_for_export():
-            filepath = formatpath + filename + config.YAML_FILE_EXTENSION
-            with open(filepath, 'w') as yamlfile:
-                yamlfile.write(yaml.dump(receipt))
-        self.log("Finished exporting.")
+        exporter = ReceiptExporter(
+            self.database,
+            self.export,
+            fmt=fmt,
+            compress=compress,
+            logger=self.logger
+        )
+        if incremental:
+            return exporter.export_incremental()
+        return exporter.export(self.build_receipts_for_export())
 
     def generate_reports(self):
         """
-        Basically does a join on all the files in the database for common
-        data comparisons. Could use a handler to generate all the reports
-        specific to the database being used.
+        Loads every receipt in the database into arrays and computes the
+        spending totals by month, category and store, the moving average and
+        the top products. The report is shown in its own window when the
+        application has a screen.
         """
-        pass
+        if not self.database:
+            self.database = ReceiptConnection(logger=self.logger)
+        report = SpendingReport.from_database(self.database,
+                                              logger=self.logger)
+        if self.screen and self.report_window:
+            self.report_window.dataobject = report
+        elif self.screen:
+            height, width = self.screen.getmaxyx()
+            self.report_window = DisplayWindow(
+                self.screen.subwin(
+                    height - 2,
+                    utils.partition(width, 3, 2),
+                    1,
+                    utils.partition(width, 3, 1)
+                ),
+                title="reports",
+                dataobj=report
+            )
+            self.window.add_window(self.report_window)
+        return report
+
+    def show_product_detail(self, product):
+        """Shows the price history of a product in its own window"""
+        if not self.prices:
+            self.prices = PriceHistory.from_database(self.database)
+        if product not in self.prices:
+            self.log(f"No prices recorded for {product}")
+            return None
+        detail = self.prices.detail(product)
+        if self.screen and self.product_window:
+            self.product_window.title = detail.product
+            self.product_window.dataobject = detail
+        elif self.screen:
+            height, width = self.screen.getmaxyx()
+            self.product_window = DisplayWindow(
+                self.screen.subwin(
+                    utils.partition(height - 2, 2, 1),
+                    utils.partition(width, 3, 2),
+                    1,
+                    utils.partition(width, 3, 1)
+                ),
+                title=detail.product,
+                dataobj=detail
+            )
+            self.window.add_window(self.product_window)
+        return detail
 
     def on_focus_changed(self, sender=None, **kwargs):
         self.focused = self.window.currently_focused
@@ -246,7 +328,7 @@ class Application(Loggable):
 
         self.data = list(self.controller.request_receipts())
 
-        receipt_explorer = ScrollableWindow(
+        receipt_explorer = ReceiptScrollableWindow(
             screen.subwin(
                 height - 2,
                 utils.partition(width, 3, 1),
@@ -259,11 +341,12 @@ class Application(Loggable):
             data=[n.store for n in self.data],
             data_changed_handlers=(self.on_data_changed,)
         )
-        receipt_explorer.keypress_up_event = on_keypress_up
-        receipt_explorer.keypress_down_event = on_keypress_down
+        receipt_explorer.add_handler(curses.KEY_DOWN, keypress_down)
+        receipt_explorer.add_handler(curses.KEY_UP, keypress_up)
+        receipt_explorer.add_handler(27, self.keypress_escape)
+        self.on_receipts_changed.append(self.receipts_changed)
+        self.on_data_added.append(receipt_explorer.data_added)
         self.window.add_window(receipt_explorer)
-        self.events[curses.KEY_DOWN].append(receipt_explorer.handle_key)
-        self.events[curses.KEY_UP].append(receipt_explorer.handle_key)
 
         self.focused = self.window.currently_focused
         if not self.focused:
@@ -0,0 +1,140 @@
+import curses
+
+import source.utils as utils
+from source.applications.application import Application
+from source.database import ReceiptConnection
+from source.receiptlist import ReceiptDetail, ReceiptPages, ReceiptTotals
+from source.window import (
+    DisplayWindow,
+    ScrollableWindow,
+    keypress_down,
+    keypress_up,
+)
+
+class ReceiptApplication(Application):
+    CLI_NAMES = ('receipt', 'receipts',)
+    def build_application(self, rebuild=False, reinsert=False, examples=False):
+        """
+        Builds a receipt browser. The list on the left pages receipts out of
+        the database, the right pane shows the products of the selected
+        receipt and the footer shows totals from the summary tables.
+        """
+        screen = self.screen
+        height, width = screen.getmaxyx()
+
+        if self.database is None:
+            self.database = ReceiptConnection(rebuild=rebuild,
+                                              logger=self.logger)
+        if self.folders:
+            self.setup_database()
+        else:
+            self.database.build_summaries()
+            self.database.build_catalog()
+            self.database.build_fingerprints()
+            self.database.build_indexes()
+
+        self.pages = ReceiptPages(self.database)
+        self.detail = ReceiptDetail(self.database, self.pages)
+        self.totals = ReceiptTotals(self.database, self.pages, self.detail)
+
+        self.window.title = "Receipts"
+
+        receipt_list = ScrollableWindow(
+            screen.subwin(
+                height - 5,
+                utils.partition(width, 3, 1),
+                1,
+                0
+            ),
+            title="receipts",
+            title_centered=True,
+            focused=True,
+            data=self.pages.labels,
+            data_changed_handlers=(self.receipt_selected,)
+        )
+
+        receipt_detail = DisplayWindow(
+            screen.subwin(
+                height - 5,
+                utils.partition(width, 3, 2),
+                1,
+                utils.partition(width, 3, 1)
+            ),
+            title="products",
+            dataobj=self.detail
+        )
+
+        receipt_totals = DisplayWindow(
+            screen.subwin(
+                3,
+                width,
+                height - 4,
+                0
+            ),
+            title="totals",
+            dataobj=self.totals
+        )
+
+        # receipt list key press handlers
+        receipt_list.add_handler(curses.KEY_DOWN, keypress_down)
+        receipt_list.add_handler(curses.KEY_UP, keypress_up)
+        receipt_list.add_handler(curses.KEY_NPAGE, self.keypress_page_down)
+        receipt_list.add_handler(curses.KEY_PPAGE, self.keypress_page_up)
+        receipt_list.add_handler(curses.KEY_HOME, self.keypress_home)
+        receipt_list.add_handler(curses.KEY_END, self.keypress_end)
+        receipt_list.add_handler(ord('s'), self.keypress_sort)
+        receipt_list.add_handler(ord('r'), self.keypress_reverse)
+        receipt_list.add_handler(ord('p'), self.keypress_product)
+        receipt_list.add_handler(ord('R'), self.keypress_reports)
+        receipt_list.add_handler(27, self.keypress_escape)
+
+        self.on_receipts_changed.append(self.receipts_changed)
+
+        self.window.add_windows(receipt_list, receipt_detail, receipt_totals)
+        self.receipt_list = receipt_list
+        self.focused = self.window.currently_focused
+
+    def receipt_selected(self, sender, *args):
+        self.detail.select(sender.index)
+
+    def scroll_to(self, sender, index):
+        sender.index = min(max(index, 0), len(self.pages) - 1)
+        sender.on_data_changed(sender)
+
+    def keypress_page_down(self, sender, **kwargs):
+        self.scroll_to(sender, sender.index + sender.height)
+
+    def keypress_page_up(self, sender, **kwargs):
+        self.scroll_to(sender, sender.index - sender.height)
+
+    def keypress_home(self, sender, **kwargs):
+        self.scroll_to(sender, 0)
+
+    def keypress_end(self, sender, **kwargs):
+        self.scroll_to(sender, len(self.pages) - 1)
+
+    def keypress_sort(self, sender, **kwargs):
+        """Sorts the list on the next column and selects the first row"""
+        self.pages.next_order()
+        self.scroll_to(sender, 0)
+
+    def keypress_reverse(self, sender, **kwargs):
+        self.pages.sort(descending=not self.pages.descending)
+        self.scroll_to(sender, 0)
+
+    def keypress_product(self, sender, **kwargs):
+        """Shows the price history of the next product of the selected
+        receipt
+        """
+        product = self.detail.next_product()
+        if product is not None:
+            self.show_product_detail(product)
+
+    def keypress_reports(self, sender, **kwargs):
+        self.generate_reports()
+
+    def receipts_changed(self, sender=None, **kwargs):
+        """Reloads the pages after the watcher inserted receipts"""
+        self.pages.refresh()
+        self.detail.refresh()
+        self.scroll_to(self.receipt_list, self.receipt_list.index)
@@ -0,0 +1,230 @@
+"""cache.py
+QueryCache keeps the rows of recent select queries in memory keyed by the
+statement and its parameters. Every cached result records the version of
+each table the query read from. CachingConnection bumps the version of a
+table whenever a statement run through the connection writes to it, so a
+cached result is served only while none of its tables have changed.
+
+Triggers are followed: a write to a table also bumps every table written to
+by the triggers on it. Statements the cache cannot parse clear it entirely.
+Tables are found by name after FROM, JOIN, INTO and UPDATE, so comma joins
+("FROM a, b") should be written as explicit joins for queries to be cached.
+Writes made by other connections to the same database file are not seen.
+"""
+
+__author__ = "Samuel Whang"
+
+import re
+import sqlite3
+from collections import OrderedDict, defaultdict
+
+import source.config as config
+
+READ_TABLES = re.compile(r"\b(?:FROM|JOIN)\s+([A-Za-z_]\w*)", re.IGNORECASE)
+WRITE_TABLE = re.compile(
+    r"^\s*(?:WITH\b.*?\)\s*)?"
+    r"(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?"
+    r"|DELETE\s+FROM)\s+([A-Za-z_]\w*)",
+    re.IGNORECASE | re.DOTALL
+)
+SCHEMA_TABLE = re.compile(
+    r"^\s*(?:CREATE|DROP|ALTER)\s+(?:TEMP\w*\s+)?(?:TABLE|INDEX|VIEW)"
+    r"(?:\s+IF\s+(?:NOT\s+)?EXISTS)?\s+([A-Za-z_]\w*)",
+    re.IGNORECASE
+)
+TRIGGER = re.compile(
+    r"^\s*CREATE\s+(?:TEMP\w*\s+)?TRIGGER\b.*?\bON\s+([A-Za-z_]\w*)"
+    r".*?\bBEGIN\b(.*)\bEND\b",
+    re.IGNORECASE | re.DOTALL
+)
+BODY_WRITES = re.compile(
+    r"\b(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO"
+    r"|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+([A-Za-z_]\w*)",
+    re.IGNORECASE
+)
+READS = ("SELECT", "VALUES", "EXPLAIN")
+
+
+def statement_kind(statement: str) -> str:
+    return statement.lstrip()[:7].upper()
+
+
+def is_read(statement: str) -> bool:
+    kind = statement_kind(statement)
+    if kind.startswith(READS):
+        return True
+    return kind.startswith("WITH") and not WRITE_TABLE.match(statement)
+
+
+class QueryCache:
+    """Least recently used cache of query rows checked against table
+    versions
+    """
+    def __init__(self, max_entries=config.QUERY_CACHE_ENTRIES,
+                 max_rows=config.QUERY_CACHE_ROWS):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+
+        # (statement, parameters) => (rows, {table: version})
+        self.entries = OrderedDict()
+        self.versions = defaultdict(int)
+        # table => tables written by triggers when the table is written
+        self.cascades = defaultdict(set)
+        self.rows = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key):
+        """Returns the cached rows for the key or None if they are missing
+        or one of the tables they were read from has changed since
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            rows, versions = entry
+            if all(self.versions[t] == v for t, v in versions.items()):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return rows
+            self.discard(key)
+            self.invalidations += 1
+        self.misses += 1
+        return None
+
+    def put(self, key, rows):
+        """Caches rows read by the statement in the key. Results larger than
+        the row limit are not cached.
+        """
+        if len(rows) > self.max_rows:
+            return
+        if key in self.entries:
+            self.discard(key)
+        tables = {t.lower() for t in READ_TABLES.findall(key[0])}
+        self.entries[key] = (rows, {t: self.versions[t] for t in tables})
+        self.rows += len(rows)
+        while (len(self.entries) > self.max_entries
+                or self.rows > self.max_rows):
+            self.discard(next(iter(self.entries)))
+            self.evictions += 1
+
+    def discard(self, key):
+        rows, _ = self.entries.pop(key)
+        self.rows -= len(rows)
+
+    def clear(self):
+        self.entries.clear()
+        self.rows = 0
+
+    def bump(self, table):
+        """Invalidates every cached query that read the table or a table
+        written by its triggers
+        """
+        pending, seen = [table.lower()], set()
+        while pending:
+            name = pending.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            self.versions[name] += 1
+            pending.extend(self.cascades[name])
+
+    def wrote(self, statement: str):
+        """Bumps the tables changed by a statement that was just run"""
+        if is_read(statement):
+            return
+        match = WRITE_TABLE.match(statement)
+        if match:
+            self.bump(match.group(1))
+            return
+        match = SCHEMA_TABLE.match(statement)
+        if match:
+            self.bump(match.group(1))
+            self.bump("sqlite_master")
+            return
+        if self.add_trigger(statement):
+            self.bump("sqlite_master")
+            return
+        kind = statement_kind(statement)
+        if kind.startswith(("BEGIN", "COMMIT", "END", "SAVEPOI", "RELEASE",
+                            "PRAGMA", "ANALYZE")):
+            return
+        self.clear()
+
+    def add_trigger(self, statement: str) -> bool:
+        """Records the tables a create trigger statement writes to when its
+        table changes. Returns false if the statement is not a trigger.
+        """
+        match = TRIGGER.match(statement)
+        if not match:
+            return False
+        table, body = match.groups()
+        self.cascades[table.lower()].update(
+            t.lower() for t in BODY_WRITES.findall(body)
+        )
+        return True
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'entries': len(self.entries),
+            'rows': self.rows,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hit_rate, 4),
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+
+class CachingConnection(sqlite3.Connection):
+    """sqlite3 connection that keeps table versions up to date for its query
+    cache. Pass it to sqlite3.connect as the factory.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache = QueryCache()
+        for (statement,) in super().execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'trigger';"):
+            self.cache.add_trigger(statement)
+
+    def execute(self, statement, parameters=()):
+        cursor = super().execute(statement, parameters)
+        self.cache.wrote(statement)
+        return cursor
+
+    def executemany(self, statement, parameters):
+        cursor = super().executemany(statement, parameters)
+        self.cache.wrote(statement)
+        return cursor
+
+    def executescript(self, script):
+        cursor = super().executescript(script)
+        self.cache.clear()
+        return cursor
+
+    def rollback(self):
+        super().rollback()
+        self.cache.clear()
+
+    def query(self, statement, parameters=()) -> tuple:
+        """Runs a select statement and returns all of its rows, from memory
+        when the tables it reads have not changed since it was last run
+        """
+        if not is_read(statement):
+            return tuple(self.execute(statement, parameters))
+        key = (statement, tuple(parameters))
+        rows = self.cache.get(key)
+        if rows is None:
+            rows = tuple(super().execute(statement, parameters))
+            self.cache.put(key, rows)
+        return rows
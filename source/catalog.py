@@ -0,0 +1,85 @@
+"""catalog.py
+ProductCatalog interns product names into the product_catalog table so the
+products fact table only stores (filename, product id, cents) rows. Names
+are canonicalized by trimming and collapsing whitespace and are looked up
+case insensitively, so "Milk" and "milk " share an id. The first spelling
+seen is the one kept for display and export.
+
+The catalog keeps a name => id dictionary in memory that is loaded with a
+single query, so bulk inserts never look product names up in sqlite. New
+names are added to the table with one insert per batch.
+"""
+
+__author__ = "Samuel Whang"
+
+
+def canonical_name(name: str) -> str:
+    """Returns the display form of a product name"""
+    return ' '.join(str(name).split())
+
+
+def catalog_key(name: str) -> str:
+    """Returns the key product names are interned by"""
+    return canonical_name(name).casefold()
+
+
+class ProductCatalog:
+    """In memory map of product names to their product_catalog ids"""
+    def __init__(self, connection):
+        self.connection = connection
+        self.ids = {}
+        # key => display name of the product
+        self.names = {}
+        for id, key, name in connection.execute(
+                "SELECT id, key, name FROM product_catalog;"):
+            self.ids[key] = id
+            self.names[key] = name
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, name) -> bool:
+        return catalog_key(name) in self.ids
+
+    def get(self, name):
+        return self.ids.get(catalog_key(name))
+
+    def name(self, name):
+        """Returns the display name kept for a product name, or None"""
+        return self.names.get(catalog_key(name))
+
+    def intern(self, name) -> int:
+        """Returns the id of the product name, adding it if it is new"""
+        key = catalog_key(name)
+        id = self.ids.get(key)
+        if id is None:
+            cursor = self.connection.execute(
+                "INSERT INTO product_catalog (name, key) VALUES (?, ?);",
+                (canonical_name(name), key)
+            )
+            id = self.ids[key] = cursor.lastrowid
+            self.names[key] = canonical_name(name)
+        return id
+
+    def intern_many(self, names) -> list:
+        """Returns the ids of many names. Names not in the catalog yet are
+        added with a single insert.
+        """
+        names = list(names)
+        new = {}
+        for name in names:
+            key = catalog_key(name)
+            if key not in self.ids and key not in new:
+                new[key] = canonical_name(name)
+        if new:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO product_catalog (name, key) "
+                "VALUES (?, ?);",
+                [(name, key) for key, name in new.items()]
+            )
+            for id, key, name in self.connection.execute(
+                    "SELECT id, key, name FROM product_catalog WHERE id > ?;",
+                    (max(self.ids.values(), default=0),)):
+                self.ids[key] = id
+                self.names[key] = name
+        return [self.ids[catalog_key(name)] for name in names]
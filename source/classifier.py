@@ -0,0 +1,176 @@
+"""classifier.py
+StoreClassifier maps the raw store names written in receipts to canonical
+stores, short names and categories using the rules in
+data/classifier.yaml. The rules are compiled into dictionaries once:
+
+    exact    => normalized name            => store
+    prefix   => normalized name prefix     => store, probed per prefix length
+    keywords => word                       => store
+    categories => word                     => category for unknown stores
+
+so classifying a name is a handful of dictionary lookups no matter how many
+rules there are. Results are memoized since receipts repeat the same few
+store names.
+
+Ingest classifies receipts before they are inserted. reclassify applies the
+current rules to every receipt already in the database, which updates the
+summary tables and journal through their triggers.
+
+    -n          => classify names and print the results
+    --reclassify => apply the rules to every receipt in the database
+"""
+
+__author__ = "Samuel Whang"
+
+import re
+import time
+from collections import namedtuple
+from functools import lru_cache
+
+import click
+import yaml
+
+import source.config as config
+import source.utils as utils
+from source.logger import Loggable
+
+Classification = namedtuple("Classification", "store short category rule")
+
+# "B.K." and "Taco John's" are written without their punctuation
+DROPPED = re.compile(r"['.`]")
+SEPARATORS = re.compile(r"[^0-9a-z]+")
+
+
+def normalize(name: str) -> str:
+    """Lowercases the name and keeps its words separated by single spaces"""
+    return SEPARATORS.sub(' ', DROPPED.sub('', name.lower())).strip()
+
+
+@lru_cache(maxsize=None)
+def default_classifier():
+    """Returns the classifier built from the configured rules file"""
+    return StoreClassifier.from_file()
+
+
+class StoreClassifier(Loggable):
+    """Classifies store names with exact, prefix and keyword rules"""
+    def __init__(self, stores=(), categories=None, logger=None):
+        super().__init__(self, logger=logger)
+        self.exact = {}
+        self.prefixes = {}
+        self.keywords = {}
+        self.categories = {}
+        self.cache = {}
+
+        for rule in stores:
+            entry = (rule['store'], rule.get('short') or rule['store'],
+                     rule.get('category'))
+            for name in (rule['store'], *rule.get('exact', ())):
+                self.exact.setdefault(normalize(name), entry)
+            for prefix in rule.get('prefix', ()):
+                self.prefixes.setdefault(normalize(prefix), entry)
+            for keyword in rule.get('keywords', ()):
+                self.keywords.setdefault(normalize(keyword), entry)
+        for category, words in (categories or {}).items():
+            for word in words:
+                self.categories.setdefault(normalize(word), category)
+
+        # longest prefixes are tried first
+        self.prefix_lengths = sorted({len(p) for p in self.prefixes},
+                                     reverse=True)
+
+    @classmethod
+    def from_file(cls, path=config.CLASSIFIER_RULES_PATH, logger=None):
+        with open(path, 'r') as f:
+            rules = yaml.safe_load(f) or {}
+        return cls(rules.get('stores') or (), rules.get('categories'),
+                   logger=logger)
+
+    def classify(self, name, category=None) -> Classification:
+        """Returns the canonical store, short name and category of a raw
+        store name. Unknown stores keep their name and the given category
+        unless one of their words names a category.
+        """
+        key = (name, category)
+        result = self.cache.get(key)
+        if result is None:
+            result = self.cache[key] = self.match(name, category)
+        return result
+
+    def match(self, name, category=None) -> Classification:
+        normalized = normalize(name)
+        entry, rule = self.exact.get(normalized), "exact"
+        if entry is None:
+            rule = "prefix"
+            for length in self.prefix_lengths:
+                if length <= len(normalized):
+                    entry = self.prefixes.get(normalized[:length])
+                    if entry is not None:
+                        break
+        words = normalized.split()
+        if entry is None:
+            rule = "keyword"
+            entry = next((self.keywords[w] for w in words
+                            if w in self.keywords), None)
+        if entry is not None:
+            store, short, ruled = entry
+            return Classification(store, short, ruled or category, rule)
+
+        # unknown stores keep their own short name
+        guessed = next((self.categories[w] for w in words
+                          if w in self.categories), None)
+        return Classification(name.strip(), None, guessed or category,
+                              "category" if guessed else None)
+
+    def apply(self, receipt):
+        """Rewrites the store, short name and category of a receipt yaml
+        object in place
+        """
+        result = self.classify(receipt.store, receipt.category)
+        receipt.store = result.store
+        receipt.short = result.short or receipt.short
+        receipt.category = result.category
+        return result
+
+    def reclassify(self, database) -> int:
+        """Applies the rules to every receipt in the database with one
+        update per distinct store name and category. Returns the number of
+        receipts changed.
+        """
+        start = time.perf_counter()
+        updates = []
+        for store, short, category, count in database.select_store_names():
+            result = self.classify(store, category)
+            update = (result.store, result.short or short, result.category)
+            if update != (store, short, category):
+                updates.append((*update, store, short, category, count))
+        changed = database.update_store_names(updates)
+        self.log(f"Reclassified {changed} receipts in "
+                 f"{len(updates)} groups in {time.perf_counter() - start:.3f}s")
+        return changed
+
+
+@click.command()
+@click.option('-n', "names", multiple=True,
+              help="store name to classify. Can be repeated")
+@click.option('--rules', "rules", default=config.CLASSIFIER_RULES_PATH,
+              help="yaml file holding the classification rules")
+@click.option('--reclassify', "reclassify", is_flag=True, default=False,
+              help="apply the rules to every receipt in the database")
+def main(names, rules, reclassify):
+    # the database imports the models which classify with this module
+    from source.database import ReceiptConnection
+
+    logargs = utils.logargs(type("classifier_main", (), dict()), __file__)
+    logger = utils.setup_logger_from_logargs(logargs)
+
+    classifier = StoreClassifier.from_file(rules, logger=logger)
+    for name in names:
+        print(f"{name!r}: {classifier.classify(name)}")
+    if reclassify:
+        database = ReceiptConnection(logger=logger)
+        database.build_summaries()
+        print(f"Reclassified {classifier.reclassify(database)} receipts")
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,14 @@ YAML_CHECKER_BATCH_SYMBOL = {
     "SKIPPED": '?'
     }
 
+INGEST_REPORT_TOTALS = ("{} files: {} loaded, {} duplicates, {} failed "
+                        "in {:.3f}s")
+INGEST_REPORT_STAGE = "  {:<8} {:.3f}s"
+INGEST_REPORT_SLOW = "  ~ {:.4f}s {}"
+INGEST_REPORT_RULE = "  x {}: {}"
+INGEST_REPORT_INCONSISTENT = "  ! {}: {}"
+CONSISTENCY_VIOLATION = "  ! {:<10}{} expected {:.2f} got {:.2f}"
+
 DATE_FORMATS = {
     'ISO': {
         'L': "%Y-%m-%d",
@@ -47,4 +55,52 @@ DATABASE_POINTER_RECEIPTS = "data/receipts.db"
 CONNECTION_CLEAN_SCRIPT_QUIZ = "source/db_scripts/create_quiz.sql"
 CONNECTION_REBUILD_SCRIPT_QUIZ = "source/db_scripts/create_quiz_examples.sql"
 CONNECTION_CLEAN_SCRIPT_RECEIPTS = "source/db_scripts/create_receipts.sql"
-CONNECTION_REBUILD_SCRIPT_RECEIPTS = "source/db_scripts/create_receipts_examples.sql"
\ No newline at end of file
+CONNECTION_REBUILD_SCRIPT_RECEIPTS = "source/db_scripts/create_receipts_examples.sql"
+
+# seconds between folder polls in watch mode
+WATCH_INTERVAL = 5
+WATCH_INTERVAL_MINIMUM = 1
+
+JSONL_FILE_EXTENSION = ".jsonl"
+
+EXPORT_FOLDER = "./export/"
+EXPORT_FORMATS = ("files", "yaml", "jsonl")
+EXPORT_STREAM_NAME = "receipts"
+EXPORT_GZIP_EXTENSION = ".gz"
+EXPORT_BUFFER_SIZE = 1 << 16
+EXPORT_BATCH_SIZE = 256
+EXPORT_WORKERS = 4
+EXPORT_MANIFEST_NAME = ".manifest.json"
+EXPORT_MANIFEST_VERSION = 1
+
+RECEIPT_SCHEMA_PATH = "./data/schema.yaml"
+CLASSIFIER_RULES_PATH = "./data/classifier.yaml"
+INGEST_WORKERS = 4
+INGEST_REPORT_PATH = "./logs/ingest_report.json"
+INGEST_REPORT_SLOWEST = 10
+INGEST_CHECK_CONSISTENCY = True
+
+CONSISTENCY_TOLERANCE = 0
+
+GENERATOR_FOLDER = "./generated/"
+GENERATOR_SEED = 0
+GENERATOR_START = "2017-01-01"
+GENERATOR_BATCH_SIZE = 50000
+GENERATOR_WORKERS = 4
+
+SKIP_DUPLICATE_RECEIPTS = True
+DUPLICATE_TOLERANCE = 100
+
+REPORT_MOVING_DAYS = 30
+REPORT_TOP_PRODUCTS = 10
+
+PRICE_WINDOW_DAYS = 365
+PRICE_SPARK_LENGTH = 40
+
+QUERY_CACHE_ENTRIES = 256
+QUERY_CACHE_ROWS = 100000
+
+RECEIPT_PAGE_SIZE = 64
+RECEIPT_PAGES_CACHED = 16
+RECEIPT_PREFETCH = 8
+RECEIPT_DETAILS_CACHED = 256
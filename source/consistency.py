@@ -0,0 +1,98 @@
+"""consistency.py
+ConsistencyChecker verifies the money invariants of every receipt in the
+database with one set-based query per rule instead of loading receipts:
+
+    total    => subtotal + tax equals total
+    subtotal => the product prices of a receipt sum to its subtotal
+    payment  => payment covers the total
+
+Amounts are compared in integer cents. A tolerance in cents can be given
+for receipts whose prices were rounded. Ingest runs the checks over only
+the files it inserted.
+
+    --tolerance => cents a total may be off by before it is reported
+    -p          => print every violation
+"""
+
+__author__ = "Samuel Whang"
+
+import time
+from collections import defaultdict, namedtuple
+
+import click
+
+import source.config as config
+import source.utils as utils
+from source.database import ReceiptConnection
+from source.logger import Loggable
+from source.money import Money
+from source.schema import CONSISTENCY_RULES
+
+Violation = namedtuple("Violation", "rule filename expected actual")
+
+
+class ConsistencyChecker(Loggable):
+    """Runs every consistency rule against a ReceiptConnection"""
+    def __init__(self, database, tolerance=config.CONSISTENCY_TOLERANCE,
+                 rules=None, logger=None):
+        super().__init__(self, logger=logger)
+        self.database = database
+        self.tolerance = tolerance
+        self.rules = tuple(rules or CONSISTENCY_RULES)
+
+    def check(self, filenames=None) -> list:
+        """Returns the violations of every rule ordered by rule and
+        filename. If filenames are given then only those receipts are
+        checked.
+        """
+        if filenames is not None:
+            filenames = [utils.filename_and_extension(f)[0]
+                            for f in filenames]
+            if not filenames:
+                return []
+
+        start = time.perf_counter()
+        violations = []
+        for rule in self.rules:
+            violations.extend(
+                Violation(rule, filename, Money(expected), Money(actual))
+                    for filename, expected, actual
+                        in self.database.select_inconsistent(
+                            rule, self.tolerance, filenames)
+            )
+        self.log(f"Checked {len(self.rules)} rules in "
+                 f"{time.perf_counter() - start:.3f}s: "
+                 f"{len(violations)} violations")
+        return violations
+
+
+def group_violations(violations) -> dict:
+    """Returns the violations grouped by rule"""
+    rules = defaultdict(list)
+    for violation in violations:
+        rules[violation.rule].append(violation)
+    return dict(rules)
+
+
+@click.command()
+@click.option('--tolerance', "tolerance", default=config.CONSISTENCY_TOLERANCE,
+              help="cents an amount may be off by")
+@click.option('-p', is_flag=True, help="print every violation")
+def main(tolerance, p):
+    logargs = utils.logargs(type("consistency_main", (), dict()), __file__)
+    logger = utils.setup_logger_from_logargs(logargs)
+
+    database = ReceiptConnection(logger=logger)
+    violations = ConsistencyChecker(database, tolerance,
+                                    logger=logger).check()
+    for rule, rows in group_violations(violations).items():
+        print(config.INGEST_REPORT_INCONSISTENT.format(rule, len(rows)))
+        if p:
+            for v in rows:
+                print(config.CONSISTENCY_VIOLATION.format(*v))
+    if violations:
+        exit(1)
+    print("Receipts are consistent")
+
+if __name__ == "__main__":
+    main()
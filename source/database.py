@@ -6,16 +6,30 @@ import datetime
 import logging
 import sqlite3
 from collections import namedtuple
+from contextlib import contextmanager
+from itertools import chain, groupby
+from operator import itemgetter
 
 import source.config as config
+from source.cache import CachingConnection
+from source.catalog import ProductCatalog, canonical_name, catalog_key
+from source.duplicates import receipt_fingerprint
 from source.logger import Loggable
-from source.schema import (SQLType, Table, build_products_table,
-                           build_receipts_table)
+from source.money import Money, money
+from source.schema import (RECEIPT_PAGE_COLUMNS, SUMMARY_PERIODS, SQLType,
+                           Table,
+                           build_catalog_table, build_indexes,
+                           build_journal_table, build_journal_triggers,
+                           build_consistency_check, build_near_duplicates,
+                           build_products_table, build_receipt_page,
+                           build_receipts_table, build_summary_check,
+                           build_summary_rebuild, build_summary_tables,
+                           build_summary_triggers)
 from source.utils import filename_and_extension as fileonly
 from source.utils import format_date as date
-from source.utils import format_float as real
 from source.utils import logargs, setup_logger, setup_logger_from_logargs
-from source.YamlObjects import receipt
+from source.utils import parse_date_from_database
+from source.YamlObjects import Receipt
 from source.models.models import Note
 
 spacer = "  "
@@ -46,14 +60,32 @@ class Connection:
 
         self._connection = sqlite3.connect(
             self.database,
-            detect_types=sqlite3.PARSE_DECLTYPES
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            factory=CachingConnection
         )
         self.schema = schema
         self.rebuild_database(rebuild)
+
+    @property
+    def cache(self):
+        return self._connection.cache
+
+    def query(self, statement, parameters=()) -> tuple:
+        """Returns every row of a select statement. Rows are served from the
+        query cache until a table the statement reads from is written to.
+        """
+        return self._connection.query(statement, parameters)
     
+    def close(self):
+        self._connection.close()
+
     def __del__(self):
         print(self.database_path)
-        self._connection.close()
+        try:
+            self._connection.close()
+        except sqlite3.ProgrammingError:
+            # collected in a thread other than the one that opened it
+            pass
 
     def rebuild_database(self, rebuild):
         """
@@ -100,13 +132,13 @@ class QuizConnection(Connection):
     def insert_question(self):
         pass
 
-class ReceiptConnection(Connection):
+class ReceiptConnection(Connection, Loggable):
     
     database = config.DATABASE_POINTER_RECEIPTS
     clean_script = config.CONNECTION_CLEAN_SCRIPT_RECEIPTS
     rebuild_script = config.CONNECTION_REBUILD_SCRIPT_RECEIPTS
 
-    def __init__(self, database=None, schema=None, rebuild=False):
+    def __init__(self, database=None, schema=None, rebuild=False, logger=None):
         if database:
             self.database = database
         if schema:
@@ -114,12 +146,37 @@ class ReceiptConnection(Connection):
         if rebuild:
             self.rebuild = rebuild
 
+        Loggable.__init__(self, self, logger=logger)
         super().__init__(database, rebuild=rebuild)
         self.tables = [
             build_receipts_table(),
-            build_products_table()
+            build_products_table(),
+            build_catalog_table(),
+            build_journal_table(),
+            *build_summary_tables()
         ]
+        self.journal_triggers = build_journal_triggers()
+        self.summary_triggers = build_summary_triggers()
+        self.triggers = self.journal_triggers + self.summary_triggers
+        self.indexes = build_indexes()
         self.committed = []
+        self._catalog = None
+        # (file name, filename of the receipt it duplicates) skipped by the
+        # last insert
+        self.duplicates = []
+
+    @property
+    def conn(self):
+        return self._connection
+
+    @property
+    def catalog(self):
+        """Product name to id map loaded from the catalog table on first
+        use
+        """
+        if self._catalog is None:
+            self._catalog = ProductCatalog(self.conn)
+        return self._catalog
 
     #     self.log("closing database connection.")
     #     self.conn.close()
@@ -152,6 +209,7 @@ class ReceiptConnection(Connection):
             self.log(f"{spacer}x Dropped {table.name}")
             tablenames.append(table.name)
         self.conn.commit()
+        self._catalog = None
         self.log("dropped tables {', '.join(tablenames)} in database.")
 
     def build_tables(self, tables=None):
@@ -162,14 +220,195 @@ class ReceiptConnection(Connection):
             self.conn.execute(table.create_command)
             self.log(f"{spacer}+ Created {table.name}")
             tablenames.append(table.name)
+        for trigger in self.triggers:
+            self.conn.execute(trigger)
+        for index in self.indexes:
+            self.conn.execute(index)
         self.conn.commit()
         self.log("created tables {', '.join(tablenames)} in database.")
 
+    def build_indexes(self):
+        """Creates indexes missing from databases built before they were
+        added
+        """
+        for index in self.indexes:
+            self.conn.execute(index)
+        self.conn.commit()
+
+    def build_journal(self):
+        """Creates the change journal and its triggers if they do not exist
+        yet. Changes made before the journal existed are not recorded.
+        """
+        self.conn.execute(self.table("receipts_journal").create_command)
+        for trigger in self.journal_triggers:
+            self.conn.execute(trigger)
+        self.conn.commit()
+
+    def build_summaries(self):
+        """Creates the summary tables and their triggers if they do not exist
+        yet. Tables created for a database that already holds receipts are
+        filled from the receipts table.
+        """
+        cursor = self.conn.execute(
+            "SELECT COUNT(*) FROM sqlite_master "
+            "WHERE type = 'table' AND name IN ({});".format(
+                ', '.join('?' for _ in SUMMARY_PERIODS)),
+            tuple(SUMMARY_PERIODS)
+        )
+        existing, = cursor.fetchone()
+        self.conn.execute(self.table("receipts").create_command)
+        for name in SUMMARY_PERIODS:
+            self.conn.execute(self.table(name).create_command)
+        for trigger in self.summary_triggers:
+            self.conn.execute(trigger)
+        self.conn.commit()
+        if existing < len(SUMMARY_PERIODS):
+            self.rebuild_summaries()
+
+    def rebuild_summaries(self):
+        """Refills every summary table from the receipts table"""
+        self.log("rebuilding summary tables.")
+        for command in build_summary_rebuild():
+            self.conn.execute(command)
+        self.conn.commit()
+
+    @contextmanager
+    def bulk_insert(self):
+        """Drops the indexes and summary triggers while many receipts are
+        inserted. They are found in sqlite_master and recreated from their
+        stored sql afterwards, then the summaries are refilled from the
+        receipts table in one pass.
+        """
+        dropped = [
+            (kind, name, sql) for kind, name, sql in self.conn.execute(
+                "SELECT type, name, sql FROM sqlite_master "
+                "WHERE tbl_name IN ('receipts', 'products') "
+                "AND type IN ('index', 'trigger') AND sql IS NOT NULL;")
+                # journal triggers keep recording the inserts
+                if kind == 'index' or any(t in sql for t in SUMMARY_PERIODS)
+        ]
+        for kind, name, _ in dropped:
+            self.conn.execute(f'DROP {kind.upper()} IF EXISTS "{name}";')
+        self.conn.commit()
+        try:
+            yield self
+        finally:
+            self.conn.commit()
+            for _, _, sql in dropped:
+                self.conn.execute(sql)
+            self.build_indexes()
+            for trigger in self.summary_triggers:
+                self.conn.execute(trigger)
+            self.rebuild_summaries()
+
+    def check_summaries(self) -> dict:
+        """Compares every summary table with a fresh aggregate of receipts.
+        Returns the table names mapped to their differing rows.
+        """
+        differences = {}
+        for name in SUMMARY_PERIODS:
+            rows = self.conn.execute(build_summary_check(name)).fetchall()
+            if rows:
+                self.log(f"{name} has {len(rows)} inconsistent rows",
+                         level=logging.WARNING)
+                differences[name] = rows
+        return differences
+
+    def select_summary(self, name, start=None, end=None):
+        """Yields (period, store, category, receipts, total) rows from a
+        summary table between the start and end periods inclusive
+        """
+        period = SUMMARY_PERIODS[name][0]
+        statement = (f"SELECT {period}, store, category, receipts, total "
+                     f"FROM {name} WHERE {period} BETWEEN ? AND ? "
+                     f"ORDER BY {period}, store, category;")
+        yield from self.query(statement, (start or '', end or '~'))
+
+    def select_daily_totals(self, start, end):
+        """Returns (day, receipts, total) rows of the daily summary table
+        summed over stores and categories between two iso dates inclusive
+        """
+        return self.query(
+            "SELECT day, SUM(receipts), SUM(total) FROM receipts_daily "
+            "WHERE day BETWEEN ? AND ? GROUP BY day ORDER BY day;",
+            (start, end)
+        )
+
+    def select_receipts_on(self, date):
+        """Returns the receipt rows of an iso date ordered by filename"""
+        return self.query(
+            f"SELECT {', '.join(RECEIPT_PAGE_COLUMNS)} FROM receipts "
+            "WHERE date = ? ORDER BY date, filename;",
+            (date,)
+        )
+
+    def select_inconsistent(self, rule, tolerance=0, filenames=None):
+        """Yields (filename, expected, actual) for receipts breaking one of
+        the CONSISTENCY_RULES. Only the given filenames are checked if any.
+        """
+        if filenames is None:
+            yield from self.conn.execute(
+                build_consistency_check(rule, tolerance))
+        else:
+            yield from self.select_rows_in_batches(
+                build_consistency_check(rule, tolerance, filtered=True),
+                sorted(filenames),
+                config.EXPORT_BATCH_SIZE
+            )
+
+    def select_store_names(self):
+        """Returns the distinct (store, short, category) names of receipts
+        with the number of receipts using them
+        """
+        return self.conn.execute(
+            "SELECT store, short, category, COUNT(*) FROM receipts "
+            "GROUP BY store, short, category;"
+        ).fetchall()
+
+    def update_store_names(self, updates) -> int:
+        """Renames receipts from (store, short, category, old store, old
+        short, old category, count) rows. Returns the receipts changed.
+        """
+        if not updates:
+            return 0
+        self.conn.executemany(
+            "UPDATE receipts SET store = ?, short = ?, category = ? "
+            "WHERE store IS ? AND short IS ? AND category IS ?;",
+            [update[:6] for update in updates]
+        )
+        self.conn.commit()
+        return sum(update[6] for update in updates)
+
+    def select_journal_changes(self, since=0):
+        """Returns the filenames changed after the given journal sequence
+        number and the latest sequence number in the journal.
+        """
+        cursor = self.conn.execute(
+            "SELECT DISTINCT filename FROM receipts_journal WHERE seq > ?;",
+            (since,)
+        )
+        filenames = {filename for (filename,) in cursor}
+        cursor = self.conn.execute("SELECT MAX(seq) FROM receipts_journal;")
+        latest, = cursor.fetchone()
+        return filenames, latest or 0
+
+    def compact_journal(self, through) -> int:
+        """Deletes journal rows up to the given sequence number except the
+        last row of every filename. Exports reading changes from any later
+        or earlier sequence number still see the same filenames. Returns the
+        number of rows deleted.
+        """
+        cursor = self.conn.execute(
+            "DELETE FROM receipts_journal WHERE seq <= ? AND seq NOT IN "
+            "(SELECT MAX(seq) FROM receipts_journal GROUP BY filename);",
+            (through,)
+        )
+        self.conn.commit()
+        return cursor.rowcount
+
     def previously_inserted_files(self, fields=None):
         self.log("retrieving inserted files from database")
-        cursor = self.conn.execute("SELECT FILENAME FROM receipts;")
-        for data in unpack(cursor):
-            yield data
+        yield from self.query("SELECT FILENAME FROM receipts;")
 
     def insert_files(self, yaml_objs: dict):
         if not yaml_objs:
@@ -181,13 +420,27 @@ class ReceiptConnection(Connection):
         
         receipt_table = self.table("receipts")
         product_table = self.table("products")
+        self.duplicates = []
+
+        # new product names are added to the catalog in one batch
+        self.catalog.intern_many(
+            product for yaml_obj in yaml_objs.values()
+                for product in yaml_obj.products
+        )
 
         # iterate through the files verified by yamlchecker
         for file_name, yaml_obj in yaml_objs.items():
             if file_name not in inserted_files:
-                self.log(f"inserting {file_name}")
-
                 file_only, _ = fileonly(file_name)
+                fingerprint = receipt_fingerprint(yaml_obj)
+                original = self.select_fingerprint(fingerprint, file_only)
+                if original and config.SKIP_DUPLICATE_RECEIPTS:
+                    self.log(f"? {file_name} duplicates {original}",
+                             level=logging.WARNING)
+                    self.duplicates.append((file_name, original))
+                    continue
+
+                self.log(f"inserting {file_name}")
                 self.conn.execute(
                     receipt_table.insert_command, 
                     (
@@ -196,10 +449,11 @@ class ReceiptConnection(Connection):
                         yaml_obj.short,
                         date(yaml_obj.date),
                         yaml_obj.category,
-                        real(yaml_obj.subtotal),
-                        real(yaml_obj.tax),
-                        real(yaml_obj.total),
-                        real(yaml_obj.payment)
+                        money(yaml_obj.subtotal),
+                        money(yaml_obj.tax),
+                        money(yaml_obj.total),
+                        money(yaml_obj.payment),
+                        fingerprint
                     )
                 )
                                     
@@ -214,8 +468,9 @@ class ReceiptConnection(Connection):
                         product_table.insert_command, 
                         (
                             file_only,
-                            product, 
-                            real(price)
+                            self.catalog.intern(product),
+                            money(price),
+                            product
                         )
                     )
                 self.log(f"{spacer}inserted into products table")
@@ -223,33 +478,259 @@ class ReceiptConnection(Connection):
                 self.log(f"data from {file_name} already inserted")
 
         self.conn.commit()
-        self.committed = list(yaml_objs.keys())
+        skipped = {file_name for file_name, _ in self.duplicates}
+        self.committed = [f for f in yaml_objs if f not in skipped]
         self.log("completed inserting receipts data.")
 
+    def build_catalog(self):
+        """Creates the product catalog. Product names in products tables
+        built before the catalog existed are interned and replaced by their
+        ids. Products tables built before the name of each line was kept
+        take the catalog name.
+        """
+        self.conn.execute(self.table("product_catalog").create_command)
+        columns = {c[1] for c in self.conn.execute(
+            "PRAGMA table_info(products);")}
+        if "product" in columns:
+            self.log("moving product names into the product catalog.")
+            self.conn.create_function("canonical_name", 1, canonical_name,
+                                      deterministic=True)
+            self.conn.create_function("catalog_key", 1, catalog_key,
+                                      deterministic=True)
+            self.conn.execute(
+                "INSERT OR IGNORE INTO product_catalog (name, key) "
+                "SELECT canonical_name(product), catalog_key(product) "
+                "FROM products ORDER BY rowid;")
+            self.rebuild_products(
+                "SELECT n.filename, c.id, n.price, n.product "
+                "FROM products_names n "
+                "JOIN product_catalog c ON c.key = catalog_key(n.product) "
+                "ORDER BY n.rowid;")
+        elif columns and "name" not in columns:
+            self.log("adding line names to the products table.")
+            self.rebuild_products(
+                "SELECT n.filename, n.product_id, n.price, c.name "
+                "FROM products_names n "
+                "JOIN product_catalog c ON c.id = n.product_id "
+                "ORDER BY n.rowid;")
+        self.conn.commit()
+        self._catalog = None
+
+    def rebuild_products(self, select):
+        """Recreates the products table from the rows the select returns
+        over the old table, renamed to products_names
+        """
+        # the old table takes its triggers and indexes with it
+        self.conn.execute("ALTER TABLE products RENAME TO products_names;")
+        self.conn.execute(self.table("products").create_command)
+        self.conn.execute(f"INSERT OR IGNORE INTO products {select}")
+        self.conn.execute("DROP TABLE products_names;")
+        journal = self.conn.execute(
+            "SELECT COUNT(*) FROM sqlite_master "
+            "WHERE type = 'table' AND name = 'receipts_journal';"
+        ).fetchone()[0]
+        if journal:
+            for trigger in self.journal_triggers:
+                self.conn.execute(trigger)
+
+    def select_fingerprint(self, fingerprint, filename=None):
+        """Returns the filename of another receipt with the fingerprint
+        using the fingerprint index, or None
+        """
+        row = self.conn.execute(
+            "SELECT filename FROM receipts "
+            "WHERE fingerprint = ? AND filename IS NOT ? LIMIT 1;",
+            (fingerprint, filename)
+        ).fetchone()
+        return row[0] if row else None
+
+    def build_fingerprints(self):
+        """Adds the fingerprint column to databases built before it existed
+        and fingerprints every receipt that does not have one yet
+        """
+        columns = {c[1] for c in self.conn.execute(
+            "PRAGMA table_info(receipts);")}
+        if "fingerprint" not in columns:
+            self.log("adding fingerprint column to receipts.")
+            self.conn.execute(
+                f"ALTER TABLE receipts ADD COLUMN fingerprint {SQLType.TEXT};")
+        missing = [f for (f,) in self.conn.execute(
+            "SELECT filename FROM receipts WHERE fingerprint IS NULL;")]
+        if missing:
+            self.log(f"fingerprinting {len(missing)} receipts.")
+            self.conn.executemany(
+                "UPDATE receipts SET fingerprint = ? WHERE filename = ?;",
+                [(receipt_fingerprint(receipt), filename)
+                    for filename, receipt
+                        in self.select_receipts_for_export(missing)]
+            )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS receipts_fingerprint "
+                          "ON receipts (fingerprint);")
+        self.conn.commit()
+
+    def select_exact_duplicates(self):
+        """Returns (filenames, count) for every fingerprint shared by more
+        than one receipt
+        """
+        return self.conn.execute(
+            "SELECT group_concat(filename, ', '), COUNT(*) FROM receipts "
+            "WHERE fingerprint IS NOT NULL GROUP BY fingerprint "
+            "HAVING COUNT(*) > 1;"
+        ).fetchall()
+
+    def select_near_duplicates(self, tolerance=0):
+        """Yields (previous, filename, store, date) for receipts of the same
+        store and date whose totals are within tolerance cents
+        """
+        yield from self.conn.execute(build_near_duplicates(tolerance))
+
+    def delete_files(self, file_names):
+        """Removes receipts and their products so that changed files can be
+        inserted again. Insert commands ignore rows already in the tables.
+        """
+        files = [(fileonly(file_name)[0],) for file_name in file_names]
+        if not files:
+            return
+
+        self.log(f"deleting {len(files)} receipts from database.")
+        for table in (self.table("receipts"), self.table("products")):
+            self.conn.executemany(
+                f"DELETE FROM {table.name} WHERE filename=?;",
+                files
+            )
+        self.conn.commit()
+
+    def select_receipts_for_export(self, filenames=None,
+                                   batch_size=config.EXPORT_BATCH_SIZE):
+        """Streams every receipt and its products from a single joined query
+        instead of a products query per receipt. Rows are fetched in batches
+        and grouped by filename into (filename, receipt yaml object) tuples.
+        Products keep the name they had on the receipt. If filenames are
+        given then only those receipts are selected.
+        """
+        statement = """
+        SELECT r.filename, r.store, r.short, r.date, r.category,
+               r.subtotal, r.tax, r.total, r.payment, p.name, p.price
+        FROM receipts r
+        LEFT JOIN products p
+        ON p.filename = r.filename
+        {}
+        ORDER BY r.filename, p.rowid;
+        """[1:]
+        if filenames is None:
+            cursor = self.conn.execute(statement.format(""))
+            rows = chain.from_iterable(
+                iter(lambda: cursor.fetchmany(batch_size), [])
+            )
+        else:
+            rows = self.select_rows_in_batches(
+                statement.format("WHERE r.filename IN ({})"),
+                sorted(filenames),
+                batch_size
+            )
+        for filename, group in groupby(rows, key=itemgetter(0)):
+            products = {}
+            for row in group:
+                if row[9] is not None:
+                    products[row[9]] = Money(row[10]).dollars
+            _, store, short, date, category, *amounts = row[:9]
+            subtotal, tax, total, payment = (Money(a).dollars for a in amounts)
+            yield filename, Receipt(
+                store,
+                short,
+                parse_date_from_database(date),
+                category,
+                products,
+                subtotal,
+                tax,
+                total,
+                payment
+            )
+
+    def select_price_history(self, product=None):
+        """Yields (product, date, price, filename) rows ordered by product and
+        date. A single product is looked up through the product id index.
+        """
+        statement = """
+        SELECT c.name, r.date, p.price, p.filename
+        FROM products p
+        JOIN product_catalog c
+        ON c.id = p.product_id
+        JOIN receipts r
+        ON r.filename = p.filename
+        {}
+        ORDER BY c.name, r.date;
+        """[1:]
+        if product is None:
+            yield from self.conn.execute(statement.format(""))
+        else:
+            yield from self.query(
+                statement.format("WHERE c.key = ?"), (catalog_key(product),)
+            )
+
+    def count_receipts(self) -> int:
+        (count,), = self.query("SELECT COUNT(*) FROM receipts;")
+        return count
+
+    def select_receipt_page(self, order="date", descending=False,
+                            limit=config.RECEIPT_PAGE_SIZE, offset=0,
+                            after=None):
+        """Returns a page of receipt rows sorted on the order column. Pages
+        following a known (value, filename) key are found by seeking the
+        sort index to it instead of skipping offset rows.
+        """
+        if after is None:
+            statement = build_receipt_page(order, descending, keyed=False)
+            return self.query(statement, (limit, offset))
+        statement = build_receipt_page(order, descending)
+        return self.query(statement, (*after, limit))
+
+    def select_products_by_filename(self, filenames,
+                                    batch_size=config.EXPORT_BATCH_SIZE):
+        """Returns the filenames mapped to their (product, price) rows in
+        the order they were inserted
+        """
+        products = {filename: [] for filename in filenames}
+        rows = self.select_rows_in_batches(
+            "SELECT p.filename, c.name, p.price FROM products p "
+            "JOIN product_catalog c ON c.id = p.product_id "
+            "WHERE p.filename IN ({}) ORDER BY p.rowid;",
+            list(products),
+            batch_size
+        )
+        for filename, product, price in rows:
+            products[filename].append((product, Money(price)))
+        return products
+
+    def select_rows_in_batches(self, statement, values, batch_size):
+        """Runs a statement holding an IN clause once per batch of values so
+        that the number of parameters stays below the sqlite limit.
+        """
+        for i in range(0, len(values), batch_size):
+            batch = values[i:i+batch_size]
+            params = ', '.join('?' for _ in batch)
+            yield from self.conn.execute(statement.format(params), batch)
+
     def select_receipts(self):
         fields = "rid sid created purchased_on subtotal tax total payment rfile"
         receipttuple = namedtuple('receipt', fields)
-        cursor = self._connection.execute("SELECT * FROM receipts;")
-        for receiptobj in list(cursor):
-            print(receiptobj)
+        for receiptobj in self.query("SELECT * FROM receipts;"):
             yield receipttuple(*receiptobj)
 
     def select_store(self, store_id):
         store = namedtuple("StoreName", "store cid")
 
-        c = f"""
+        c = """
         select store, id_category
         from stores
-        where id_store = {store_id};
+        where id_store = ?;
         """[1:]
-        cursor = self._connection.execute(c)
-        for info in unpack(cursor):
+        for info in self.query(c, (store_id,)):
             return store(*info)
 
     def select_category(self, category_id):
-        c = f"select category from storecategory where id_category={category_id};"
-        cursor = self._connection.execute(c)
-        for info in unpack(cursor):
+        c = "select category from storecategory where id_category = ?;"
+        for info in self.query(c, (category_id,)):
             return info
 
     def select_from_table(self, table, fields, condition=None):
@@ -262,15 +743,14 @@ class ReceiptConnection(Connection):
 
     def select_receipt_products(self, receipt_id):
         product = namedtuple("ProductInfo", "product price")
-        c = f"""
+        c = """
         SELECT product, price 
         from receiptproducts rp 
         join products p 
         on rp.id_product = p.id_product
-        where rp.id_receiptproduct = {receipt_id};
+        where rp.id_receiptproduct = ?;
         """[1:]
-        cursor = self._connection.execute(c)
-        for info in unpack(cursor):
+        for info in self.query(c, (receipt_id,)):
             yield product(*info)
 
 class NoteConnection(Connection):
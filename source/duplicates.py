@@ -0,0 +1,93 @@
+"""duplicates.py
+Finds receipts that were saved more than once under different file names.
+
+Every receipt gets a fingerprint hashed from its normalized content:
+
+    store    => normalized store name
+    date     => iso date
+    total    => cents
+    products => sorted (normalized name, cents) pairs
+
+The fingerprint is stored in an indexed column so an exact duplicate is
+found with a single index lookup while inserting. Near duplicates, the same
+store and date with totals a few cents apart, are found by sorting each
+(store, date) bucket by total in sqlite and comparing neighbours only.
+
+    --tolerance => cents two totals may differ by to be near duplicates
+"""
+
+__author__ = "Samuel Whang"
+
+import hashlib
+
+import click
+
+import source.config as config
+import source.utils as utils
+from source.classifier import normalize
+from source.money import money
+
+
+def fingerprint(store, date, total, products) -> str:
+    """Returns the content hash of a receipt. Dates are iso strings or
+    [y, m, d] lists and amounts are dollars or Money.
+    """
+    if not isinstance(date, str):
+        date = utils.format_date(date)
+    items = sorted((normalize(p), int(money(price)))
+                      for p, price in products.items())
+    content = "|".join((
+        normalize(store),
+        date,
+        str(int(money(total))),
+        ";".join(f"{p}:{price}" for p, price in items),
+    ))
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def receipt_fingerprint(receipt) -> str:
+    return fingerprint(receipt.store, receipt.date, receipt.total,
+                       receipt.products)
+
+
+def group_pairs(pairs) -> list:
+    """Joins (filename, filename) pairs sharing a file into groups"""
+    groups = {}
+    for a, b in pairs:
+        group = groups.get(a) or groups.get(b) or []
+        for filename in (a, b):
+            if filename not in group:
+                group.append(filename)
+            groups[filename] = group
+    unique = {id(group): group for group in groups.values()}
+    return sorted(unique.values())
+
+
+def near_duplicates(database, tolerance=config.DUPLICATE_TOLERANCE) -> list:
+    """Returns groups of filenames with the same store and date whose
+    totals are within tolerance cents of the next receipt in the group
+    """
+    pairs = [(a, b) for a, b, _, _ in
+                database.select_near_duplicates(tolerance)]
+    return group_pairs(pairs)
+
+
+@click.command()
+@click.option('--tolerance', "tolerance", default=config.DUPLICATE_TOLERANCE,
+              help="cents two totals may differ by")
+def main(tolerance):
+    # the database fingerprints receipts with this module
+    from source.database import ReceiptConnection
+
+    logargs = utils.logargs(type("duplicates_main", (), dict()), __file__)
+    logger = utils.setup_logger_from_logargs(logargs)
+
+    database = ReceiptConnection(logger=logger)
+    database.build_fingerprints()
+    for filenames, count in database.select_exact_duplicates():
+        print(f"= {count} copies: {filenames}")
+    for group in near_duplicates(database, tolerance):
+        print(f"~ {', '.join(group)}")
+
+if __name__ == "__main__":
+    main()
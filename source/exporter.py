@@ -0,0 +1,304 @@
+"""exporter.py
+ReceiptExporter streams receipts out of the database from a single joined
+cursor and writes them in one of the export formats:
+
+    files => one yaml file per receipt, the same layout as the import folder.
+             Files are written by a pool of writer threads.
+    yaml  => a single multi-document yaml stream holding every receipt
+    jsonl => a single JSON Lines file with one receipt object per line
+
+Output is buffered and can optionally be gzip compressed.
+
+The files format can also be exported incrementally. A manifest saved in the
+export folder records the content hash and path of every exported receipt
+and the last change journal entry seen. Later exports only rewrite receipts
+changed in the journal since then and delete files for removed receipts.
+The journal is then compacted to the last entry of every receipt.
+"""
+
+__author__ = "Samuel Whang"
+
+import gzip
+import hashlib
+import io
+import json
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+import yaml
+
+import source.config as config
+import source.utils as utils
+from source.database import ReceiptConnection
+from source.logger import Loggable
+from source.YamlObjects import Receipt
+
+# libyaml makes serializing receipts several times faster when available
+Dumper = getattr(yaml, 'CDumper', yaml.Dumper)
+yaml.add_representer(Receipt, Receipt.to_yaml, Dumper=Dumper)
+
+
+def open_output(path: str, compress: bool = False):
+    """Returns a buffered text stream to path. Compressed streams are written
+    through gzip.
+    """
+    if compress:
+        raw = gzip.open(path, 'wb')
+        return io.TextIOWrapper(
+            io.BufferedWriter(raw, config.EXPORT_BUFFER_SIZE),
+            encoding='utf-8'
+        )
+    return open(path, 'w', buffering=config.EXPORT_BUFFER_SIZE,
+                encoding='utf-8')
+
+
+def dump_yaml(receipt: Receipt, stream=None, explicit_start=False):
+    """Serializes a receipt yaml object"""
+    return yaml.dump(receipt, stream, Dumper=Dumper,
+                     explicit_start=explicit_start)
+
+
+def write_yaml(filepath: str, receipt: Receipt, compress: bool = False) -> str:
+    """Writes a single receipt to its own yaml file. Returns the hash of the
+    written content.
+    """
+    text = dump_yaml(receipt)
+    with open_output(filepath, compress) as yamlfile:
+        yamlfile.write(text)
+    return content_hash(text)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class ReceiptExporter(Loggable):
+    """Writes every receipt in the database to the export folder"""
+    formats = config.EXPORT_FORMATS
+
+    def __init__(self, database, folder, fmt='files', compress=False,
+                 workers=config.EXPORT_WORKERS, logger=None):
+        super().__init__(self, logger=logger)
+
+        if fmt not in self.formats:
+            raise ValueError(f"Export format must be one of {self.formats}")
+
+        self.database = database
+        self.folder = folder
+        self.format = fmt
+        self.compress = compress
+        self.workers = max(workers, 1)
+        self.manifest = None
+
+    def export(self, receipts=None) -> int:
+        """Exports the receipts given or every receipt in the database.
+        Returns the number of receipts written.
+        """
+        folderpath = utils.check_or_create_folder(self.folder)
+        self.folderpath = utils.format_directory_path(folderpath)
+        if receipts is None:
+            receipts = self.database.select_receipts_for_export()
+
+        self.log(f"Begin exporting {self.format} to {self.folderpath}")
+        exported = getattr(self, f"export_{self.format}")(receipts)
+        self.log(f"Finished exporting {exported} receipts.")
+        return exported
+
+    def export_files(self, receipts) -> int:
+        """Writes one file per receipt using a pool of writer threads. Only a
+        few batches of receipts are held in memory at any time.
+        """
+        exported = 0
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for filename, receipt in receipts:
+                filepath = self.filepath(filename)
+                future = pool.submit(write_yaml, filepath, receipt,
+                                     self.compress)
+                pending.append((filename, filepath, future))
+                if len(pending) >= self.workers * config.EXPORT_BATCH_SIZE:
+                    self.record(*pending.popleft())
+                exported += 1
+            while pending:
+                self.record(*pending.popleft())
+        return exported
+
+    def filepath(self, filename, extension=config.YAML_FILE_EXTENSION) -> str:
+        """Returns the export path for a file with the gzip extension added
+        to compressed files
+        """
+        filepath = self.folderpath + filename + extension
+        if self.compress:
+            filepath += config.EXPORT_GZIP_EXTENSION
+        return filepath
+
+    def record(self, filename, filepath, future):
+        """Waits for a file to be written and saves its hash to the manifest"""
+        digest = future.result()
+        if self.manifest is not None:
+            self.manifest['files'][filename] = {
+                'hash': digest,
+                'path': os.path.basename(filepath)
+            }
+
+    def export_incremental(self) -> int:
+        """Exports only the receipts changed since the last export into the
+        folder. Falls back to a full export when no manifest was saved for
+        the folder or the manifest was written with different options.
+        Returns the number of files written or deleted.
+        """
+        if self.format != 'files':
+            raise ValueError("Incremental exports require the files format")
+
+        folderpath = utils.check_or_create_folder(self.folder)
+        self.folderpath = utils.format_directory_path(folderpath)
+        self.database.build_journal()
+
+        manifest = self.load_manifest()
+        changed, latest = self.database.select_journal_changes(
+            manifest['journal'] if manifest else 0
+        )
+
+        if not manifest:
+            self.log("No manifest found. Exporting every receipt.")
+            self.manifest = self.new_manifest()
+            exported = self.export_files(
+                self.database.select_receipts_for_export()
+            )
+        else:
+            self.manifest = manifest
+            self.log(f"{len(changed)} receipts changed since last export")
+            exported = self.export_changes(changed)
+
+        self.manifest['journal'] = latest
+        self.save_manifest()
+        compacted = self.database.compact_journal(latest)
+        if compacted:
+            self.log(f"compacted {compacted} journal entries")
+        self.log(f"Finished exporting {exported} changes.")
+        return exported
+
+    def export_changes(self, changed) -> int:
+        """Rewrites changed receipts whose content hash differs from the hash
+        in the manifest and deletes files of receipts no longer in the
+        database.
+        """
+        files = self.manifest['files']
+        written = 0
+        for filename, receipt in self.database.select_receipts_for_export(
+                filenames=changed):
+            changed.discard(filename)
+            entry = files.get(filename)
+            filepath = self.filepath(filename)
+            if entry and os.path.exists(filepath):
+                if entry['hash'] == content_hash(dump_yaml(receipt)):
+                    continue
+            digest = write_yaml(filepath, receipt, self.compress)
+            files[filename] = {
+                'hash': digest,
+                'path': os.path.basename(filepath)
+            }
+            written += 1
+
+        # anything left was removed from the database
+        deleted = 0
+        for filename in changed:
+            entry = files.pop(filename, None)
+            if not entry:
+                continue
+            filepath = self.folderpath + entry['path']
+            if os.path.exists(filepath):
+                os.remove(filepath)
+                deleted += 1
+            self.log(f"x Deleted {entry['path']}")
+
+        self.log(f"wrote {written} and deleted {deleted} files")
+        return written + deleted
+
+    def new_manifest(self) -> dict:
+        return {
+            'version': config.EXPORT_MANIFEST_VERSION,
+            'compress': self.compress,
+            'journal': 0,
+            'files': {}
+        }
+
+    def load_manifest(self):
+        """Returns the manifest saved in the export folder if it matches the
+        current export options, otherwise None.
+        """
+        path = self.folderpath + config.EXPORT_MANIFEST_NAME
+        try:
+            with open(path, 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if (manifest.get('version') != config.EXPORT_MANIFEST_VERSION
+                or manifest.get('compress') != self.compress):
+            return None
+        return manifest
+
+    def save_manifest(self):
+        """Writes the manifest to a temporary file before replacing the old
+        one so an interrupted export never leaves a partial manifest.
+        """
+        path = self.folderpath + config.EXPORT_MANIFEST_NAME
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.manifest, f, separators=(',', ':'))
+        os.replace(path + '.tmp', path)
+
+    def export_yaml(self, receipts) -> int:
+        """Writes all receipts as documents in a single yaml stream"""
+        filepath = self.filepath(config.EXPORT_STREAM_NAME)
+        exported = 0
+        with open_output(filepath, self.compress) as stream:
+            for _, receipt in receipts:
+                dump_yaml(receipt, stream, explicit_start=True)
+                exported += 1
+        return exported
+
+    def export_jsonl(self, receipts) -> int:
+        """Writes all receipts as JSON Lines keyed by their file name"""
+        filepath = self.filepath(config.EXPORT_STREAM_NAME,
+                                 config.JSONL_FILE_EXTENSION)
+        exported = 0
+        with open_output(filepath, self.compress) as stream:
+            for filename, receipt in receipts:
+                data = receipt.serialized()
+                data['filename'] = filename
+                stream.write(json.dumps(data, separators=(',', ':')))
+                stream.write('\n')
+                exported += 1
+        return exported
+
+
+@click.command()
+@click.option('-o', "folder", nargs=1, default=config.EXPORT_FOLDER,
+              help="folder to export receipts into")
+@click.option('--format', "fmt", default='files',
+              type=click.Choice(config.EXPORT_FORMATS),
+              help="one file per receipt or a single yaml/jsonl stream")
+@click.option('--gzip', "compress", is_flag=True, default=False,
+              help="compress exported files with gzip")
+@click.option('--workers', "workers", default=config.EXPORT_WORKERS,
+              help="number of writer threads for the files format")
+@click.option('--incremental', "incremental", is_flag=True, default=False,
+              help="only rewrite receipts changed since the last export")
+def main(folder, fmt, compress, workers, incremental):
+    logargs = utils.logargs(type("export_main", (), dict()), __file__)
+    logger = utils.setup_logger_from_logargs(logargs)
+
+    database = ReceiptConnection(logger=logger)
+    exporter = ReceiptExporter(database, folder, fmt, compress, workers,
+                               logger=logger)
+    if incremental:
+        exported = exporter.export_incremental()
+    else:
+        exported = exporter.export()
+    print(f"Exported {exported} receipts to {exporter.folderpath}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+"""ingest.py
+Ingestor discovers receipt yaml files under one or more source folders,
+validates them and returns the yaml objects ready to be inserted into the
+database.
+
+Each source folder is searched recursively and read in its own thread so
+slow or large folders do not hold up the others. Files with identical
+content are only ingested once no matter which folder they were found in.
+The first folder given wins when the same receipt exists in several.
+
+Every call builds an IngestReport holding the wall time spent in each stage
+(read, parse, validate, insert, check), the slowest files and the failures
+grouped by the schema rule that rejected them. Receipts whose fingerprint
+matches a stored receipt are not inserted and fail the 'fingerprint' rule.
+Inserted receipts are run through the consistency rules and any violations
+are added to the report. The report can be saved as json.
+"""
+
+__author__ = "Samuel Whang"
+
+import hashlib
+import heapq
+import json
+import logging
+import os
+import re
+import time
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import cerberus
+import yaml
+
+import source.config as config
+import source.utils as utils
+from source.consistency import ConsistencyChecker
+from source.logger import Loggable
+from source.YamlObjects import Receipt
+
+# libyaml parses files several times faster when it is available. Older
+# receipt files were saved with a lowercase tag so accept both spellings.
+Loader = getattr(yaml, 'CLoader', yaml.Loader)
+for tag in (Receipt.yaml_tag, Receipt.yaml_tag.lower()):
+    yaml.add_constructor(tag, Receipt.from_yaml, Loader=Loader)
+
+SourceFile = namedtuple("SourceFile", "path name digest data seconds")
+
+
+class IngestError(ValueError):
+    """Raised when a file fails a check. Rules holds the names of the checks
+    that failed, using schema paths like 'subtotal.type' for schema rules.
+    """
+    def __init__(self, message, rules):
+        super().__init__(message)
+        self.rules = rules
+
+
+class IngestReport:
+    """Collects timings and failures while files are ingested"""
+    stages = ("read", "parse", "validate", "insert", "check")
+
+    def __init__(self, slowest=config.INGEST_REPORT_SLOWEST):
+        self.slowest = slowest
+        self.times = dict.fromkeys(self.stages, 0.0)
+        self.file_times = defaultdict(float)
+        self.failures = defaultdict(list)
+        self.inconsistent = defaultdict(list)
+        self.files = 0
+        self.loaded = 0
+        self.duplicates = 0
+        self.inserted = 0
+
+    @contextmanager
+    def timed(self, stage, path=None):
+        """Adds the time spent inside the with block to the stage and to
+        the file if a path is given
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.times[stage] += elapsed
+            if path:
+                self.file_times[path] += elapsed
+
+    def add_failure(self, path, rules, message):
+        for rule in rules:
+            self.failures[rule].append({'file': path, 'error': message})
+
+    def add_violations(self, violations):
+        """Adds consistency violations with their amounts in cents"""
+        for v in violations:
+            self.inconsistent[v.rule].append({
+                'file': v.filename,
+                'expected': int(v.expected),
+                'actual': int(v.actual),
+            })
+
+    @property
+    def failed(self) -> int:
+        return len({f['file'] for fs in self.failures.values() for f in fs})
+
+    @property
+    def total_time(self) -> float:
+        return sum(self.times.values())
+
+    def slowest_files(self) -> list:
+        return heapq.nlargest(self.slowest, self.file_times.items(),
+                              key=lambda item: item[1])
+
+    def serialized(self) -> dict:
+        return {
+            'totals': {
+                'files': self.files,
+                'loaded': self.loaded,
+                'inserted': self.inserted,
+                'duplicates': self.duplicates,
+                'failed': self.failed,
+                'seconds': round(self.total_time, 6),
+            },
+            'stages': {k: round(v, 6) for k, v in self.times.items()},
+            'slowest': [
+                {'file': path, 'seconds': round(seconds, 6)}
+                    for path, seconds in self.slowest_files()
+            ],
+            'failures': {
+                rule: files
+                    for rule, files in sorted(self.failures.items())
+            },
+            'inconsistent': {
+                rule: files
+                    for rule, files in sorted(self.inconsistent.items())
+            },
+        }
+
+    def summary(self) -> list:
+        """Returns the report as lines of text for logging or printing"""
+        lines = [config.INGEST_REPORT_TOTALS.format(
+            self.files, self.loaded, self.duplicates, self.failed,
+            self.total_time
+        )]
+        lines.extend(config.INGEST_REPORT_STAGE.format(stage, seconds)
+                        for stage, seconds in self.times.items())
+        lines.extend(config.INGEST_REPORT_SLOW.format(seconds, path)
+                        for path, seconds in self.slowest_files())
+        lines.extend(config.INGEST_REPORT_RULE.format(rule, len(files))
+                        for rule, files in sorted(self.failures.items()))
+        lines.extend(config.INGEST_REPORT_INCONSISTENT.format(rule, len(files))
+                        for rule, files in sorted(self.inconsistent.items()))
+        return lines
+
+    def write(self, path=config.INGEST_REPORT_PATH):
+        """Saves the report as json to the given path"""
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.serialized(), f, indent=2)
+        return path
+
+
+def failed_rules(tree) -> list:
+    """Returns the schema paths of the rules failed in a cerberus document
+    error tree. Group errors are reported by the rules of their children.
+    """
+    rules, nodes = set(), [tree]
+    while nodes:
+        node = nodes.pop()
+        rules.update('.'.join(map(str, e.schema_path))
+                        for e in node.errors if not e.is_group_error)
+        nodes.extend(node.descendants.values())
+    return sorted(rules)
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+def read_source_files(root, skip=None):
+    """Reads every yaml file under root and returns them as SourceFiles
+    along with (path, IngestError) for every file that could not be read.
+    Files whose names without extension are in skip are not read.
+    """
+    files, errors = [], []
+    for entry in utils.discover_files(root, config.YAML_FILE_EXTENSION):
+        filename, _ = utils.filename_and_extension(entry.name)
+        if skip and filename in skip:
+            continue
+        start = time.perf_counter()
+        try:
+            with open(entry.path, 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            errors.append((entry.path, IngestError(str(e), ["read"])))
+            continue
+        files.append(SourceFile(entry.path, entry.name, content_hash(data),
+                                data, time.perf_counter() - start))
+    return files, errors
+
+
+class Ingestor(Loggable):
+    """Loads and validates receipt files from many source folders"""
+    def __init__(self, roots, schema_path=config.RECEIPT_SCHEMA_PATH,
+                 workers=config.INGEST_WORKERS, prices=None,
+                 check=config.INGEST_CHECK_CONSISTENCY, classifier=None,
+                 logger=None):
+        super().__init__(self, logger=logger)
+
+        if isinstance(roots, str):
+            roots = [roots]
+        self.roots = [utils.format_directory_path(r) for r in roots if r]
+        self.workers = max(workers, 1)
+
+        self.filename_regex = re.compile(config.YAML_FILE_NAME_REGEX)
+        with open(schema_path, 'r') as f:
+            self.validator = cerberus.Validator(yaml.safe_load(f))
+
+        # content hash => path of the first file seen with that content
+        self.hashes = {}
+        self.paths = {}
+
+        self.duplicates = []
+        self.failed = []
+        self.report = IngestReport()
+
+        # price history updated with every inserted receipt if given
+        self.prices = prices
+        # inserted receipts are checked against the consistency rules
+        self.check = check
+        # store names and categories are canonicalized if given
+        self.classifier = classifier
+
+    def ingest(self, skip=None) -> dict:
+        """Reads all source folders concurrently and returns a dictionary of
+        file name to receipt yaml object for every valid, unique file.
+        Names of files already in the database can be passed in with skip.
+        """
+        self.report = IngestReport()
+        if not self.roots:
+            return {}
+
+        self.log(f"Ingesting from {len(self.roots)} folders")
+        workers = min(self.workers, len(self.roots))
+        with self.report.timed("read"):
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                batches = list(pool.map(
+                    lambda root: read_source_files(root, skip),
+                    self.roots
+                ))
+        # failures are recorded here since the report is not thread safe
+        for _, errors in batches:
+            for path, error in errors:
+                self.report.files += 1
+                self.fail(path, error)
+        return self.load_source_files(
+            f for files, _ in batches for f in files)
+
+    def ingest_files(self, paths) -> dict:
+        """Reads only the given file paths. Used when watching folders"""
+        self.report = IngestReport()
+        files = []
+        for path in paths:
+            start = time.perf_counter()
+            try:
+                with self.report.timed("read"):
+                    with open(path, 'rb') as f:
+                        data = f.read()
+            except OSError as e:
+                self.report.files += 1
+                self.fail(path, IngestError(str(e), ["read"]))
+                continue
+            files.append(SourceFile(path, os.path.basename(path),
+                                    content_hash(data), data,
+                                    time.perf_counter() - start))
+        return self.load_source_files(files)
+
+    def load_source_files(self, files) -> dict:
+        """Removes duplicates then parses and validates the remaining files"""
+        report = self.report
+        yobjs = {}
+        names = {}
+        for source in files:
+            report.files += 1
+            report.file_times[source.path] += source.seconds
+            if self.duplicate(source):
+                report.duplicates += 1
+                continue
+            if source.name in names:
+                self.fail(source.path, IngestError(
+                    f"file name already used by {names[source.name]}",
+                    ["filename.unique"]
+                ))
+                continue
+            try:
+                yobjs[source.name] = self.load(source)
+            except IngestError as e:
+                self.fail(source.path, e)
+                continue
+            names[source.name] = source.path
+        report.loaded = len(yobjs)
+        self.log(f"Loaded {report.loaded} files, "
+                 f"skipped {report.duplicates} duplicates, "
+                 f"{report.failed} failed")
+        return yobjs
+
+    def insert(self, database, yobjs):
+        """Inserts loaded yaml objects into the database, timing the insert
+        as part of the current report. The price history is kept in step.
+        Receipts skipped as duplicates of a stored fingerprint are reported
+        as failures. Violations of the consistency rules by the inserted
+        receipts are logged and added to the report.
+        """
+        with self.report.timed("insert"):
+            database.insert_files(yobjs)
+            for file_name, original in database.duplicates:
+                self.report.add_failure(file_name, ["fingerprint"],
+                                        f"same receipt as {original}")
+            skipped = {file_name for file_name, _ in database.duplicates}
+            yobjs = {f: y for f, y in yobjs.items() if f not in skipped}
+            if self.prices is not None:
+                self.prices.remove_files(yobjs)
+                self.prices.add_receipts(yobjs)
+        self.report.inserted += len(yobjs)
+
+        if not self.check or not yobjs:
+            return
+        with self.report.timed("check"):
+            checker = ConsistencyChecker(database, logger=self.logger)
+            violations = checker.check(yobjs)
+        for v in violations:
+            self.log(f"! {v.filename}: {v.rule} expected {v.expected} "
+                     f"got {v.actual}", level=logging.WARNING)
+        self.report.add_violations(violations)
+
+    def duplicate(self, source) -> bool:
+        """Records the content hash of the file. Returns true if the same
+        content was already seen in another file.
+        """
+        original = self.hashes.get(source.digest)
+        if original and original != source.path:
+            self.log(f"? {source.path} duplicates {original}")
+            self.duplicates.append((source.path, original))
+            return True
+
+        # a changed file no longer holds the content it was recorded with
+        previous = self.paths.get(source.path)
+        if (previous != source.digest
+                and self.hashes.get(previous) == source.path):
+            del self.hashes[previous]
+        self.hashes[source.digest] = source.path
+        self.paths[source.path] = source.digest
+        return False
+
+    def load(self, source) -> Receipt:
+        """Validates the file name and contents and returns the yaml object"""
+        report = self.report
+        filename, _ = utils.filename_and_extension(source.name)
+        with report.timed("validate", source.path):
+            if not self.filename_regex.match(filename):
+                raise IngestError(f"Yaml Filename {filename} is invalid",
+                                  ["filename.regex"])
+
+        with report.timed("parse", source.path):
+            try:
+                yobj = yaml.load(source.data, Loader=Loader)
+            except (ValueError, yaml.YAMLError) as e:
+                raise IngestError(str(e), ["yaml"])
+
+        with report.timed("validate", source.path):
+            if not isinstance(yobj, Receipt):
+                raise IngestError(f"File data for {source.name} is not a "
+                                  "receipt", ["receipt"])
+            if not self.validator.validate(yobj.serialized()):
+                rules = failed_rules(self.validator.document_error_tree)
+                raise IngestError(f"File data for {source.name} invalid: "
+                                  f"{self.validator.errors}", rules)
+            if self.classifier is not None:
+                self.classifier.apply(yobj)
+        return yobj
+
+    def fail(self, path, error):
+        self.log(f"x {path}: {error}", level=logging.WARNING)
+        self.failed.append((path, str(error)))
+        self.report.add_failure(path, error.rules, str(error))
@@ -16,20 +16,14 @@ from faker.providers import job, phone_number
 
 from fakedata.name import SHORT_NAME_SCHEMA, Name
 from fakedata.phonenumber import PhoneNumber
+from source.classifier import default_classifier
+from source.money import Money, money
 
-Currency = Union[int, float]
-
-shortnames = {
-    'Leevers': 'Leevers',
-    'Bek Internet': 'Bek',
-}
+Currency = Union[Money, int, float]
 
 def shorten(storename):
-    store_words = storename.split()
-    for word in store_words:
-        if word in shortnames.keys():
-            return shortnames[word]
-    return storename
+    """Returns the short name given to the store by the classifier rules"""
+    return default_classifier().classify(storename).short or storename
 
 def day_month(date):
     pass
@@ -149,10 +143,7 @@ class Task:
         else:
             self.nid = Task.tid
             Task.tid += 1
-<<<<<<< HEAD
-=======
 
->>>>>>> 0839317a574efa9caf443dbb5a042d2eed3cac6f
     def display(self, x, y, mx, my, indent):
         text = textwrap.wrap(self.description, mx)
         for i, line in enumerate(text):
@@ -266,6 +257,9 @@ class Person:
 
 
 class Transaction:
+    """Amounts are kept as Money. Amounts given as plain numbers are
+    dollars and converted with money() before any arithmetic.
+    """
     properties = ["subtotal", "tax", "total", "payment"]
     def __init__(
             self, 
@@ -273,12 +267,12 @@ class Transaction:
             payment: Currency, 
             subtotal: Currency, 
             tax: Currency = 0,
-            change: Currency = 0.00):
-        self.subtotal = subtotal
-        self.total = total
-        self.payment = payment
-        self.tax = self.total - self.total
-        self.change = payment - total
+            change: Currency = 0):
+        self.subtotal = money(subtotal)
+        self.total = money(total)
+        self.payment = money(payment)
+        self.tax = money(tax)
+        self.change = self.payment - self.total
 
         if self.change < 0:
             raise ValueError('payment less than total cost')
@@ -291,7 +285,7 @@ class Product:
     def __init__(self, name: str, price: Currency):
         self.name = name
         self.name_format = '{}'
-        self.price = float(price)
+        self.price = money(price)
         self.price_format = '{:.2f}'
 
     @property
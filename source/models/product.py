@@ -5,13 +5,14 @@ __author__ = "Samuel Whang"
 # import sys
 # sys.path.append('..')
 
+from source.money import money
 from source.utils import Currency
 
 class Product:
     def __init__(self, name: str, price: Currency):
         self.name = name
         self.name_format = '{}'
-        self.price = float(price)
+        self.price = money(price)
         self.price_format = '{:.2f}'
 
     def __repr__(self):
@@ -0,0 +1,134 @@
+"""money.py
+Money holds an amount as a whole number of cents. Sums of integers are exact
+so totals never collect floating point rounding errors, and integer columns
+are cheaper for sqlite to aggregate and index than REAL columns.
+
+Receipt yaml files keep their amounts in dollars. Conversion happens only at
+that boundary: from_dollars reads the decimal digits of a yaml float, so a
+value like 0.29 becomes exactly 29 cents, and dollars converts back to the
+float yaml writes out unchanged. Plain numbers are only ever dollars, so
+Money is added to and subtracted from other Money, never bare numbers.
+"""
+
+__author__ = "Samuel Whang"
+
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+CENT = Decimal("0.01")
+
+
+class Money(int):
+    """An integer number of cents"""
+    __slots__ = ()
+
+    @classmethod
+    def from_dollars(cls, amount) -> 'Money':
+        """Converts a dollar amount given as an int, float, string or Decimal
+        into cents. Fractions of a cent are rounded half up.
+        """
+        if isinstance(amount, Money):
+            return amount
+        if isinstance(amount, bool):
+            raise TypeError(f"{amount!r} is not a dollar amount")
+        try:
+            dollars = Decimal(str(amount).strip().lstrip('$').replace(',', ''))
+        except InvalidOperation:
+            raise ValueError(f"{amount!r} is not a dollar amount")
+        if not dollars.is_finite():
+            raise ValueError(f"{amount!r} is not a dollar amount")
+        return cls(int(dollars.quantize(CENT, rounding=ROUND_HALF_UP) * 100))
+
+    @property
+    def cents(self) -> int:
+        return int(self)
+
+    @property
+    def dollars(self) -> float:
+        """Returns the amount as the float written to yaml files"""
+        return int(self) / 100
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({int(self)})"
+
+    def __str__(self) -> str:
+        sign = '-' if self < 0 else ''
+        dollars, cents = divmod(abs(int(self)), 100)
+        return f"{sign}${dollars}.{cents:02d}"
+
+    def __format__(self, spec) -> str:
+        """Format specs apply to the dollar amount, eg. '{:>10.2f}'"""
+        if not spec:
+            return str(self)
+        return format(self.dollars, spec)
+
+    @staticmethod
+    def operand(other):
+        """Returns the cents of a Money amount added to or subtracted from
+        Money. Plain numbers would be read as dollars by money() but as cents
+        by int, so they are rejected. Zero is allowed for sum() to start from.
+        """
+        if isinstance(other, Money):
+            return int(other)
+        if isinstance(other, bool) or not isinstance(other, (int, float,
+                                                             Decimal)):
+            return None
+        if other == 0:
+            return 0
+        raise TypeError(f"cannot add {other!r} to Money, convert dollars "
+                        "with money() first")
+
+    def __add__(self, other):
+        cents = self.operand(other)
+        if cents is None:
+            return NotImplemented
+        return Money(int(self) + cents)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        cents = self.operand(other)
+        if cents is None:
+            return NotImplemented
+        return Money(int(self) - cents)
+
+    def __rsub__(self, other):
+        cents = self.operand(other)
+        if cents is None:
+            return NotImplemented
+        return Money(cents - int(self))
+
+    def __mul__(self, other):
+        """Multiplies by a quantity. Fractions of a cent are rounded half
+        up.
+        """
+        if isinstance(other, int):
+            return Money(int(self) * int(other))
+        if isinstance(other, (float, Decimal)):
+            cents = (Decimal(int(self)) * Decimal(str(other))).quantize(
+                Decimal(1), rounding=ROUND_HALF_UP)
+            return Money(int(cents))
+        return NotImplemented
+
+    __rmul__ = __mul__
+
+    def __neg__(self):
+        return Money(-int(self))
+
+    def __abs__(self):
+        return Money(abs(int(self)))
+
+
+def money(amount) -> Money:
+    """Returns amount as Money. Amounts that are not Money yet are dollars."""
+    return Money.from_dollars(amount)
+
+
+def total(amounts) -> Money:
+    """Exact sum of dollar or Money amounts"""
+    return sum((money(a) for a in amounts), Money(0))
+
+
+if __name__ == "__main__":
+    print(repr(money(0.29)), money(0.29), money("1,234.5"))
+    print(total([0.1, 0.2]), total([0.1, 0.2]).dollars)
+    print(f"{money(73.59):>10.2f}")
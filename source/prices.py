@@ -0,0 +1,250 @@
+"""prices.py
+PriceHistory indexes the price of every product over time. Each product has
+a PriceSeries holding parallel arrays of day numbers and prices in cents
+kept sorted by day, so the latest price, the min/max over a date range and
+the rolling mean are found with a binary search instead of scanning the
+products table.
+
+The history is loaded from the database once and then updated as receipts
+are ingested.
+"""
+
+__author__ = "Samuel Whang"
+
+import datetime
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, namedtuple
+from itertools import accumulate
+
+import source.config as config
+from source.catalog import canonical_name, catalog_key
+from source.money import Money, money
+
+PricePoint = namedtuple("PricePoint", "date price filename")
+
+SPARK = " .:-=+*#"
+
+
+def day_number(date) -> int:
+    """Returns the ordinal day of a [y, m, d] list, iso string or date"""
+    if isinstance(date, str):
+        date = datetime.date.fromisoformat(date)
+    elif not isinstance(date, datetime.date):
+        date = datetime.date(*date)
+    return date.toordinal()
+
+
+def day_date(day: int) -> datetime.date:
+    return datetime.date.fromordinal(day)
+
+
+class PriceSeries:
+    """Prices of a single product sorted by the day they were paid"""
+    def __init__(self):
+        self.days = array('l')
+        self.prices = array('q')
+        self.filenames = []
+        self._sums = None
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def add(self, day: int, price: int, filename=None):
+        """Inserts a price keeping the arrays sorted. Prices arriving in date
+        order are appended.
+        """
+        if not self.days or day >= self.days[-1]:
+            index = len(self.days)
+        else:
+            index = bisect_right(self.days, day)
+        self.days.insert(index, day)
+        self.prices.insert(index, price)
+        self.filenames.insert(index, filename)
+        self._sums = None
+
+    def remove(self, filename) -> int:
+        """Removes every price that came from the file"""
+        keep = [i for i, f in enumerate(self.filenames) if f != filename]
+        removed = len(self.filenames) - len(keep)
+        if removed:
+            self.days = array('l', (self.days[i] for i in keep))
+            self.prices = array('q', (self.prices[i] for i in keep))
+            self.filenames = [self.filenames[i] for i in keep]
+            self._sums = None
+        return removed
+
+    def bounds(self, start=None, end=None):
+        """Returns the index range of the days between start and end
+        inclusive
+        """
+        lo = 0 if start is None else bisect_left(self.days, start)
+        hi = len(self.days) if end is None else bisect_right(self.days, end)
+        return lo, hi
+
+    @property
+    def sums(self):
+        """Prefix sums of prices. Rebuilt only after the series changes."""
+        if self._sums is None:
+            self._sums = array('q', accumulate(self.prices, initial=0))
+        return self._sums
+
+    def latest(self, end=None):
+        _, hi = self.bounds(end=end)
+        if not hi:
+            return None
+        return PricePoint(day_date(self.days[hi-1]), Money(self.prices[hi-1]),
+                          self.filenames[hi-1])
+
+    def minimum(self, start=None, end=None):
+        lo, hi = self.bounds(start, end)
+        return Money(min(self.prices[lo:hi])) if hi > lo else None
+
+    def maximum(self, start=None, end=None):
+        lo, hi = self.bounds(start, end)
+        return Money(max(self.prices[lo:hi])) if hi > lo else None
+
+    def mean(self, start=None, end=None):
+        """Mean price in cents between the days"""
+        lo, hi = self.bounds(start, end)
+        if hi <= lo:
+            return None
+        return (self.sums[hi] - self.sums[lo]) / (hi - lo)
+
+    def rolling_mean(self, days: int):
+        """Returns (date, mean price in cents) for every price where the mean
+        is over the prices paid in the days leading up to and including it
+        """
+        sums = self.sums
+        means = []
+        for hi, day in enumerate(self.days, 1):
+            lo = bisect_left(self.days, day - days + 1, 0, hi)
+            means.append((day_date(day), (sums[hi] - sums[lo]) / (hi - lo)))
+        return means
+
+    def points(self, start=None, end=None):
+        lo, hi = self.bounds(start, end)
+        for i in range(lo, hi):
+            yield PricePoint(day_date(self.days[i]), Money(self.prices[i]),
+                             self.filenames[i])
+
+
+class PriceHistory:
+    """Maps product names to their PriceSeries. Spellings of a product that
+    share a catalog key share a series named by the catalog's display name.
+    """
+    def __init__(self, catalog=None):
+        self.series = {}
+        # filename => products bought on that receipt
+        self.files = defaultdict(set)
+        self.catalog = catalog
+        # catalog key => display name
+        self.names = {}
+
+    def __contains__(self, product) -> bool:
+        return self.names.get(catalog_key(product)) in self.series
+
+    def __getitem__(self, product) -> PriceSeries:
+        return self.series[self.names.get(catalog_key(product))]
+
+    def __len__(self) -> int:
+        return len(self.series)
+
+    @classmethod
+    def from_database(cls, database):
+        """Builds the history from a single query ordered by product and date
+        so every series is filled by appending
+        """
+        history = cls(database.catalog)
+        for product, date, price, filename in database.select_price_history():
+            history.add(product, date, price, filename)
+        return history
+
+    def products(self):
+        return sorted(self.series)
+
+    def name(self, product) -> str:
+        """Returns the display name of a product, from the catalog when it
+        holds the product
+        """
+        key = catalog_key(product)
+        name = self.names.get(key)
+        if name is None:
+            if self.catalog is not None:
+                name = self.catalog.name(product)
+            name = self.names[key] = name or canonical_name(product)
+        return name
+
+    def add(self, product, date, price, filename=None):
+        """Adds a price in cents paid on the date"""
+        product = self.name(product)
+        series = self.series.get(product)
+        if series is None:
+            series = self.series[product] = PriceSeries()
+        series.add(day_number(date), int(price), filename)
+        if filename:
+            self.files[filename].add(product)
+
+    def add_receipts(self, yaml_objs: dict):
+        """Adds the product prices of ingested receipt yaml objects keyed by
+        their file names
+        """
+        for file_name, receipt in yaml_objs.items():
+            filename = file_name.rsplit('.', 1)[0]
+            for product, price in receipt.products.items():
+                self.add(product, receipt.date, money(price), filename)
+
+    def remove_files(self, file_names):
+        """Removes prices of receipts that are deleted or about to be
+        inserted again
+        """
+        for file_name in file_names:
+            filename = file_name.rsplit('.', 1)[0]
+            for product in self.files.pop(filename, ()):
+                series = self.series[product]
+                series.remove(filename)
+                if not series:
+                    del self.series[product]
+
+    def detail(self, product, days=config.PRICE_WINDOW_DAYS):
+        product = self.name(product)
+        return ProductDetail(product, self.series[product], days)
+
+
+class ProductDetail:
+    """Display model summarizing the price history of one product"""
+    def __init__(self, product, series, days=config.PRICE_WINDOW_DAYS):
+        self.product = product
+        self.series = series
+        self.days = days
+
+    def lines(self):
+        latest = self.series.latest()
+        if not latest:
+            return [self.product, "No prices recorded"]
+        end = day_number(latest.date)
+        start = end - self.days + 1
+        mean = self.series.mean(start, end)
+        prices = self.series.prices
+        low, high = min(prices), max(prices)
+        scale = (high - low) or 1
+        spark = ''.join(SPARK[(p - low) * (len(SPARK) - 1) // scale]
+                            for p in prices[-config.PRICE_SPARK_LENGTH:])
+        return [
+            self.product,
+            "",
+            f"latest   {latest.price:>10.2f} on {latest.date.isoformat()}",
+            f"low      {self.series.minimum(start, end):>10.2f}",
+            f"high     {self.series.maximum(start, end):>10.2f}",
+            f"mean     {mean / 100:>10.2f} over {self.days} days",
+            f"all time {Money(low):>10.2f} - {Money(high):.2f} "
+            f"({len(self.series)} prices)",
+            "",
+            spark,
+        ]
+
+    def display(self, x, y, mx, my, indent):
+        for i, line in enumerate(self.lines()):
+            if y + i > my - 2:
+                return
+            yield y + i, x, line[:mx - 2]
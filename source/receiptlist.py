@@ -0,0 +1,250 @@
+"""receiptlist.py
+Display models for browsing every receipt in the database without loading
+them all into memory.
+
+    ReceiptPages  => sequence of receipt rows loaded one page at a time
+    ReceiptDetail => products of the selected receipt and its neighbours
+    ReceiptTotals => footer totals read from the monthly summary table
+
+ReceiptPages can be handed to a ScrollableWindow as its data since the
+window only asks for the length and the rows it draws. Pages that follow a
+loaded page are found by seeking the sort index past its last row, so
+scrolling costs the same at the end of the list as at the start.
+"""
+
+__author__ = "Samuel Whang"
+
+from collections import OrderedDict, namedtuple
+from collections.abc import Sequence
+
+import source.config as config
+from source.money import Money
+from source.schema import RECEIPT_ORDERS, RECEIPT_PAGE_COLUMNS
+
+ReceiptRow = namedtuple("ReceiptRow", RECEIPT_PAGE_COLUMNS)
+
+
+def receipt_label(row) -> str:
+    return f"{row.date} {Money(row.total):>9.2f} {row.store}"
+
+
+class ReceiptPages(Sequence):
+    """Receipts sorted on one of the RECEIPT_ORDERS columns. The most
+    recently used pages are kept in memory.
+    """
+    def __init__(self, database, order="date", descending=False,
+                 page_size=config.RECEIPT_PAGE_SIZE,
+                 cached=config.RECEIPT_PAGES_CACHED):
+        if order not in RECEIPT_ORDERS:
+            raise ValueError(f"cannot sort receipts by {order!r}")
+        self.database = database
+        self.order = order
+        self.descending = descending
+        self.page_size = page_size
+        self.cached = cached
+        self.pages = OrderedDict()
+        self.count = None
+
+    def __len__(self) -> int:
+        if self.count is None:
+            self.count = self.database.count_receipts()
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("receipt index out of range")
+        number, offset = divmod(index, self.page_size)
+        return self.page(number)[offset]
+
+    def page(self, number) -> tuple:
+        rows = self.pages.get(number)
+        if rows is not None:
+            self.pages.move_to_end(number)
+            return rows
+
+        previous = self.pages.get(number - 1)
+        if previous:
+            last = previous[-1]
+            rows = self.database.select_receipt_page(
+                self.order, self.descending, self.page_size,
+                after=(getattr(last, self.order), last.filename)
+            )
+        else:
+            rows = self.database.select_receipt_page(
+                self.order, self.descending, self.page_size,
+                offset=number * self.page_size
+            )
+        rows = tuple(ReceiptRow(*row) for row in rows)
+        self.pages[number] = rows
+        if len(self.pages) > self.cached:
+            self.pages.popitem(last=False)
+        return rows
+
+    def sort(self, order=None, descending=None):
+        if order is not None:
+            if order not in RECEIPT_ORDERS:
+                raise ValueError(f"cannot sort receipts by {order!r}")
+            self.order = order
+        if descending is not None:
+            self.descending = descending
+        self.refresh()
+
+    def next_order(self):
+        """Sorts on the next column in RECEIPT_ORDERS"""
+        index = RECEIPT_ORDERS.index(self.order)
+        self.sort(RECEIPT_ORDERS[(index + 1) % len(RECEIPT_ORDERS)])
+
+    def refresh(self):
+        """Drops loaded pages after receipts were added or removed"""
+        self.pages.clear()
+        self.count = None
+
+    @property
+    def labels(self):
+        return ReceiptLabels(self)
+
+
+class ReceiptLabels(Sequence):
+    """Single line labels of the receipt rows for list windows"""
+    def __init__(self, pages):
+        self.pages = pages
+
+    def __len__(self) -> int:
+        return len(self.pages)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [receipt_label(row) for row in self.pages[index]]
+        return receipt_label(self.pages[index])
+
+
+class ReceiptDetail:
+    """Shows the selected receipt with its products. Products are selected
+    for the receipts on either side of the selection in the same query so
+    scrolling through the list only queries every few rows.
+    """
+    def __init__(self, database, pages, prefetch=config.RECEIPT_PREFETCH,
+                 cached=config.RECEIPT_DETAILS_CACHED):
+        self.database = database
+        self.pages = pages
+        self.prefetch = prefetch
+        self.cached = cached
+        # filename => [(product, price)]
+        self.products = OrderedDict()
+        self.index = -1
+        # product of the selected receipt whose prices are shown
+        self.product = -1
+
+    def select(self, index):
+        self.index = index
+        self.product = -1
+        if 0 <= index < len(self.pages):
+            self.load(index)
+
+    def next_product(self):
+        """Selects the next product of the receipt, wrapping around, and
+        returns its name. Returns None when no receipt is selected.
+        """
+        row = self.row
+        if row is None:
+            return None
+        self.load(self.index)
+        products = self.products[row.filename]
+        if not products:
+            return None
+        self.product = (self.product + 1) % len(products)
+        return products[self.product][0]
+
+    def load(self, index):
+        filename = self.pages[index].filename
+        if filename in self.products:
+            self.products.move_to_end(filename)
+            return
+        lo = max(index - self.prefetch, 0)
+        hi = index + self.prefetch + 1
+        missing = [row.filename for row in self.pages[lo:hi]
+                      if row.filename not in self.products]
+        self.products.update(self.database.select_products_by_filename(missing))
+        self.products.move_to_end(filename)
+        while len(self.products) > self.cached:
+            self.products.popitem(last=False)
+
+    @property
+    def row(self):
+        if 0 <= self.index < len(self.pages):
+            return self.pages[self.index]
+        return None
+
+    def refresh(self):
+        self.products.clear()
+        self.select(min(self.index, len(self.pages) - 1))
+
+    def lines(self):
+        row = self.row
+        if row is None:
+            return ["No receipt selected"]
+        self.load(self.index)
+        lines = [
+            f"{row.store} ({row.short})",
+            f"{row.date} {row.category} {row.filename}",
+            "",
+        ]
+        lines.extend(
+            f"{'> ' + product if i == self.product else product:<24}"
+            f"{price:>10.2f}"
+                for i, (product, price) in enumerate(
+                    self.products[row.filename])
+        )
+        lines.extend([
+            "",
+            f"{'subtotal':<24}{Money(row.subtotal):>10.2f}",
+            f"{'tax':<24}{Money(row.tax):>10.2f}",
+            f"{'total':<24}{Money(row.total):>10.2f}",
+            f"{'payment':<24}{Money(row.payment):>10.2f}",
+        ])
+        return lines
+
+    def display(self, x, y, mx, my, indent):
+        for i, line in enumerate(self.lines()):
+            if y + i > my - 2:
+                return
+            yield y + i, x, line[:mx - 2]
+
+
+class ReceiptTotals:
+    """Footer totals for all receipts and the month of the selected one"""
+    def __init__(self, database, pages, detail, summary="receipts_monthly"):
+        self.database = database
+        self.pages = pages
+        self.detail = detail
+        self.summary = summary
+
+    def totals(self, start=None, end=None):
+        """Returns the receipt count and total cents between periods"""
+        count, cents = 0, 0
+        for _, _, _, receipts, total in self.database.select_summary(
+                self.summary, start, end):
+            count += receipts
+            cents += total
+        return count, Money(cents)
+
+    def lines(self):
+        count, cents = self.totals()
+        order = f"{self.pages.order} {'desc' if self.pages.descending else 'asc'}"
+        line = f"{count} receipts {cents:.2f} | sorted by {order}"
+        row = self.detail.row
+        if row is not None:
+            month = row.date[:7]
+            count, cents = self.totals(month, month)
+            line = f"{line} | {month} {count} receipts {cents:.2f}"
+        return [line]
+
+    def display(self, x, y, mx, my, indent):
+        for i, line in enumerate(self.lines()):
+            if y + i > my:
+                return
+            yield y + i, x, line[:mx - 2]
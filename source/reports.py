@@ -0,0 +1,283 @@
+"""reports.py
+SpendingReport loads every receipt in the database into NumPy arrays once
+and computes its summaries with vectorized group-bys:
+
+    dates      => day numbers since the unix epoch
+    amounts    => integer cents as stored so sums are exact
+    store and category names => integer codes into label arrays
+
+Totals by month, category and store and the daily moving average are all
+computed with bincount over those codes instead of looping over receipts in
+python. Products are summed per catalog id by sqlite and ranked with
+argpartition.
+"""
+
+__author__ = "Samuel Whang"
+
+import time
+
+import click
+import numpy as np
+
+import source.config as config
+import source.utils as utils
+from source.database import ReceiptConnection
+from source.logger import Loggable
+
+
+# sqlite converts dates to epoch day numbers. Amounts are stored in cents.
+# Products are summed per catalog id by sqlite from the (product_id, price)
+# index since only their totals are reported.
+RECEIPT_COLUMNS = """
+SELECT CAST(julianday(date) - 2440587.5 AS INTEGER),
+       total,
+       store,
+       category
+FROM receipts;
+"""[1:]
+
+PRODUCT_TOTALS = """
+SELECT c.name, t.total, t.count
+FROM (SELECT product_id, SUM(price) AS total, COUNT(*) AS count
+      FROM products
+      GROUP BY product_id) t
+JOIN product_catalog c
+ON c.id = t.product_id;
+"""[1:]
+
+RECEIPT_DTYPE = np.dtype([
+    ('day', np.int64),
+    ('cents', np.int64),
+    ('store', np.int64),
+    ('category', np.int64),
+])
+
+
+def to_days(dates) -> np.ndarray:
+    """Converts iso date strings to day numbers since the unix epoch"""
+    return np.asarray(dates, dtype='datetime64[D]').astype(np.int64)
+
+
+def encode(labels):
+    """Returns the sorted unique labels and the integer code of each label"""
+    return np.unique(np.asarray(labels, dtype=object), return_inverse=True)
+
+
+def select_receipts(database):
+    """Returns the receipt array and the store and category labels. Codes
+    are given to labels in the order they are first seen.
+    """
+    stores, categories = {}, {}
+    rows = (
+        (day, cents, stores.setdefault(store, len(stores)),
+         categories.setdefault(category, len(categories)))
+            for day, cents, store, category
+                in database.conn.execute(RECEIPT_COLUMNS)
+    )
+    receipts = np.fromiter(rows, dtype=RECEIPT_DTYPE)
+    return (receipts, np.array(list(stores), dtype=object),
+            np.array(list(categories), dtype=object))
+
+
+def select_product_totals(database):
+    """Returns the product labels with their total cents and counts"""
+    rows = database.conn.execute(PRODUCT_TOTALS).fetchall()
+    products, totals, counts = zip(*rows) if rows else ([], [], [])
+    return (np.array(products, dtype=object),
+            np.array(totals, dtype=np.int64),
+            np.array(counts, dtype=np.int64))
+
+
+def group_sum(codes, cents, groups) -> np.ndarray:
+    """Sums cents for every group code. Sums are exact while they stay below
+    2**53 cents.
+    """
+    sums = np.bincount(codes, weights=cents, minlength=groups)
+    return np.rint(sums).astype(np.int64)
+
+
+def moving_average(values, window) -> np.ndarray:
+    """Returns the trailing mean over window values. The first few values are
+    averaged over as many values as exist so far.
+    """
+    if not len(values):
+        return np.zeros(0)
+    sums = np.cumsum(values, dtype=np.float64)
+    sums[window:] = sums[window:] - sums[:-window]
+    counts = np.minimum(np.arange(1, len(values) + 1), window)
+    return sums / counts
+
+
+def dollars(cents) -> str:
+    return f"{cents / 100:>10,.2f}"
+
+
+class SpendingReport(Loggable):
+    """Spending totals computed from receipt and product arrays.
+
+    receipts is a RECEIPT_DTYPE array whose store and category codes index
+    into the stores and categories labels. Product totals and counts line up
+    with the products labels.
+    """
+    def __init__(self, receipts, stores, categories, products,
+                 product_totals, product_counts,
+                 window=config.REPORT_MOVING_DAYS,
+                 top=config.REPORT_TOP_PRODUCTS, logger=None):
+        super().__init__(self, logger=logger)
+
+        self.window = window
+        self.top = top
+
+        start = time.perf_counter()
+        self.days = receipts['day']
+        self.cents = receipts['cents']
+        self.stores = stores
+        self.store_codes = receipts['store']
+        self.categories = categories
+        self.category_codes = receipts['category']
+        self.products = products
+        self.product_totals = product_totals
+        self.product_counts = product_counts
+
+        self.compute()
+        self.seconds = time.perf_counter() - start
+        self.log(f"Computed report for {self.count} receipts and "
+                 f"{len(self.products)} products in {self.seconds:.3f}s")
+
+    @classmethod
+    def from_database(cls, database, **kwargs):
+        """Selects the report arrays with one query per table"""
+        return cls(*select_receipts(database),
+                   *select_product_totals(database),
+                   **kwargs)
+
+    @classmethod
+    def from_rows(cls, receipts, products, **kwargs):
+        """Builds a report from (store, category, iso date, total) and
+        (product, price) rows with amounts in cents
+        """
+        receipts, products = list(receipts), list(products)
+        stores, categories, dates, totals = (
+            zip(*receipts) if receipts else ([], [], [], [])
+        )
+        productnames, prices = zip(*products) if products else ([], [])
+
+        rarray = np.zeros(len(receipts), dtype=RECEIPT_DTYPE)
+        rarray['day'] = to_days(dates)
+        rarray['cents'] = np.asarray(totals, dtype=np.int64)
+        stores, rarray['store'] = encode(stores)
+        categories, rarray['category'] = encode(categories)
+
+        productnames, codes = encode(productnames)
+        return cls(
+            rarray,
+            stores,
+            categories,
+            productnames,
+            group_sum(codes, np.asarray(prices, dtype=np.int64),
+                      len(productnames)),
+            np.bincount(codes, minlength=len(productnames)),
+            **kwargs
+        )
+
+    def compute(self):
+        self.total = int(self.cents.sum())
+        self.count = len(self.cents)
+
+        self.store_totals = group_sum(self.store_codes, self.cents,
+                                      len(self.stores))
+        self.category_totals = group_sum(self.category_codes, self.cents,
+                                         len(self.categories))
+
+        months = self.days.astype('datetime64[D]').astype('datetime64[M]')
+        self.months, month_codes = np.unique(months, return_inverse=True)
+        self.month_totals = group_sum(month_codes, self.cents,
+                                      len(self.months))
+
+        # daily totals over every day in range so the average is over time
+        if self.count:
+            self.first_day = int(self.days.min())
+            daily = group_sum(self.days - self.first_day, self.cents,
+                              int(self.days.max()) - self.first_day + 1)
+        else:
+            self.first_day = 0
+            daily = np.zeros(0, dtype=np.int64)
+        self.daily_totals = daily
+        self.daily_average = moving_average(daily, self.window)
+
+    def ranked(self, totals, n=None):
+        """Returns the indices of the n largest totals in descending order"""
+        n = min(n or len(totals), len(totals))
+        if n < len(totals):
+            indices = np.argpartition(-totals, n - 1)[:n]
+        else:
+            indices = np.arange(len(totals))
+        return indices[np.argsort(-totals[indices], kind='stable')]
+
+    def by_month(self):
+        return [(str(m), int(t)) for m, t in zip(self.months, self.month_totals)]
+
+    def by_category(self):
+        return [(self.categories[i], int(self.category_totals[i]))
+                    for i in self.ranked(self.category_totals)]
+
+    def by_store(self):
+        return [(self.stores[i], int(self.store_totals[i]))
+                    for i in self.ranked(self.store_totals)]
+
+    def top_products(self, n=None):
+        """Returns (product, total cents, times bought) for the products with
+        the highest spend
+        """
+        return [
+            (self.products[i], int(self.product_totals[i]),
+             int(self.product_counts[i]))
+                for i in self.ranked(self.product_totals, n or self.top)
+        ]
+
+    def moving_average(self):
+        """Returns (iso date, average cents per day) for every day in range"""
+        days = np.arange(len(self.daily_average)) + self.first_day
+        return list(zip(days.astype('datetime64[D]').astype(str).tolist(),
+                        self.daily_average.tolist()))
+
+    def lines(self):
+        """Returns the report as lines of text"""
+        lines = [f"{self.count} receipts {dollars(self.total)}", ""]
+        lines.append("month")
+        lines.extend(f"  {m:<20}{dollars(t)}" for m, t in self.by_month())
+        lines.append("category")
+        lines.extend(f"  {c:<20}{dollars(t)}" for c, t in self.by_category())
+        lines.append("store")
+        lines.extend(f"  {s:<20}{dollars(t)}" for s, t in self.by_store())
+        lines.append(f"top {self.top} products")
+        lines.extend(f"  {p:<20}{dollars(t)} x{c}"
+                        for p, t, c in self.top_products())
+        if len(self.daily_average):
+            lines.append(f"{self.window} day average "
+                         f"{dollars(self.daily_average[-1])}")
+        return lines
+
+    def display(self, x, y, mx, my, indent):
+        for i, line in enumerate(self.lines()):
+            if y + i > my - 2:
+                return
+            yield y + i, x, line[:mx - 2]
+
+
+@click.command()
+@click.option('--top', "top", default=config.REPORT_TOP_PRODUCTS,
+              help="number of products to list")
+@click.option('--window', "window", default=config.REPORT_MOVING_DAYS,
+              help="days in the moving average")
+def main(top, window):
+    logargs = utils.logargs(type("reports_main", (), dict()), __file__)
+    logger = utils.setup_logger_from_logargs(logargs)
+
+    database = ReceiptConnection(logger=logger)
+    report = SpendingReport.from_database(database, window=window, top=top,
+                                          logger=logger)
+    print("\n".join(report.lines()))
+
+if __name__ == "__main__":
+    main()
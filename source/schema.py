@@ -106,7 +106,11 @@ class Table:
         
 
 def build_receipts_table():
-    """Pre-specified table information used in creating a table object"""
+    """
+    Pre-specified table information used in creating a table object. Money
+    columns hold integer cents. The fingerprint is a hash of the normalized
+    receipt content used to find the same receipt saved twice.
+    """
     return Table("receipts",
                  [
                     ("filename", SQLType.TEXT),
@@ -114,20 +118,240 @@ def build_receipts_table():
                     ("short", SQLType.TEXT),
                     ("date", SQLType.VARCHAR(10)), 
                     ("category", SQLType.VARCHAR()),
-                    ("subtotal", SQLType.REAL),
-                    ("tax", SQLType.REAL),
-                    ("total", SQLType.REAL),
-                    ("payment", SQLType.REAL)
+                    ("subtotal", SQLType.INT),
+                    ("tax", SQLType.INT),
+                    ("total", SQLType.INT),
+                    ("payment", SQLType.INT),
+                    ("fingerprint", SQLType.TEXT)
                  ], unique=["filename",])
 
 def build_products_table():
-    """Pre-specified table information used in creating a table object"""
+    """
+    Pre-specified table information used in creating a table object. Prices
+    are integer cents. Products are ids into the product catalog and name is
+    the spelling on the receipt, so lines interned to the same id at the
+    same price are still stored apart.
+    """
     return Table("products", 
                  [
                     ("filename", SQLType.TEXT),
-                    ("product", SQLType.VARCHAR()),
-                    ("price", SQLType.REAL)
-                 ], unique=["filename", "product", "price"])
+                    ("product_id", SQLType.INT),
+                    ("price", SQLType.INT),
+                    ("name", SQLType.TEXT)
+                 ], unique=["filename", "product_id", "price", "name"])
+
+def build_catalog_table():
+    """
+    Product names interned to integer ids. Key is the case folded name
+    names are looked up by and name is the first spelling seen.
+    """
+    return Table("product_catalog",
+                 [
+                    ("id", f"{SQLType.INT} PRIMARY KEY"),
+                    ("name", SQLType.TEXT),
+                    ("key", SQLType.TEXT)
+                 ], unique=["key",])
+
+RECEIPT_ORDERS = ("date", "store", "total")
+
+RECEIPT_PAGE_COLUMNS = ("filename", "store", "short", "date", "category",
+                        "subtotal", "tax", "total", "payment")
+
+def build_indexes() -> list:
+    """Returns create index commands for lookups not covered by the unique
+    constraints. Product prices are looked up and summed per product id from
+    the index alone. Receipts are paged in every sort order by walking an
+    index ending in filename so each row has a unique position.
+    """
+    return [
+        "CREATE INDEX IF NOT EXISTS products_product_price "
+        "ON products (product_id, price);",
+        *(f"CREATE INDEX IF NOT EXISTS receipts_{order} "
+          f"ON receipts ({order}, filename);" for order in RECEIPT_ORDERS),
+        "CREATE INDEX IF NOT EXISTS receipts_fingerprint "
+        "ON receipts (fingerprint);",
+    ]
+
+def build_receipt_page(order="date", descending=False, keyed=True) -> str:
+    """
+    Returns a select command for a page of receipts sorted on the order
+    column with filename breaking ties. Keyed pages start after the
+    (order, filename) key of the last row of the previous page and take
+    (value, filename, limit) parameters. Other pages take (limit, offset).
+    """
+    if order not in RECEIPT_ORDERS:
+        raise ValueError(f"cannot sort receipts by {order!r}")
+    direction, compare = ("DESC", "<") if descending else ("ASC", ">")
+    columns = ', '.join(RECEIPT_PAGE_COLUMNS)
+    where = f"WHERE ({order}, filename) {compare} (?, ?) " if keyed else ""
+    limit = "LIMIT ?" if keyed else "LIMIT ? OFFSET ?"
+    return (f"SELECT {columns} FROM receipts {where}"
+            f"ORDER BY {order} {direction}, filename {direction} {limit};")
+
+def build_journal_table():
+    """Pre-specified table information used in creating a table object"""
+    return Table("receipts_journal",
+                 [
+                    ("seq", f"{SQLType.INT} PRIMARY KEY AUTOINCREMENT"),
+                    ("filename", SQLType.TEXT),
+                    ("action", SQLType.VARCHAR(6))
+                 ])
+
+def build_journal_triggers(journal="receipts_journal",
+                           tables=("receipts", "products")) -> list:
+    """
+    Returns create trigger commands that record the filename of every row
+    inserted, updated or deleted in the given tables into the journal table
+    """
+    commands = []
+    for table in tables:
+        for action, rows in (("insert", ("NEW",)),
+                             ("update", ("OLD", "NEW")),
+                             ("delete", ("OLD",))):
+            inserts = " ".join(
+                f"INSERT INTO {journal} (filename, action) "
+                f"VALUES ({row}.filename, '{action}');"
+                    for row in rows
+            )
+            commands.append(
+                f"CREATE TRIGGER IF NOT EXISTS {table}_journal_{action} "
+                f"AFTER {action.upper()} ON {table} "
+                f"BEGIN {inserts} END;"
+            )
+    return commands
+
+# summary table => (period column, period length, period from a date)
+SUMMARY_PERIODS = {
+    "receipts_daily": ("day", 10, "{}.date"),
+    "receipts_monthly": ("month", 7, "substr({}.date, 1, 7)"),
+}
+
+def build_summary_tables() -> list:
+    """Pre-specified table information for the receipt totals summarized
+    per period, store and category
+    """
+    return [
+        Table(name,
+              [
+                 (period, SQLType.VARCHAR(length)),
+                 ("store", SQLType.VARCHAR()),
+                 ("category", SQLType.VARCHAR()),
+                 ("receipts", SQLType.INT),
+                 ("total", SQLType.INT)
+              ], unique=[period, "store", "category"])
+            for name, (period, length, _) in SUMMARY_PERIODS.items()
+    ]
+
+def summary_key(period, expression, row) -> str:
+    """Returns the where clause matching the summary row of a receipt row"""
+    return (f"{period} = {expression.format(row)} "
+            f"AND store = {row}.store AND category = {row}.category")
+
+def build_summary_triggers(table="receipts") -> list:
+    """
+    Returns create trigger commands that keep the summary tables up to date
+    as receipts are inserted, updated or deleted. Rows whose receipt count
+    drops to zero are removed.
+    """
+    add, remove = [], []
+    for name, (period, _, expression) in SUMMARY_PERIODS.items():
+        add.append(
+            f"INSERT INTO {name} ({period}, store, category, receipts, total) "
+            f"VALUES ({expression.format('NEW')}, NEW.store, NEW.category, "
+            f"1, NEW.total) "
+            f"ON CONFLICT ({period}, store, category) DO UPDATE SET "
+            f"receipts = receipts + 1, total = total + excluded.total;"
+        )
+        key = summary_key(period, expression, "OLD")
+        remove.append(
+            f"UPDATE {name} SET receipts = receipts - 1, "
+            f"total = total - OLD.total WHERE {key};"
+        )
+        remove.append(f"DELETE FROM {name} WHERE {key} AND receipts <= 0;")
+
+    add, remove = " ".join(add), " ".join(remove)
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {table}_summary_insert "
+        f"AFTER INSERT ON {table} BEGIN {add} END;",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_summary_update "
+        f"AFTER UPDATE OF date, store, category, total ON {table} "
+        f"BEGIN {remove} {add} END;",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_summary_delete "
+        f"AFTER DELETE ON {table} BEGIN {remove} END;",
+    ]
+
+def summary_select(name, table="receipts") -> str:
+    """Returns a query that aggregates the summary table from scratch"""
+    period, _, expression = SUMMARY_PERIODS[name]
+    return (f"SELECT {expression.format(table)} AS {period}, store, category, "
+            f"COUNT(*) AS receipts, SUM(total) AS total FROM {table} "
+            f"GROUP BY {period}, store, category")
+
+def build_summary_rebuild(table="receipts") -> list:
+    """Returns commands that refill every summary table from the table"""
+    commands = []
+    for name in SUMMARY_PERIODS:
+        commands.append(f"DELETE FROM {name};")
+        commands.append(f"INSERT INTO {name} {summary_select(name, table)};")
+    return commands
+
+def build_summary_check(name, table="receipts") -> str:
+    """
+    Returns a query listing the summary rows that differ from a fresh
+    aggregate of the table. Rows only in the summary are marked 'stale' and
+    rows only in the aggregate are marked 'missing'.
+    """
+    period, _, _ = SUMMARY_PERIODS[name]
+    columns = f"{period}, store, category, receipts, total"
+    current = f"SELECT {columns} FROM {name}"
+    fresh = f"SELECT {columns} FROM ({summary_select(name, table)})"
+    return (f"SELECT 'stale', * FROM ({current} EXCEPT {fresh}) "
+            f"UNION ALL "
+            f"SELECT 'missing', * FROM ({fresh} EXCEPT {current});")
+
+PRODUCT_SUM = ("(SELECT COALESCE(SUM(p.price), 0) FROM products p "
+               "WHERE p.filename = r.filename)")
+
+# rule => (expected, actual, violated when) over receipts r
+CONSISTENCY_RULES = {
+    "total": ("r.subtotal + r.tax", "r.total",
+              "ABS({expected} - {actual}) > {tolerance}"),
+    "subtotal": ("r.subtotal", PRODUCT_SUM,
+                 "ABS({expected} - {actual}) > {tolerance}"),
+    "payment": ("r.total", "r.payment", "{actual} < {expected}"),
+}
+
+def build_consistency_check(rule, tolerance=0, filtered=False) -> str:
+    """
+    Returns a query listing (filename, expected, actual) for every receipt
+    breaking the rule by more than tolerance cents. Product sums are looked
+    up per receipt through the (filename, product_id, price, name)
+    unique index.
+    Filtered queries hold an IN clause placeholder for batches of filenames.
+    """
+    expected, actual, violated = CONSISTENCY_RULES[rule]
+    where = violated.format(expected=expected, actual=actual,
+                            tolerance=int(tolerance))
+    if filtered:
+        where = f"{where} AND r.filename IN ({{}})"
+    return (f"SELECT r.filename, {expected}, {actual} FROM receipts r "
+            f"WHERE {where} ORDER BY r.filename;")
+
+def build_near_duplicates(tolerance=0) -> str:
+    """
+    Returns a query pairing every receipt with the receipt before it in its
+    (store, date) bucket sorted by total when the totals are within
+    tolerance cents. Rows are (previous, filename, store, date).
+    """
+    return (f"SELECT previous, filename, store, date FROM ("
+            f"SELECT filename, store, date, total, "
+            f"LAG(filename) OVER bucket AS previous, "
+            f"LAG(total) OVER bucket AS previous_total FROM receipts "
+            f"WINDOW bucket AS (PARTITION BY store, date "
+            f"ORDER BY total, filename)) "
+            f"WHERE previous IS NOT NULL "
+            f"AND total - previous_total <= {int(tolerance)} "
+            f"ORDER BY store, date, total;")
 
 if __name__ == "__main__":
     # create a simple table with some fields and datatype values
@@ -145,3 +369,16 @@ if __name__ == "__main__":
 
     print(build_receipts_table())
     print(build_products_table())
+    print(build_catalog_table())
+    print(build_journal_table())
+    for trigger in build_journal_triggers():
+        print(trigger)
+    for index in build_indexes():
+        print(index)
+    for table in build_summary_tables():
+        print(table)
+    for trigger in build_summary_triggers():
+        print(trigger)
+    for rule in CONSISTENCY_RULES:
+        print(build_consistency_check(rule))
+    print(build_near_duplicates())
@@ -0,0 +1,49 @@
+"""summary.py
+Command line access to the receipt summary tables. The daily and monthly
+tables hold receipt counts and totals per store and category and are kept
+up to date by triggers on the receipts table, so readers only scan a few
+hundred pre-aggregated rows instead of the full receipt history.
+
+    --rebuild => refill the summary tables from the receipts table
+    --check   => compare the summary tables with a fresh aggregate
+"""
+
+__author__ = "Samuel Whang"
+
+import click
+
+import source.utils as utils
+from source.database import ReceiptConnection
+from source.schema import SUMMARY_PERIODS
+
+
+def log_differences(differences):
+    for name, rows in differences.items():
+        print(f"{name}: {len(rows)} inconsistent rows")
+        for state, *row in rows:
+            print(f"  {state:<8}{row}")
+
+
+@click.command()
+@click.option('--rebuild', "rebuild", is_flag=True, default=False,
+              help="refill the summary tables from the receipts table")
+@click.option('--check', "check", is_flag=True, default=False,
+              help="compare the summary tables with the receipts table")
+def main(rebuild, check):
+    logargs = utils.logargs(type("summary_main", (), dict()), __file__)
+    logger = utils.setup_logger_from_logargs(logargs)
+
+    database = ReceiptConnection(logger=logger)
+    database.build_summaries()
+    if rebuild:
+        database.rebuild_summaries()
+        print(f"Rebuilt {', '.join(SUMMARY_PERIODS)}")
+    if check:
+        differences = database.check_summaries()
+        if differences:
+            log_differences(differences)
+            exit(1)
+        print("Summary tables are consistent")
+
+if __name__ == "__main__":
+    main()
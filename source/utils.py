@@ -16,11 +16,12 @@ import cerberus
 from math import floor, ceil
 from source.YamlObjects import Receipt
 from source.config import YAML_FILE_NAME_REGEX
+from source.money import Money, money
 from typing import Union, Tuple
 from collections import namedtuple
 from itertools import chain
 
-Currency = Union[int, float]
+Currency = Union[Money, int, float]
 
 point = namedtuple('Point', 'x y')
 size = namedtuple('Size', 'width height')
@@ -188,6 +189,32 @@ def check_directory_path(path: str) -> bool:
     return os.path.isdir(path)
 
 
+def discover_files(root: str, extension: str = None):
+    """Recursively yields os.DirEntry objects for every file under root using
+    os.scandir. Dot files and dot folders are skipped. If extension is given
+    then only files ending with the extension are returned.
+    """
+    folders = [root]
+    while folders:
+        folder = folders.pop()
+        with os.scandir(folder) as entries:
+            entries = sorted(entries, key=lambda e: e.name)
+
+        subfolders = []
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                subfolders.append(entry.path)
+            elif entry.is_file():
+                if extension and not entry.name.endswith(extension):
+                    continue
+                yield entry
+
+        # reversed so that sub folders are popped in sorted order
+        folders.extend(reversed(subfolders))
+
+
 def parse_file_from_path(path: str) -> str:
     """Given the absolute path to a file, returns the file name only"""
     formattedpath = format_directory_path(path)
@@ -235,9 +262,9 @@ def initialize_curses_settings(logger=None):
     curses.init_pair(12, curses.COLOR_WHITE, curses.COLOR_RED)
 
 
-def format_float(number: Union[int, float]) -> float:
-    """Returns a formatted float up to 10 spaces and 2 precision places"""
-    return f"{number:10.2f}"
+def format_float(number: Currency) -> str:
+    """Returns a dollar amount padded to 10 spaces with 2 precision places"""
+    return f"{money(number):10.2f}"
 
 
 def parse_date_from_database(date: str) -> list:
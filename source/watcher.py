@@ -0,0 +1,89 @@
+"""watcher.py: Polls folders for new or changed yaml files
+
+Uses recursive os.scandir snapshots of each file's modified time and size so
+no external file system notification service is needed. Every poll diffs
+the newest snapshot against the last one and reports only the files that
+were added, changed or removed in between.
+"""
+
+__author__ = "Samuel Whang"
+
+import time
+from collections import namedtuple
+
+import source.config as config
+import source.utils as utils
+from source.logger import Loggable
+
+FileState = namedtuple("FileState", "mtime size")
+FolderChanges = namedtuple("FolderChanges", "added changed removed")
+
+
+def snapshot(folder: str, extension: str = config.YAML_FILE_EXTENSION) -> dict:
+    """Returns a dictionary of file path to FileState for every file under
+    the folder matching the extension. Dot files and dot folders are skipped.
+    """
+    states = {}
+    for entry in utils.discover_files(folder, extension):
+        stat = entry.stat()
+        states[entry.path] = FileState(stat.st_mtime_ns, stat.st_size)
+    return states
+
+
+def diff_snapshots(previous: dict, current: dict) -> FolderChanges:
+    """Compares two snapshots and returns the sorted file paths that were
+    added, changed or removed between them.
+    """
+    added = sorted(f for f in current if f not in previous)
+    changed = sorted(f for f, state in current.items()
+                        if f in previous and previous[f] != state)
+    removed = sorted(f for f in previous if f not in current)
+    return FolderChanges(added, changed, removed)
+
+
+class FolderWatcher(Loggable):
+    """Keeps the last snapshot of one or more folders and reports changes to
+    them when polled. The first poll reports every file as added.
+    """
+    def __init__(self, folders, interval=config.WATCH_INTERVAL, logger=None):
+        super().__init__(self, logger=logger)
+
+        if isinstance(folders, str):
+            folders = [folders]
+        self.folders = [f for f in folders if f] if folders else []
+        if not self.folders:
+            raise ValueError("Folder parameter cannot be None")
+
+        self.interval = max(interval, config.WATCH_INTERVAL_MINIMUM)
+        self.states = {}
+        self.last_poll = None
+
+        self.log(f"Watching {self.folders} every {self.interval} seconds")
+
+    @property
+    def due(self) -> bool:
+        """Returns true if enough time has passed since the last poll"""
+        if self.last_poll is None:
+            return True
+        return time.monotonic() - self.last_poll >= self.interval
+
+    def poll(self) -> FolderChanges:
+        """Takes a new snapshot of the folders and returns the differences
+        from the previous snapshot.
+        """
+        self.last_poll = time.monotonic()
+        current = {}
+        for folder in self.folders:
+            try:
+                current.update(snapshot(folder))
+            except FileNotFoundError:
+                self.log(f"Folder '{folder}' no longer exists")
+
+        changes = diff_snapshots(self.states, current)
+        self.states = current
+
+        if any(changes):
+            self.log(f"+{len(changes.added)} "
+                     f"~{len(changes.changed)} "
+                     f"-{len(changes.removed)} files")
+        return changes
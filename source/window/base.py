@@ -191,7 +191,7 @@ class Window:
     
     def add_handler(self, key, handler):
         if key not in self.keypresses.keys():
-            self.keypress[key] = EventHandler()
+            self.keypresses[key] = EventHandler()
         self.keypresses[key].append(handler)
 
     def add_handlers(self, key, *handlers):
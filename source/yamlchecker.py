@@ -17,8 +17,10 @@ from collections import namedtuple
 
 import source.utils as utils
 import source.config as config
+from source.ingest import Ingestor
 from source.logger import Loggable
-from source.YamlObjects import receipt
+from source.money import money, total
+from source.YamlObjects import Receipt
 
 class YamlChecker(Loggable):
     """Processes yaml files in specified folder for both file integrity and
@@ -57,9 +59,6 @@ class YamlChecker(Loggable):
                             skip future checking and loading during the 
                             verification process.
         """
-        def convert_int(floatval):
-            return int(floatval * 100)
-
         verified = []
         unverified = []
         skipped = []
@@ -181,15 +180,15 @@ class YamlChecker(Loggable):
                 # in the receipt class as a callback handler after regular checks
                 # have finished. For now keep here but remember TODO refactoring.
                 transactionError = False
-                productSumInt = convert_int(sum(yamlobj.products.values()))
-                subtotalInt = convert_int(yamlobj.subtotal)
+                productSumInt = total(yamlobj.products.values())
+                subtotalInt = money(yamlobj.subtotal)
                 subtotalError = productSumInt != subtotalInt
 
-                subtaxInt = convert_int(yamlobj.subtotal + yamlobj.tax)
-                totalInt = convert_int(yamlobj.total)
+                subtaxInt = money(yamlobj.subtotal) + money(yamlobj.tax)
+                totalInt = money(yamlobj.total)
                 subtaxtotalError = subtaxInt != totalInt
 
-                paymentInt = convert_int(yamlobj.payment)
+                paymentInt = money(yamlobj.payment)
                 totalpayError = totalInt != paymentInt
 
                 if subtotalError or subtaxtotalError or totalpayError:
@@ -438,11 +437,27 @@ def log(logger, message, consoleprint):
     if consoleprint:
         print(message)
 
-def log_file_results(logger, batches, toconsole):
-    """Log function specific to yamlchecker to view file results from class"""
+def ingest_file_results(ingestor, yobjs):
+    """Returns the file results of an ingest in the batches of
+    verify_file_states
+    """
+    return {
+        "VERIFIED": sorted(utils.filename_and_extension(f)[0] for f in yobjs),
+        "SKIPPED": [f"{path} duplicates {original}"
+                        for path, original in ingestor.duplicates],
+        "UNVERIFIED": [f"{path}: {error}" for path, error in ingestor.failed],
+    }
+
+def log_file_results(logger, batches, toconsole, report=None):
+    """Log function specific to yamlchecker to view file results from class.
+    The totals of an ingest report are logged with the file totals.
+    """
     totalfiles = sum(len(batch) for batch in batches.values())
     totalmessage = config.YAML_CHECKER_RESULTS_TOTAL.format(totalfiles)
     log(logger, totalmessage, toconsole)
+    if report is not None:
+        for message in report.summary():
+            log(logger, message, toconsole)
 
     for batchtype, batch in batches.items():
         if batch:
@@ -466,18 +481,30 @@ def log_file_results(logger, batches, toconsole):
 @click.option('-f', "folder", nargs=1, type=str, required=True,
               help="folder holding yaml data files")
 @click.option('-p', is_flag=True, help="print results to terminal screen")
-def main(folder, p):
+@click.option('--report', "reportpath", nargs=1, type=str, default=None,
+              help="profile the folder ingest and save a json report here")
+def main(folder, p, reportpath):
     filepath = utils.format_directory_path(folder)
     if not utils.check_directory_path(filepath):
         exit(config.ARGS_PATH_IS_NOT_DIR)
 
-    logargs = utils.logargs(type("yc_main", (), dict()))
+    logargs = utils.logargs(type("yc_main", (), dict()), __file__)
     logger = utils.setup_logger_from_logargs(logargs)
 
-    checker = YamlChecker(filepath, logger)
-    fileresults = checker.verify_file_states()
+    # the report profiles the validation pass itself
+    report = None
+    if reportpath:
+        ingestor = Ingestor(filepath, logger=logger)
+        fileresults = ingest_file_results(ingestor, ingestor.ingest())
+        report = ingestor.report
+    else:
+        checker = YamlChecker(filepath, logger)
+        fileresults = checker.verify_file_states()
+
+    log_file_results(logger, fileresults, p, report)
 
-    log_file_results(logger, fileresults, p)
+    if report is not None:
+        report.write(reportpath)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
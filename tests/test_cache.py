@@ -0,0 +1,67 @@
+"""Tests the query cache and its table version invalidation"""
+
+import logging
+import sqlite3
+
+from source.cache import CachingConnection, QueryCache
+from source.database import ReceiptConnection
+from source.YamlObjects import Receipt
+
+logger = logging.getLogger('test_cache')
+
+def connection():
+    conn = sqlite3.connect(":memory:", factory=CachingConnection)
+    conn.execute("CREATE TABLE a (x INTEGER);")
+    conn.execute("CREATE TABLE b (x INTEGER);")
+    conn.execute("INSERT INTO a VALUES (1);")
+    return conn
+
+def test_cached_until_table_written():
+    conn = connection()
+    assert conn.query("SELECT x FROM a;") == ((1,),)
+    assert conn.query("SELECT x FROM a;") == ((1,),)
+    assert conn.cache.hits == 1
+
+    conn.execute("INSERT INTO b VALUES (2);")
+    conn.query("SELECT x FROM a;")
+    assert conn.cache.hits == 2
+
+    conn.execute("INSERT INTO a VALUES (3);")
+    assert conn.query("SELECT x FROM a;") == ((1,), (3,))
+    assert conn.cache.invalidations == 1
+
+def test_parameters_are_part_of_key():
+    conn = connection()
+    assert conn.query("SELECT x FROM a WHERE x = ?;", (1,)) == ((1,),)
+    assert conn.query("SELECT x FROM a WHERE x = ?;", (2,)) == ()
+    assert conn.cache.misses == 2
+
+def test_trigger_writes_invalidate():
+    conn = connection()
+    conn.execute("CREATE TRIGGER a_insert AFTER INSERT ON a "
+                 "BEGIN INSERT INTO b VALUES (NEW.x); END;")
+    assert conn.query("SELECT COUNT(*) FROM b;") == ((0,),)
+    conn.execute("INSERT INTO a VALUES (5);")
+    assert conn.query("SELECT COUNT(*) FROM b;") == ((1,),)
+
+def test_size_limits():
+    cache = QueryCache(max_entries=2, max_rows=3)
+    cache.put(("SELECT 1 FROM a", ()), ((1,),))
+    cache.put(("SELECT 2 FROM a", ()), ((2,),))
+    cache.put(("SELECT 3 FROM a", ()), ((3,),))
+    assert len(cache) == 2
+    assert cache.get(("SELECT 1 FROM a", ())) is None
+    cache.put(("SELECT 4 FROM a", ()), ((4,),) * 4)
+    assert cache.evictions == 1
+    assert cache.stats['rows'] == 2
+
+def test_receipt_connection_summary_cache(tmp_path):
+    db = ReceiptConnection(str(tmp_path / "receipts.db"), logger=logger)
+    db.build_tables()
+    assert list(db.select_summary("receipts_daily")) == []
+    db.insert_files({"170327-leevers.yaml": Receipt(
+        'Leevers', 'Leevers', [2017, 3, 27], 'grocery',
+        {'milk': 2.5}, 2.5, 0.0, 2.5, 2.5)})
+    assert len(list(db.select_summary("receipts_daily"))) == 1
+    assert len(list(db.select_summary("receipts_daily"))) == 1
+    assert db.cache.hits == 1
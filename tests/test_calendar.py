@@ -0,0 +1,271 @@
+"""Tests the calendar grids in ./calendar"""
+
+import datetime
+import io
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "calendar"))
+
+from agenda import calendar_agenda, receipt_source
+from compact import EAST, SOUTH, CompactCalendar
+from events import EventIndex, iter_json_records
+from heatmap import HeatCalendar, HeatMonth, SpendingTotals
+from ics import import_ics
+from recurrence import Rule
+
+from source.database import ReceiptConnection
+from source.models.models import Task
+from source.YamlObjects import Receipt
+from grid import CalendarGrid, MonthGrid, ScrollableCalendar
+
+def test_month_index():
+    month = MonthGrid(9, 2018)
+    assert month.index[1] == (0, 6)
+    assert month.index[2] == (1, 0)
+    assert month.date(30).daydate == 30
+    assert month.date(31) is None and month.date(0) is None
+    # node 1 is reached going up from node 8
+    assert month.select_day_from_date(8, "n") == 1
+    assert month.select_day_from_date(1, "s") == 8
+
+def test_january_links_previous_december():
+    month = MonthGrid(1, 2019)
+    assert month.grid[0][0].daydate == 30
+    assert not month.grid[0][0].selectable
+
+def test_bulk_events():
+    year = CalendarGrid(2019)
+    shared = ["standup"]
+    added = year.add_events([
+        ((2019, 3, 4), shared),
+        (datetime.date(2019, 3, 5), shared),
+        ((2019, 2, 30), "invalid"),
+        ((2020, 1, 1), "out of range"),
+    ])
+    assert added == 2
+    march = year.months[2019][2]
+    march.date(4).events.append("review")
+    assert march.date(5).events == ["standup"]
+
+def test_compact_matches_graph():
+    begdate, enddate = datetime.date(2018, 10, 1), datetime.date(2018, 12, 31)
+    graph = ScrollableCalendar(begdate, enddate)
+    compact = CompactCalendar(begdate, enddate)
+    assert compact.weeks == len(graph.graph)
+    for j, week in enumerate(graph.graph):
+        for node, day in zip(week, compact.week(j)):
+            assert (node.year, node.month, node.day) == day.date.timetuple()[:3]
+            assert node.selectable == day.selectable
+
+    october = compact[compact.slot(begdate)]
+    assert october.paths == SOUTH | EAST
+    assert october.neighbour("s") == (2018, 10, 8)
+    assert october.neighbour("w") is None
+
+def test_compact_events():
+    compact = CompactCalendar(datetime.date(2019, 1, 1),
+                              datetime.date(2019, 12, 31))
+    assert compact.add_events([((2019, 3, 4), "a"), ((2019, 3, 1), "b"),
+                               ((2018, 12, 31), "unselectable")]) == 2
+    compact.add_events([((2019, 3, 4), "c")])
+    assert compact[compact.slot((2019, 3, 4))].events == ["a", "c"]
+    assert compact[compact.slot((2019, 3, 1))].events == ["b"]
+    # events added after a read are merged on the next one
+    compact.add_events([((2019, 3, 4), "d")])
+    assert len(compact.pending) == 1
+    assert compact[compact.slot((2019, 3, 4))].events == ["a", "c", "d"]
+    assert compact.pending == []
+
+def test_scrollable_is_lazy():
+    scroll = ScrollableCalendar(datetime.date(1900, 1, 1),
+                                datetime.date(2100, 12, 31),
+                                datetime.date(2000, 2, 29), window=4)
+    assert len(scroll.graph) == 10488 and not scroll.graph.weeks
+    scroll.select_next_year()
+    assert scroll.current == (2001, 2, 28)
+    scroll.select_prev_month()
+    assert scroll.current == (2001, 1, 28)
+    scroll.go_to_date(datetime.date(2300, 1, 1))
+    assert scroll.current == (2100, 12, 31)
+    for j in range(10):
+        scroll.graph[j]
+    assert list(scroll.graph.weeks) == [6, 7, 8, 9]
+
+def test_event_intervals(tmp_path):
+    december = MonthGrid(12, 2018)
+    assert december.add_events_json("data/events.json") == 3
+    december.add_events(20, 40, "trip")
+    december.add_event(25, "dinner")
+    december.selected = 25
+    assert december.events() == ["dinner", "trip", "christmas"]
+    assert december.busy_days() == set(range(20, 32))
+    assert len(december.event_index) == 4
+
+    december.export_events_yaml(tmp_path / "december.yaml")
+    events = EventIndex()
+    assert events.load_yaml(tmp_path / "december.yaml") == 4
+    assert [e.name for e in events.week((2018, 12, 24))] == [
+        "trip", "christmas eve", "christmas", "dinner"]
+
+def test_streamed_json_records():
+    records = '{"a": {"day": 1, "days": 12.5e-1}, "b": [true, null]}'
+    assert list(iter_json_records(io.StringIO(records), chunksize=3)) == [
+        ("a", {"day": 1, "days": 1.25}), ("b", [True, None])]
+
+def test_recurring_events():
+    standup = Rule("standup", datetime.date(1900, 1, 1), "weekly",
+                   weekdays=["mo", "we"], exceptions=[(2099, 3, 4)])
+    assert [e.begin.day for e in standup.occurrences(
+        datetime.date(2099, 3, 1), datetime.date(2099, 3, 11))] == [2, 9, 11]
+    rent = Rule("rent", datetime.date(2019, 1, 31), "monthly", count=3)
+    assert [e.begin for e in rent.occurrences((2019, 1, 1), (2020, 1, 1))] \
+        == [datetime.date(2019, 1, 31), datetime.date(2019, 3, 31),
+            datetime.date(2019, 5, 31)]
+
+    year = CalendarGrid(2019)
+    year.events.load_yaml("data/events.yaml")
+    assert year.months[2019][0].busy_days() == {1}
+    year.months[2019][2].add_rule(standup)
+    assert len(year.months[2019][2].busy_days()) == 8
+    assert year.events.recurring.overlapping((2019, 12, 24), (2019, 12, 25)) \
+        is year.events.recurring.overlapping((2019, 12, 24), (2019, 12, 25))
+
+def test_month_render_cache():
+    month = MonthGrid(11, 2018)
+    month.add_events(19, 21, "trip")
+    before = month.term(options=0x3, blt=True)
+    cells = month.render_cache.cells
+    month.select_next_week()
+    after = month.term(options=0x3, blt=True)
+    assert month.render_cache.cells is cells and after != before
+    month.add_event(1, "dentist")
+    assert month.term(options=0x3, blt=True) != after
+
+    fresh = MonthGrid(11, 2018)
+    fresh.add_events(19, 21, "trip")
+    fresh.add_event(1, "dentist")
+    fresh.selected = month.selected
+    assert fresh.term(options=0x3, blt=True) == \
+        month.term(options=0x3, blt=True)
+
+def test_spending_heat_map(tmp_path):
+    db = ReceiptConnection(str(tmp_path / "receipts.db"),
+                           logger=logging.getLogger('test_calendar'))
+    db.build_tables()
+    db.build_summaries()
+    db.insert_files({
+        f"1901{i:02d}-store{i}.yaml": Receipt(
+            f"store{i}", f"s{i}", [2019, 1 + i % 3, 10 + i], 'grocery',
+            {f"item{i}": 10.0 * i}, 10.0 * i, 0.0, 10.0 * i, 10.0 * i)
+            for i in range(1, 7)
+    })
+    totals = SpendingTotals(db, cached=2)
+    scroll = HeatCalendar(datetime.date(2018, 1, 1),
+                          datetime.date(2020, 12, 31), totals,
+                          start=datetime.date(2019, 2, 11))
+    assert "11. 12  13  14:" in scroll.format_print(0x16)
+    assert totals.queries == 1
+    scroll.select_prev_day()
+    scroll.format_print(0x16, blt=True)
+    assert totals.queries == 1
+    assert not scroll.selected_receipts()
+    scroll.select_next_day()
+    assert [r[0] for r in scroll.selected_receipts()] == [
+        "190101-store1"]
+
+    month = HeatMonth(3, 2019, totals)
+    assert " 12. 13  14  15* 16 " in month.term()
+    assert totals.queries == 1
+    HeatMonth(6, 2019, totals).term()
+    assert totals.queries == 2 and len(totals.months) == 2
+
+ICS = """BEGIN:VCALENDAR\r
+BEGIN:VEVENT\r
+SUMMARY:Trip to the\r
+  lake\\, with friends\r
+DTSTART;VALUE=DATE:20190610\r
+DTEND;VALUE=DATE:20190613\r
+BEGIN:VALARM\r
+ACTION:EMAIL\r
+SUMMARY:Pack\r
+DESCRIPTION:Pack for the lake\r
+TRIGGER:-P1D\r
+END:VALARM\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+SUMMARY:Standup\r
+DTSTART;TZID=America/Chicago:20190107T090000\r
+DURATION:PT15M\r
+RRULE:FREQ=WEEKLY;BYDAY=MO,WE;UNTIL=20190131T000000Z\r
+EXDATE:20190109T090000\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+SUMMARY:Board\r
+DTSTART:20190107T090000Z\r
+RRULE:FREQ=MONTHLY;BYDAY=1MO\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+SUMMARY:Rent\r
+DTSTART;VALUE=DATE:20190101\r
+RRULE:FREQ=MONTHLY;BYMONTHDAY=1,15\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+SUMMARY:Birthday\r
+DTSTART;VALUE=DATE:20190304\r
+RRULE:FREQ=YEARLY;BYMONTH=3;BYMONTHDAY=4\r
+END:VEVENT\r
+END:VCALENDAR\r
+"""
+
+def test_ics_import():
+    events, report = import_ics(io.StringIO(ICS), batch=1)
+    assert report[:3] == (3, 2, 2)
+    trip, = events.overlapping((2019, 6, 12))
+    assert trip.name == "Trip to the lake, with friends"
+    assert trip.end == datetime.date(2019, 6, 12)
+    # the alarm does not leak into the event
+    assert trip.data is None
+    assert [e.begin.day for e in events.overlapping((2019, 1, 1), 
+                                                    (2019, 1, 16))
+                if e.name == "Standup"] == [7, 14, 16]
+    # BYMONTHDAY=1,15 cannot be expressed so only the first day is kept
+    assert [e.name for e in events.overlapping((2019, 1, 15))] == []
+    birthday, = events.overlapping((2020, 3, 4))
+    assert birthday.name == "Birthday"
+
+def test_agenda_merges_lazily(tmp_path):
+    db = ReceiptConnection(str(tmp_path / "receipts.db"),
+                           logger=logging.getLogger('test_calendar'))
+    db.build_tables()
+    db.build_summaries()
+    db.insert_files({
+        f"1901{i:02d}-store.yaml": Receipt(
+            "store", "s", [2019, 1, 1 + i], 'grocery', {"milk": 2.5},
+            2.5, 0.0, 2.5, 2.5)
+            for i in range(20)
+    })
+    index = EventIndex()
+    index.add("trip", (2018, 12, 30), (2019, 1, 2))
+    index.add("party", (2019, 1, 5))
+    index.add_rule(Rule("standup", (2018, 1, 1), "weekly", weekdays=["mo"]))
+    tasks = [Task("taxes", 1, datetime.datetime(2019, 1, 3), "file them"),
+             Task("old", 1, datetime.datetime(2018, 1, 3), "done")]
+
+    agenda = calendar_agenda(index, (2019, 1, 1), tasks, db)
+    page = agenda.next_page(6)
+    assert [(item.date.day, item.kind, item.name) for item in page] == [
+        (1, "event", "trip"), (1, "receipt", "store"),
+        (2, "receipt", "store"), (3, "task", "taxes"),
+        (3, "receipt", "store"), (4, "receipt", "store")]
+    assert [item.name for item in agenda.until((2019, 1, 7))] == [
+        "party", "store", "store", "standup", "store"]
+    # the item read past the date starts the next page
+    assert [item.date.day for item in agenda.until((2019, 1, 7))] == []
+    assert [item.date.day for item in agenda.next_page(2)] == [8, 9]
+    assert agenda.peeked is None
+
+    receipts = receipt_source(db, (2019, 1, 15), page_size=2)
+    assert [item.date.day for item in receipts] == [15, 16, 17, 18, 19, 20]
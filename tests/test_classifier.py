@@ -0,0 +1,49 @@
+"""Tests store classification rules and bulk reclassification"""
+
+import logging
+
+from source.classifier import StoreClassifier
+from source.database import ReceiptConnection
+from source.YamlObjects import Receipt
+
+logger = logging.getLogger('test_classifier')
+
+STORES = [
+    {'store': 'Burger King', 'short': 'BK', 'category': 'fast food',
+     'exact': ['bk'], 'prefix': ['burger king']},
+    {'store': 'Shopko', 'keywords': ['shopko']},
+]
+CATEGORIES = {'grocery': ['market']}
+
+def test_rule_precedence():
+    classifier = StoreClassifier(STORES, CATEGORIES, logger=logger)
+    assert classifier.classify('B.K.', 'food') == (
+        'Burger King', 'BK', 'fast food', 'exact')
+    assert classifier.classify('BURGER KING #42').rule == 'prefix'
+    assert classifier.classify('Hometown Shopko', 'general') == (
+        'Shopko', 'Shopko', 'general', 'keyword')
+    assert classifier.classify('Farmers Market', 'misc') == (
+        'Farmers Market', None, 'grocery', 'category')
+    assert classifier.classify('Kum & Go', 'misc').rule is None
+
+    receipt = Receipt('Burger King 7', 'Burger', [2017, 4, 29], 'misc', {},
+                      1.0, 0.0, 1.0, 1.0)
+    classifier.apply(receipt)
+    assert (receipt.store, receipt.short, receipt.category) == (
+        'Burger King', 'BK', 'fast food')
+
+def test_reclassify_database(tmp_path):
+    db = ReceiptConnection(str(tmp_path / "receipts.db"), logger=logger)
+    db.build_tables()
+    db.insert_files({
+        f"17042{i}-burgerking.yaml": Receipt(
+            name, 'BK', [2017, 4, 20 + i], 'food', {'whopper': 1.0},
+            1.0, 0.0, 1.0, 1.0)
+            for i, name in enumerate(['Burger King', 'BURGER KING 12', 'Kwik'])
+    })
+    classifier = StoreClassifier(STORES, CATEGORIES, logger=logger)
+    assert classifier.reclassify(db) == 2
+    assert sorted(db.select_store_names()) == [
+        ('Burger King', 'BK', 'fast food', 2), ('Kwik', 'BK', 'food', 1)]
+    assert not db.check_summaries()
+    assert classifier.reclassify(db) == 0
@@ -0,0 +1,64 @@
+"""Tests receipt fingerprints and duplicate detection"""
+
+import logging
+
+from source.database import ReceiptConnection
+from source.duplicates import fingerprint, near_duplicates
+from source.YamlObjects import Receipt
+
+logger = logging.getLogger('test_duplicates')
+
+def receipt(store, day, total, products):
+    return Receipt(store, store, [2017, 4, day], 'grocery', products,
+                   total, 0.0, total, total)
+
+def test_fingerprint_is_normalized():
+    a = fingerprint('Taco Johns', [2017, 4, 21], 6.17,
+                    {'taco': 1.5, 'burrito': 4.67})
+    b = fingerprint('TACO  JOHNS', '2017-04-21', '6.17',
+                    {'burrito': 4.67, 'Taco': 1.50})
+    assert a == b
+    assert a != fingerprint('Taco Johns', [2017, 4, 21], 6.18,
+                            {'taco': 1.5, 'burrito': 4.67})
+
+def test_exact_and_near_duplicates(tmp_path):
+    db = ReceiptConnection(str(tmp_path / "receipts.db"), logger=logger)
+    db.build_tables()
+    db.insert_files({
+        "170421-tacojohns.yaml": receipt('Taco Johns', 21, 6.17, {'a': 6.17}),
+        "170421-tj.yaml": receipt('taco johns', 21, 6.17, {'a': 6.17}),
+        "170422-leevers.yaml": receipt('Leevers', 22, 10.00, {'a': 10.0}),
+        "170422-leevers_b.yaml": receipt('Leevers', 22, 10.50, {'b': 10.5}),
+        "170422-leevers_c.yaml": receipt('Leevers', 22, 11.25, {'c': 11.25}),
+        "170423-leevers.yaml": receipt('Leevers', 23, 10.00, {'d': 10.0}),
+    })
+    assert db.duplicates == [("170421-tj.yaml", "170421-tacojohns")]
+    assert db.count_receipts() == 5
+    assert near_duplicates(db, tolerance=75) == [
+        ['170422-leevers', '170422-leevers_b', '170422-leevers_c']]
+    assert near_duplicates(db, tolerance=0) == []
+
+def test_migrate_old_databases(tmp_path):
+    db = ReceiptConnection(str(tmp_path / "receipts.db"), logger=logger)
+    db.conn.execute("CREATE TABLE receipts (filename TEXT, store VARCHAR, "
+                    "short TEXT, date VARCHAR(10), category VARCHAR, "
+                    "subtotal INTEGER, tax INTEGER, total INTEGER, "
+                    "payment INTEGER, UNIQUE(filename));")
+    db.conn.execute("CREATE TABLE products (filename TEXT, product VARCHAR, "
+                    "price INTEGER, UNIQUE(filename, product, price));")
+    for name in ("170421-tacojohns", "170421-tj"):
+        db.conn.execute("INSERT INTO receipts VALUES "
+                        "(?, 'Taco Johns', 'TJ', '2017-04-21', 'fast food', "
+                        "617, 0, 617, 617);", (name,))
+        db.conn.execute("INSERT INTO products VALUES (?, 'Taco ', 617);",
+                        (name,))
+    db.build_catalog()
+    db.build_fingerprints()
+    assert db.select_products_by_filename(["170421-tj"]) == {
+        "170421-tj": [("Taco", 617)]}
+    (filenames, count), = db.select_exact_duplicates()
+    assert count == 2
+    assert db.select_fingerprint(
+        fingerprint('Taco Johns', '2017-04-21', 6.17, {'taco': 6.17}),
+        "170421-tj"
+    ) == "170421-tacojohns"
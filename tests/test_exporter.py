@@ -0,0 +1,102 @@
+"""Tests streaming receipt exports"""
+
+import gzip
+import json
+import logging
+
+import pytest
+import yaml
+
+from source.database import ReceiptConnection
+from source.exporter import ReceiptExporter
+from source.YamlObjects import Receipt
+
+logger = logging.getLogger('test_exporter')
+
+def receipts():
+    return {
+        "170327-leevers.yaml": Receipt(
+            'Leevers', 'Leevers', [2017, 3, 27], 'grocery',
+            {'dollar item': 1.0, 'milk': 2.5}, 3.5, 0.0, 3.5, 3.5),
+        "170401-bekinternet.yaml": Receipt(
+            'Bek Internet', 'Bek', [2017, 4, 1], 'utility',
+            {'internet': 73.59}, 73.59, 0.0, 73.59, 73.59),
+    }
+
+@pytest.fixture
+def database(tmp_path):
+    db = ReceiptConnection(str(tmp_path / "receipts.db"), logger=logger)
+    db.build_tables()
+    db.insert_files(receipts())
+    yield db
+    db.close()
+
+def test_select_receipts_for_export(database):
+    exported = dict(database.select_receipts_for_export(batch_size=1))
+    assert sorted(exported) == ["170327-leevers", "170401-bekinternet"]
+    leevers = exported["170327-leevers"]
+    assert leevers.date == [2017, 3, 27]
+    assert leevers.products == {'dollar item': 1.0, 'milk': 2.5}
+
+def test_export_files(tmp_path, database):
+    exporter = ReceiptExporter(database, str(tmp_path / "export"),
+                               workers=2, logger=logger)
+    assert exporter.export() == 2
+    with open(tmp_path / "export" / "170401-bekinternet.yaml") as f:
+        receipt = yaml.load(f, Loader=yaml.Loader)
+    assert receipt.products == {'internet': 73.59}
+
+def test_export_yaml_stream(tmp_path, database):
+    exporter = ReceiptExporter(database, str(tmp_path / "export"),
+                               fmt='yaml', logger=logger)
+    assert exporter.export() == 2
+    with open(tmp_path / "export" / "receipts.yaml") as f:
+        stores = [r.store for r in yaml.load_all(f, Loader=yaml.Loader)]
+    assert stores == ['Leevers', 'Bek Internet']
+
+def test_export_jsonl_gzip(tmp_path, database):
+    exporter = ReceiptExporter(database, str(tmp_path / "export"),
+                               fmt='jsonl', compress=True, logger=logger)
+    assert exporter.export() == 2
+    with gzip.open(tmp_path / "export" / "receipts.jsonl.gz", 'rt') as f:
+        lines = [json.loads(line) for line in f]
+    assert [l['filename'] for l in lines] == ["170327-leevers",
+                                              "170401-bekinternet"]
+    assert lines[0]['total'] == 3.5
+
+def test_export_incremental(tmp_path, database):
+    db = database
+    folder = tmp_path / "export"
+    exporter = ReceiptExporter(db, str(folder), logger=logger)
+    assert exporter.export_incremental() == 2
+    assert (folder / ".manifest.json").exists()
+    # the journal keeps the last entry of every receipt
+    assert db.conn.execute(
+        "SELECT COUNT(*) FROM receipts_journal;").fetchone() == (2,)
+
+    # nothing changed since the last export
+    assert exporter.export_incremental() == 0
+
+    # reinserting identical content is journaled but not rewritten
+    db.delete_files(["170327-leevers.yaml"])
+    db.insert_files({"170327-leevers.yaml": receipts()["170327-leevers.yaml"]})
+    assert exporter.export_incremental() == 0
+
+    db.conn.execute("UPDATE receipts SET total=400 WHERE filename=?",
+                    ("170327-leevers",))
+    db.delete_files(["170401-bekinternet.yaml"])
+    db.conn.commit()
+    assert exporter.export_incremental() == 2
+    assert not (folder / "170401-bekinternet.yaml").exists()
+    with open(folder / "170327-leevers.yaml") as f:
+        assert yaml.load(f, Loader=yaml.Loader).total == 4.0
+
+def test_export_incremental_rewrites_missing_files(tmp_path, database):
+    folder = tmp_path / "export"
+    exporter = ReceiptExporter(database, str(folder), logger=logger)
+    exporter.export_incremental()
+    (folder / "170327-leevers.yaml").unlink()
+    exporter.database.conn.execute(
+        "UPDATE receipts SET tax=0 WHERE filename=?", ("170327-leevers",))
+    assert exporter.export_incremental() == 1
+    assert (folder / "170327-leevers.yaml").exists()
@@ -0,0 +1,44 @@
+"""Tests the synthetic receipt generator"""
+
+import logging
+
+import yaml
+
+from fakedata.generator import DataGenerator, ReceiptSampler
+from source.consistency import ConsistencyChecker
+from source.database import ReceiptConnection
+
+logger = logging.getLogger('test_generator')
+
+def sampler(seed=7):
+    return ReceiptSampler(seed, "2017-01-01", "2017-12-31", batch_size=40)
+
+def test_batches_are_reproducible():
+    a, b = sampler().batch(3), sampler().batch(3)
+    assert a.filenames == b.filenames
+    assert a.total.tolist() == b.total.tolist()
+    assert sampler(8).batch(3).total.tolist() != a.total.tolist()
+    assert [size for _, size in sampler().batches(100)] == [40, 40, 20]
+
+def test_yaml_files_load_as_consistent_receipts():
+    s = sampler()
+    filename, text = next(s.yaml_files(s.batch(0)))
+    receipt = yaml.load(text, Loader=yaml.Loader)
+    assert filename.endswith("-00000000")
+    assert round(sum(receipt.products.values()), 2) == receipt.subtotal
+    assert round(receipt.subtotal + receipt.tax, 2) == receipt.total
+    assert receipt.payment >= receipt.total
+
+def test_generate_database(tmp_path):
+    db = ReceiptConnection(str(tmp_path / "receipts.db"), logger=logger)
+    generator = DataGenerator(sampler(), logger=logger)
+    db.build_tables()
+    db.conn.execute(
+        "CREATE UNIQUE INDEX receipts_extra ON receipts (filename, store);")
+    schema = "SELECT type, name, sql FROM sqlite_master ORDER BY name;"
+    before = list(db.conn.execute(schema))
+    assert generator.generate_database(db, 100) == 100
+    assert list(db.conn.execute(schema)) == before
+    assert db.count_receipts() == 100
+    assert ConsistencyChecker(db, logger=logger).check() == []
+    assert db.check_summaries() == {}
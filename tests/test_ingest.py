@@ -0,0 +1,131 @@
+"""Tests ingesting receipts from many source folders"""
+
+import os
+import json
+import logging
+
+import source.ingest as ingest
+from source.ingest import Ingestor
+from source.yamlchecker import ingest_file_results
+
+logger = logging.getLogger('test_ingest')
+
+LEEVERS = """
+--- !receipt
+store: Leevers
+short: Leevers
+date: [2017, 3, 27]
+category: grocery
+products:
+  {
+    dollar item: 1.00
+  }
+subtotal: 1.00
+tax: 0.00
+total: 1.00
+payment: 1.00
+"""[1:]
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(text)
+
+def test_ingest_recursive(tmp_path):
+    write(str(tmp_path / "2017" / "sam" / "170327-leevers.yaml"), LEEVERS)
+    ingestor = Ingestor([str(tmp_path)], logger=logger)
+    yobjs = ingestor.ingest()
+    assert list(yobjs) == ["170327-leevers.yaml"]
+    assert yobjs["170327-leevers.yaml"].products == {'dollar item': 1.0}
+
+def test_ingest_deduplicates_across_roots(tmp_path):
+    write(str(tmp_path / "a" / "170327-leevers.yaml"), LEEVERS)
+    write(str(tmp_path / "b" / "2017" / "170327-leevers.yaml"), LEEVERS)
+    write(str(tmp_path / "b" / "170328-leevers.yaml"), LEEVERS)
+    ingestor = Ingestor([str(tmp_path / "a"), str(tmp_path / "b")],
+                        logger=logger)
+    assert list(ingestor.ingest()) == ["170327-leevers.yaml"]
+    assert len(ingestor.duplicates) == 2
+    assert ingestor.duplicates[0][1] == str(tmp_path / "a" / "170327-leevers.yaml")
+
+def test_ingest_skips_inserted_and_invalid_files(tmp_path):
+    write(str(tmp_path / "170327-leevers.yaml"), LEEVERS)
+    write(str(tmp_path / "170401-leevers.yaml"), LEEVERS.replace("1.00", "one"))
+    write(str(tmp_path / "bad-name.yaml"), LEEVERS.replace("27]", "28]"))
+    ingestor = Ingestor(str(tmp_path), logger=logger)
+    assert ingestor.ingest(skip={"170327-leevers"}) == {}
+    assert len(ingestor.failed) == 2
+
+def test_ingest_unreadable_file(tmp_path, monkeypatch):
+    write(str(tmp_path / "170327-leevers.yaml"), LEEVERS)
+    write(str(tmp_path / "170328-leevers.yaml"), LEEVERS)
+    unreadable = str(tmp_path / "170328-leevers.yaml")
+    def read(path, *args, **kwargs):
+        if path == unreadable:
+            raise PermissionError(f"Permission denied: '{path}'")
+        return open(path, *args, **kwargs)
+    monkeypatch.setattr(ingest, "open", read, raising=False)
+    ingestor = Ingestor(str(tmp_path), logger=logger)
+    assert list(ingestor.ingest()) == ["170327-leevers.yaml"]
+    assert [path for path, _ in ingestor.failed] == [unreadable]
+    assert ingestor.report.files == 2
+    assert list(ingestor.report.failures) == ["read"]
+
+def test_ingest_changed_file(tmp_path):
+    path = str(tmp_path / "170327-leevers.yaml")
+    write(path, LEEVERS)
+    ingestor = Ingestor(str(tmp_path), logger=logger)
+    ingestor.ingest()
+    write(path, LEEVERS.replace("grocery", "general"))
+    assert ingestor.ingest_files([path])["170327-leevers.yaml"].category == "general"
+    # the old content no longer counts as a duplicate
+    write(str(tmp_path / "170328-leevers.yaml"), LEEVERS)
+    assert "170328-leevers.yaml" in ingestor.ingest()
+
+def test_ingest_report(tmp_path):
+    write(str(tmp_path / "170327-leevers.yaml"), LEEVERS)
+    write(str(tmp_path / "170401-leevers.yaml"), LEEVERS.replace("1.00", "one"))
+    write(str(tmp_path / "bad-name.yaml"), LEEVERS.replace("27]", "28]"))
+    ingestor = Ingestor(str(tmp_path), logger=logger)
+    results = ingest_file_results(ingestor, ingestor.ingest())
+    assert results["VERIFIED"] == ["170327-leevers"]
+    assert len(results["UNVERIFIED"]) == 2
+    report = ingestor.report.serialized()
+    assert report['totals']['files'] == 3
+    assert report['totals']['loaded'] == 1
+    assert report['totals']['failed'] == 2
+    assert sorted(report['failures']) == ["filename.regex", "payment.type",
+                                          "subtotal.type", "total.type"]
+    assert len(report['slowest']) == 3
+
+    path = ingestor.report.write(str(tmp_path / "logs" / "report.json"))
+    with open(path) as f:
+        assert json.load(f)['totals'] == report['totals']
+
+def test_ingest_checks_consistency(tmp_path):
+    from source.consistency import ConsistencyChecker
+    from source.database import ReceiptConnection
+
+    write(str(tmp_path / "170327-leevers.yaml"), LEEVERS)
+    write(str(tmp_path / "170328-leevers.yaml"),
+          LEEVERS.replace("\ntotal: 1.00", "\ntotal: 1.50"))
+    db = ReceiptConnection(str(tmp_path / "receipts.db"), logger=logger)
+    db.build_tables()
+    ingestor = Ingestor(str(tmp_path), logger=logger)
+    ingestor.insert(db, ingestor.ingest())
+    report = ingestor.report.serialized()
+    assert report['inconsistent'] == {
+        'payment': [{'file': '170328-leevers', 'expected': 150,
+                     'actual': 100}],
+        'total': [{'file': '170328-leevers', 'expected': 100,
+                   'actual': 150}],
+    }
+
+    checker = ConsistencyChecker(db, logger=logger)
+    assert [v.rule for v in checker.check()] == ['total', 'payment']
+    assert checker.check(["170327-leevers.yaml"]) == []
+    db.conn.execute("UPDATE products SET price = 90;")
+    assert {v.filename for v in checker.check() if v.rule == 'subtotal'} == {
+        '170327-leevers', '170328-leevers'}
+    assert not ConsistencyChecker(db, tolerance=60, logger=logger).check(
+        ["170327-leevers"])
@@ -0,0 +1,42 @@
+"""Tests the integer cents money type"""
+
+import pytest
+
+from source.money import Money, money, total
+
+def test_from_dollars_is_exact():
+    assert money(0.29) == 29
+    assert money(73.59) == 7359
+    assert money("$1,234.5") == 123450
+    assert money(3) == 300
+    assert money(0.005) == 1
+
+def test_dollars_round_trip():
+    for dollars in (0.01, 0.29, 1.1, 73.59, 12345.67):
+        assert money(dollars).dollars == dollars
+
+def test_arithmetic_stays_money():
+    amount = money(0.1) + money(0.2)
+    assert isinstance(amount, Money)
+    assert amount == money(0.3)
+    assert isinstance(sum([money(1), money(2)]), Money)
+    assert money(10) - money(2.5) == money(7.5)
+    assert money(2.5) * 3 == money(7.5)
+    assert total([0.1, 0.2, 0.3]) == 60
+
+def test_plain_numbers_are_not_added():
+    with pytest.raises(TypeError):
+        money(10) - 250
+    with pytest.raises(TypeError):
+        250 + money(10)
+    assert money(10) + 0 == money(10)
+
+def test_format():
+    assert str(money(-4.05)) == "-$4.05"
+    assert f"{money(4.5):>6.2f}" == "  4.50"
+
+def test_invalid_amount():
+    with pytest.raises(ValueError):
+        money("four")
+    with pytest.raises(TypeError):
+        money(True)
@@ -0,0 +1,104 @@
+"""Tests the product price history index"""
+
+import datetime
+import logging
+
+from source.consistency import ConsistencyChecker
+from source.database import ReceiptConnection
+from source.prices import PriceHistory, PriceSeries, day_number
+from source.YamlObjects import Receipt
+
+logger = logging.getLogger('test_prices')
+
+def receipt(date, products):
+    total = sum(products.values())
+    return Receipt('Leevers', 'Leevers', date, 'grocery', products,
+                   total, 0.0, total, total)
+
+def test_series_stays_sorted():
+    series = PriceSeries()
+    for day, price in ((10, 300), (30, 350), (20, 250)):
+        series.add(day, price)
+    assert list(series.days) == [10, 20, 30]
+    assert list(series.prices) == [300, 250, 350]
+    assert series.minimum(15, 40) == 250
+    assert series.maximum(end=20) == 300
+    assert series.mean(10, 20) == 275
+    assert [m for _, m in series.rolling_mean(11)] == [300, 275, 300]
+
+def test_history_from_database_and_ingest(tmp_path):
+    db = ReceiptConnection(str(tmp_path / "receipts.db"), logger=logger)
+    db.build_tables()
+    db.insert_files({
+        "170327-leevers.yaml": receipt([2017, 3, 27], {'milk': 2.5}),
+        "190101-leevers.yaml": receipt([2019, 1, 1], {'milk': 3.1}),
+    })
+    history = PriceHistory.from_database(db)
+    history.add_receipts({
+        "180601-leevers.yaml": receipt([2018, 6, 1], {'milk': 2.75,
+                                                      'eggs': 1.99}),
+    })
+    milk = history['milk']
+    assert list(milk.prices) == [250, 275, 310]
+    assert milk.latest().date == datetime.date(2019, 1, 1)
+    assert milk.latest(end=day_number("2018-12-31")).price == 275
+
+    history.remove_files(["180601-leevers.yaml"])
+    assert list(milk.prices) == [250, 310]
+    assert 'eggs' not in history
+    assert [r[0] for r in db.select_price_history('milk')] == ['milk', 'milk']
+
+def test_product_detail_lines():
+    history = PriceHistory()
+    history.add('milk', [2017, 3, 27], 250)
+    history.add('milk', [2017, 4, 27], 300)
+    lines = history.detail('milk').lines()
+    assert lines[2].split()[:2] == ['latest', '3.00']
+    assert lines[-1] == ' #'
+
+def test_history_names_follow_the_catalog(tmp_path):
+    db = ReceiptConnection(str(tmp_path / "receipts.db"), logger=logger)
+    db.build_tables()
+    receipts = {
+        "170327-leevers.yaml": receipt([2017, 3, 27], {'Milk': 2.5}),
+        "170328-leevers.yaml": receipt([2017, 3, 28], {'milk ': 3.0}),
+    }
+    db.insert_files(receipts)
+    history = PriceHistory(db.catalog)
+    history.add_receipts(receipts)
+    assert history.products() == ['Milk']
+    assert PriceHistory.from_database(db).products() == ['Milk']
+    assert 'MILK' in history
+    assert history.detail('milk').product == 'Milk'
+
+def test_collided_products_are_stored(tmp_path):
+    db = ReceiptConnection(str(tmp_path / "receipts.db"), logger=logger)
+    db.build_tables()
+    db.insert_files({
+        "170327-leevers.yaml": receipt([2017, 3, 27],
+                                       {'Milk': 2.5, 'milk': 2.5}),
+        "170328-leevers.yaml": receipt([2017, 3, 28],
+                                       {'Milk': 2.5, 'milk': 3.0}),
+    })
+    assert db.committed == ["170327-leevers.yaml", "170328-leevers.yaml"]
+    assert db.select_products_by_filename(["170327-leevers"]) == {
+        "170327-leevers": [("Milk", 250), ("Milk", 250)]}
+    (_, receipt27), _ = db.select_receipts_for_export()
+    assert receipt27.products == {'Milk': 2.5, 'milk': 2.5}
+    assert ConsistencyChecker(db, logger=logger).check() == []
+
+def test_products_tables_without_names_are_migrated(tmp_path):
+    db = ReceiptConnection(str(tmp_path / "receipts.db"), logger=logger)
+    db.build_tables()
+    db.insert_files({"170327-leevers.yaml": receipt([2017, 3, 27],
+                                                    {'milk ': 2.5})})
+    db.conn.execute("ALTER TABLE products RENAME TO products_names;")
+    db.conn.execute("CREATE TABLE products (filename TEXT, "
+                    "product_id INTEGER, price INTEGER, "
+                    "UNIQUE(filename, product_id, price));")
+    db.conn.execute("INSERT INTO products "
+                    "SELECT filename, product_id, price FROM products_names;")
+    db.conn.execute("DROP TABLE products_names;")
+    db.build_catalog()
+    (_, stored), = db.select_receipts_for_export()
+    assert stored.products == {'milk': 2.5}
@@ -0,0 +1,57 @@
+"""Tests the key presses of the receipt browser"""
+
+import logging
+
+from source.applications.receipts import ReceiptApplication
+from source.database import ReceiptConnection
+from source.prices import ProductDetail
+from source.reports import SpendingReport
+from source.YamlObjects import Receipt
+
+logger = logging.getLogger('test_receipt_application')
+
+class Screen:
+    """Stands in for a curses screen of the given size"""
+    def __init__(self, height=40, width=120):
+        self.height = height
+        self.width = width
+
+    def getmaxyx(self):
+        return self.height, self.width
+
+    def subwin(self, height, width, y, x):
+        return Screen(height, width)
+
+def application(tmp_path):
+    db = ReceiptConnection(str(tmp_path / "receipts.db"), logger=logger)
+    db.build_tables()
+    db.insert_files({
+        "170327-leevers.yaml": Receipt(
+            'Leevers', 'Leevers', [2017, 3, 27], 'grocery',
+            {'Milk': 2.5, 'eggs': 1.5}, 4.0, 0.0, 4.0, 4.0),
+    })
+    app = ReceiptApplication(None, screen=Screen(), logger=logger)
+    app.database = db
+    app.build_application()
+    app.receipt_list.on_data_changed(app.receipt_list)
+    return app
+
+def test_product_key_opens_price_history(tmp_path):
+    app = application(tmp_path)
+    app.receipt_list.handle_key(ord('p'))
+    window = app.product_window
+    assert window in list(app.window.windows)
+    assert isinstance(window.dataobject, ProductDetail)
+    assert window.title == 'Milk'
+    assert '> Milk' in '\n'.join(app.detail.lines())
+
+    # the same window moves on to the next product
+    app.receipt_list.handle_key(ord('p'))
+    assert app.product_window is window
+    assert window.title == 'eggs'
+
+def test_reports_key_opens_report_window(tmp_path):
+    app = application(tmp_path)
+    app.receipt_list.handle_key(ord('R'))
+    assert isinstance(app.report_window.dataobject, SpendingReport)
+    assert app.report_window in list(app.window.windows)
@@ -0,0 +1,59 @@
+"""Tests the paged receipt list and its lazy product details"""
+
+import logging
+
+from source.database import ReceiptConnection
+from source.receiptlist import ReceiptDetail, ReceiptPages, ReceiptTotals
+from source.YamlObjects import Receipt
+
+logger = logging.getLogger('test_receiptlist')
+
+def database(tmp_path, count=25):
+    db = ReceiptConnection(str(tmp_path / "receipts.db"), logger=logger)
+    db.build_tables()
+    db.build_summaries()
+    db.insert_files({
+        f"1901{i:02d}-store{i % 3}.yaml": Receipt(
+            f"store{i % 3}", f"s{i % 3}", [2019, 1 + i % 2, 1 + i % 28],
+            'grocery', {f"item{i}": 1.0 + i, 'milk': 2.5},
+            3.5 + i, 0.0, 3.5 + i, 3.5 + i)
+            for i in range(count)
+    })
+    return db
+
+def test_pages_match_full_sort(tmp_path):
+    db = database(tmp_path)
+    rows = db.query("SELECT filename FROM receipts ORDER BY total DESC, "
+                    "filename DESC;")
+    pages = ReceiptPages(db, order="total", descending=True, page_size=4,
+                         cached=2)
+    assert len(pages) == 25
+    assert [r.filename for r in pages] == [f for (f,) in rows]
+    assert pages[-1].filename == rows[-1][0]
+    assert len(pages.pages) == 2
+
+    pages.next_order()
+    assert pages.order == "date" and not pages.pages
+    dates = [r.date for r in pages]
+    assert dates == sorted(dates, reverse=True)
+    assert len(pages.labels[0:3]) == 3
+
+def test_detail_prefetches_neighbours(tmp_path):
+    db = database(tmp_path)
+    pages = ReceiptPages(db, page_size=4)
+    detail = ReceiptDetail(db, pages, prefetch=2, cached=10)
+    detail.select(5)
+    assert len(detail.products) == 5
+    row = detail.row
+    assert dict(detail.products[row.filename])['milk'] == 250
+    assert "milk" in "\n".join(detail.lines())
+
+    detail.select(6)
+    assert len(detail.products) == 5
+    detail.select(20)
+    assert len(detail.products) == 10
+
+    totals = ReceiptTotals(db, pages, detail)
+    line, = totals.lines()
+    assert line.startswith("25 receipts")
+    assert detail.row.date[:7] in line
@@ -0,0 +1,85 @@
+"""Tests the vectorized spending report"""
+
+import logging
+
+from source.database import ReceiptConnection
+from source.reports import SpendingReport, moving_average
+from source.YamlObjects import Receipt
+
+logger = logging.getLogger('test_reports')
+
+def receipts():
+    return {
+        "170327-leevers.yaml": Receipt(
+            'Leevers', 'Leevers', [2017, 3, 27], 'grocery',
+            {'dollar item': 1.0, 'milk': 2.5}, 3.5, 0.0, 3.5, 3.5),
+        "170329-leevers.yaml": Receipt(
+            'Leevers', 'Leevers', [2017, 3, 29], 'grocery',
+            {'milk': 2.5}, 2.5, 0.0, 2.5, 2.5),
+        "170401-bekinternet.yaml": Receipt(
+            'Bek Internet', 'Bek', [2017, 4, 1], 'utility',
+            {'internet': 73.59}, 73.59, 0.0, 73.59, 73.59),
+    }
+
+def test_moving_average():
+    assert moving_average([2, 4, 6, 8], 2).tolist() == [2, 3, 5, 7]
+
+def test_report_from_database(tmp_path):
+    db = ReceiptConnection(str(tmp_path / "receipts.db"), logger=logger)
+    db.build_tables()
+    db.insert_files(receipts())
+    report = SpendingReport.from_database(db, window=7, top=2, logger=logger)
+
+    assert report.total == 7959
+    assert report.by_month() == [('2017-03', 600), ('2017-04', 7359)]
+    assert report.by_store() == [('Bek Internet', 7359), ('Leevers', 600)]
+    assert report.by_category() == [('utility', 7359), ('grocery', 600)]
+    assert report.top_products() == [('internet', 7359, 1), ('milk', 500, 2)]
+    assert report.moving_average()[2] == ('2017-03-29', 600 / 3)
+
+def test_report_from_rows_matches_database(tmp_path):
+    db = ReceiptConnection(str(tmp_path / "receipts.db"), logger=logger)
+    db.build_tables()
+    db.insert_files(receipts())
+    report = SpendingReport.from_rows(
+        db.conn.execute("SELECT store, category, date, total FROM receipts"),
+        db.conn.execute("SELECT c.name, p.price FROM products p "
+                        "JOIN product_catalog c ON c.id = p.product_id"),
+        logger=logger
+    )
+    database_report = SpendingReport.from_database(db, logger=logger)
+    assert report.lines() == database_report.lines()
+
+def test_empty_report():
+    report = SpendingReport.from_rows([], [], logger=logger)
+    assert report.total == 0
+    assert report.top_products() == []
+
+def test_summary_tables_follow_receipts(tmp_path):
+    db = ReceiptConnection(str(tmp_path / "receipts.db"), logger=logger)
+    db.build_tables()
+    db.insert_files(receipts())
+    assert list(db.select_summary("receipts_monthly")) == [
+        ('2017-03', 'Leevers', 'grocery', 2, 600),
+        ('2017-04', 'Bek Internet', 'utility', 1, 7359),
+    ]
+
+    db.delete_files(["170327-leevers.yaml"])
+    db.conn.execute("UPDATE receipts SET category='internet' "
+                    "WHERE filename='170401-bekinternet'")
+    assert [r[:4] for r in db.select_summary("receipts_daily")] == [
+        ('2017-03-29', 'Leevers', 'grocery', 1),
+        ('2017-04-01', 'Bek Internet', 'internet', 1),
+    ]
+    assert db.check_summaries() == {}
+
+def test_summary_rebuild_and_check(tmp_path):
+    db = ReceiptConnection(str(tmp_path / "receipts.db"), logger=logger)
+    db.build_tables()
+    db.insert_files(receipts())
+    db.conn.execute("DELETE FROM receipts_daily WHERE day='2017-04-01'")
+    assert db.check_summaries()["receipts_daily"] == [
+        ('missing', '2017-04-01', 'Bek Internet', 'utility', 1, 7359)
+    ]
+    db.rebuild_summaries()
+    assert db.check_summaries() == {}
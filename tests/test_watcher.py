@@ -0,0 +1,72 @@
+"""Tests folder snapshots and polling used by watch mode"""
+
+import os
+import logging
+
+from source.watcher import (FileState, FolderChanges, FolderWatcher,
+                            diff_snapshots, snapshot)
+
+logger = logging.getLogger('test_watcher')
+
+def write(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+
+def test_snapshot_skips_dot_files_and_other_extensions(tmp_path):
+    write(tmp_path / "170327-leevers.yaml", "a")
+    write(tmp_path / ".170327-leevers.yaml", "a")
+    write(tmp_path / "notes.txt", "a")
+    os.mkdir(tmp_path / "170401-folder.yaml")
+    assert list(snapshot(str(tmp_path))) == [
+        str(tmp_path / "170327-leevers.yaml")
+    ]
+
+def test_snapshot_is_recursive(tmp_path):
+    os.makedirs(tmp_path / "2017" / "sam")
+    os.mkdir(tmp_path / ".git")
+    write(tmp_path / "2017" / "sam" / "170327-leevers.yaml", "a")
+    write(tmp_path / ".git" / "170327-leevers.yaml", "a")
+    assert list(snapshot(str(tmp_path))) == [
+        str(tmp_path / "2017" / "sam" / "170327-leevers.yaml")
+    ]
+
+def test_diff_snapshots():
+    previous = {'a': FileState(1, 1), 'b': FileState(1, 1)}
+    current = {'b': FileState(2, 1), 'c': FileState(1, 1)}
+    assert diff_snapshots(previous, current) == FolderChanges(['c'], ['b'], ['a'])
+
+def test_diff_snapshots_unchanged():
+    states = {'a': FileState(1, 1)}
+    assert not any(diff_snapshots(states, dict(states)))
+
+def test_watcher_poll(tmp_path):
+    leevers = str(tmp_path / "170327-leevers.yaml")
+    bek = str(tmp_path / "170401-bekinternet.yaml")
+    watcher = FolderWatcher(str(tmp_path), logger=logger)
+    write(leevers, "a")
+    assert watcher.poll().added == [leevers]
+    assert not any(watcher.poll())
+
+    write(leevers, "ab")
+    write(bek, "a")
+    changes = watcher.poll()
+    assert changes.added == [bek]
+    assert changes.changed == [leevers]
+
+    os.remove(leevers)
+    assert watcher.poll().removed == [leevers]
+
+def test_watcher_many_folders(tmp_path):
+    os.mkdir(tmp_path / "a")
+    os.mkdir(tmp_path / "b")
+    write(tmp_path / "a" / "170327-leevers.yaml", "a")
+    write(tmp_path / "b" / "170401-bekinternet.yaml", "a")
+    watcher = FolderWatcher([str(tmp_path / "a"), str(tmp_path / "b")],
+                            logger=logger)
+    assert len(watcher.poll().added) == 2
+
+def test_watcher_not_due_after_poll(tmp_path):
+    watcher = FolderWatcher(str(tmp_path), interval=60, logger=logger)
+    assert watcher.due
+    watcher.poll()
+    assert not watcher.due